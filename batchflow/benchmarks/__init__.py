@@ -0,0 +1,7 @@
+"""
+Reproducible benchmarks of the flow engine, readers, consumers and storage.
+
+Run with ``python -m batchflow.benchmarks --output results.json [--baseline baseline.json]``
+"""
+from .runner import compare, run_benchmarks
+from .scenarios import SCENARIOS
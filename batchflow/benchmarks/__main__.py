@@ -0,0 +1,54 @@
+import argparse
+import sys
+
+from loguru import logger
+
+from .runner import compare, load, run_benchmarks, save
+from .scenarios import SCENARIOS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m batchflow.benchmarks", description="Run batchflow benchmarks"
+    )
+    parser.add_argument(
+        "-s",
+        "--scenario",
+        action="append",
+        choices=list(SCENARIOS),
+        help="scenario to run, can be repeated. Runs all by default",
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per scenario")
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="multiplier of items per scenario"
+    )
+    parser.add_argument("-o", "--output", help="write results json to this file")
+    parser.add_argument("-b", "--baseline", help="baseline results json to compare with")
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="allowed slowdown vs baseline before flagging a regression (fraction)",
+    )
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scenario, repeat=args.repeat, scale=args.scale)
+    if args.output:
+        save(results, args.output)
+        logger.info(f"Saved results to {args.output}")
+
+    if args.baseline:
+        regressions = compare(results, load(args.baseline), args.threshold)
+        if regressions:
+            for name, regression in regressions.items():
+                logger.error(
+                    f"Regression {name}: {regression['items_per_sec']:.1f} items/sec, "
+                    f"baseline {regression['baseline_items_per_sec']:.1f} ({regression['change']:+.1%})"
+                )
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import json
+import platform
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+import loguru
+import numpy as np
+
+from batchflow.decorators import set_time_logging, time_logging_enabled
+from batchflow.version import __version__
+
+from .scenarios import LOGGED_SCENARIOS, SCENARIOS
+
+logger = loguru.logger
+
+
+def _environment() -> Dict[str, Any]:
+    return {
+        "batchflow": __version__,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+    }
+
+
+def run_benchmarks(
+    scenarios: Optional[List[str]] = None, repeat: int = 3, scale: float = 1.0
+) -> Dict[str, Any]:
+    """
+    Runs the benchmark scenarios `repeat` times each. Logging is disabled during the runs,
+    except for the ``*_logged`` scenarios which keep the logging of the process.
+
+    Args:
+        scenarios (Optional[List[str]], optional): names of the scenarios to run, all by default.
+        repeat (int, optional): runs per scenario. Defaults to 3.
+        scale (float, optional): multiplies the number of items of every scenario. Defaults to 1.0.
+
+    Returns:
+        Dict[str, Any]: json serializable results, items/sec of every scenario (best and median of the runs)
+    """
+    names = scenarios or list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Unknown scenarios {sorted(unknown)}, one of {list(SCENARIOS)}")
+
+    time_logging = time_logging_enabled()
+    results = {}
+    try:
+        for name in names:
+            if name in LOGGED_SCENARIOS:
+                set_time_logging(time_logging)
+                loguru.logger.enable("batchflow")
+            else:
+                # keep logging out of the measurements
+                set_time_logging(False)
+                loguru.logger.disable("batchflow")
+            throughputs = []
+            for _ in range(repeat):
+                items, elapsed = SCENARIOS[name](scale)
+                throughputs.append(items / elapsed)
+            results[name] = {
+                "items": items,
+                "items_per_sec": max(throughputs),
+                "median_items_per_sec": statistics.median(throughputs),
+                "runs": throughputs,
+            }
+    finally:
+        loguru.logger.enable("batchflow")
+        set_time_logging(time_logging)
+
+    for name, result in results.items():
+        logger.info(f"{name}: {result['items_per_sec']:.1f} items/sec")
+
+    return {
+        "timestamp": time.time(),
+        "environment": _environment(),
+        "repeat": repeat,
+        "scale": scale,
+        "results": results,
+    }
+
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.1
+) -> Dict[str, Dict[str, float]]:
+    """
+    Compares best throughput of every scenario with the baseline results.
+
+    Returns:
+        Dict[str, Dict[str, float]]: regressed scenarios, those slower than baseline by more than `threshold` (fraction)
+    """
+    regressions = {}
+    for name, result in results["results"].items():
+        base = baseline.get("results", {}).get(name, None)
+        if base is None:
+            logger.warning(f"{name}: no baseline")
+            continue
+        change = result["items_per_sec"] / base["items_per_sec"] - 1
+        logger.info(f"{name}: {change:+.1%} vs baseline")
+        if change < -threshold:
+            regressions[name] = {
+                "items_per_sec": result["items_per_sec"],
+                "baseline_items_per_sec": base["items_per_sec"],
+                "change": change,
+            }
+    return regressions
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(results: Dict[str, Any], path: str):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
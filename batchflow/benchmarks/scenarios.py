@@ -0,0 +1,262 @@
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, Tuple
+
+import cv2
+import numpy as np
+
+from batchflow.consumers.file import FileAppenderConsumer
+from batchflow.consumers.storage import UploadConsumer
+from batchflow.core.flow import Flow
+from batchflow.core.node import ConsumerNode, ProcessorNode, ProducerNode
+from batchflow.producers.reader.image import ImageFolderReader
+from batchflow.storage.base import BaseStorage, StorageObject
+
+SEED = 0
+
+
+class SyntheticProducer(ProducerNode):
+    """Produces `n` small items without any I/O"""
+
+    def __init__(self, n: int, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.n = n
+
+    def open(self):
+        self._idx = 0
+
+    def next(self):
+        if self._idx >= self.n:
+            raise StopIteration()
+        self._idx += 1
+        return {"value": self._idx, "filename": f"{self._idx}.jpg"}
+
+    def next_batch(self):
+        if self._idx >= self.n:
+            raise StopIteration()
+        values = list(range(self._idx, min(self.n, self._idx + self.batch_size)))
+        self._idx += len(values)
+        return {
+            "value": values,
+            "filename": [f"{v}.jpg" for v in values],
+            "batch_size": len(values),
+        }
+
+
+class IdentityProcessor(ProcessorNode):
+    def process(self, inp):
+        return inp
+
+    def process_batch(self, inp):
+        return inp
+
+
+class CountingConsumer(ConsumerNode):
+    def open(self):
+        self.count = 0
+
+    def consume(self, item):
+        self.count += 1
+
+    def consume_batch(self, items):
+        self.count += items["batch_size"]
+
+
+class LocalStorage(BaseStorage):
+    """Stand-in storage backed by a local directory"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.bucket_name = root
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def download(self, output, key=None):
+        shutil.copyfile(self._path(key), output)
+        return output
+
+    def upload(self, key, file):
+        os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+        shutil.copyfile(file, self._path(key))
+        return self._path(key)
+
+    def upload_bytes(self, key, data):
+        if hasattr(data, "read"):
+            return self.upload_stream(key, data)
+        os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+        with open(self._path(key), "wb") as f:
+            f.write(data)
+        return self._path(key)
+
+    def upload_stream(self, key, stream):
+        os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+        with open(self._path(key), "wb") as f:
+            shutil.copyfileobj(stream, f)
+        return self._path(key)
+
+    def load(self, key):
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def _iter_pages(self, prefix, page_size, recursive):
+        page = []
+        for root, _, files in os.walk(self._path(prefix)):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                page.append(
+                    StorageObject(
+                        key=os.path.relpath(path, self.root),
+                        size=stat.st_size,
+                        etag=None,
+                        mtime=stat.st_mtime,
+                    )
+                )
+                if len(page) == page_size:
+                    yield page
+                    page = []
+            if not recursive:
+                break
+        if page:
+            yield page
+
+
+def make_image_folder(path: str, n: int, shape=(480, 640, 3)):
+    rng = np.random.default_rng(SEED)
+    os.makedirs(path, exist_ok=True)
+    for i in range(n):
+        image = rng.integers(0, 256, size=shape, dtype=np.uint8)
+        cv2.imwrite(os.path.join(path, f"{i:06d}.jpg"), image)
+
+
+def _run_flow(n: int, batch_size: int) -> Tuple[int, float]:
+    producer = SyntheticProducer(n)
+    processor = IdentityProcessor()(producer)
+    consumer = CountingConsumer()(processor)
+    flow = Flow([producer], [consumer], batch_size=batch_size)
+    flow.setup()
+    flow.open()
+    t = time.perf_counter()
+    flow.run(manual=True)
+    elapsed = time.perf_counter() - t
+    flow.close()
+    assert consumer.count == n, f"consumed {consumer.count} of {n} items"
+    return n, elapsed
+
+
+def flow_overhead_single(scale: float) -> Tuple[int, float]:
+    """Per item framework overhead of Flow.run with batch_size=1"""
+    return _run_flow(int(20000 * scale), 1)
+
+
+def flow_overhead_batched(scale: float) -> Tuple[int, float]:
+    """Per item framework overhead of Flow.run with batch_size=32"""
+    return _run_flow(int(100000 * scale), 32)
+
+
+def flow_overhead_single_logged(scale: float) -> Tuple[int, float]:
+    """flow_overhead_single with the logging configuration of the process (handlers and log_time)"""
+    return _run_flow(int(20000 * scale), 1)
+
+
+def flow_overhead_batched_logged(scale: float) -> Tuple[int, float]:
+    """flow_overhead_batched with the logging configuration of the process (handlers and log_time)"""
+    return _run_flow(int(100000 * scale), 32)
+
+
+def image_reader_decode(scale: float) -> Tuple[int, float]:
+    """ImageFolderReader JPEG decode throughput, batch_size=16"""
+    n = max(16, int(200 * scale))
+    with tempfile.TemporaryDirectory() as tmp:
+        make_image_folder(tmp, n)
+        reader = ImageFolderReader(tmp)
+        reader.batch_size = 16
+        reader.open()
+        count = 0
+        t = time.perf_counter()
+        try:
+            while True:
+                count += reader.next_batch()["batch_size"]
+        except StopIteration:
+            pass
+        elapsed = time.perf_counter() - t
+        reader.close()
+    return count, elapsed
+
+
+def file_appender_write(scale: float) -> Tuple[int, float]:
+    """FileAppenderConsumer CSV rows written per second"""
+    n = int(100000 * scale)
+    rng = np.random.default_rng(SEED)
+    rows = [
+        {"filename": f"{i}.jpg", "score": float(s), "label": int(s * 10)}
+        for i, s in enumerate(rng.random(n))
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        consumer = FileAppenderConsumer(os.path.join(tmp, "out.csv"))
+        consumer.open()
+        t = time.perf_counter()
+        for row in rows:
+            consumer.consume(row)
+        consumer.close()
+        elapsed = time.perf_counter() - t
+    return n, elapsed
+
+
+def storage_upload(scale: float) -> Tuple[int, float]:
+    """UploadConsumer uploads of 64KB objects to a local stand-in storage"""
+    n = int(2000 * scale)
+    payload = np.random.default_rng(SEED).bytes(64 * 1024)
+    with tempfile.TemporaryDirectory() as tmp:
+        consumer = UploadConsumer(
+            LocalStorage(tmp), data_key="data", name_key="filename", prefix="bench/"
+        )
+        consumer.open()
+        t = time.perf_counter()
+        for i in range(n):
+            consumer.consume({"data": payload, "filename": f"{i}.bin"})
+        consumer.close()
+        elapsed = time.perf_counter() - t
+        assert not consumer.failed_keys
+    return n, elapsed
+
+
+def storage_listing(scale: float) -> Tuple[int, float]:
+    """iter_files listing rate over a local stand-in storage"""
+    n = int(20000 * scale)
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(n):
+            sub = os.path.join(tmp, "event", f"{i % 16:02d}")
+            os.makedirs(sub, exist_ok=True)
+            open(os.path.join(sub, f"{i}.jpg"), "wb").close()
+        storage = LocalStorage(tmp)
+        t = time.perf_counter()
+        count = sum(
+            1
+            for _ in storage.iter_files(
+                "event/",
+                sub_prefixes=[f"{i:02d}" for i in range(16)],
+                workers=4,
+            )
+        )
+        elapsed = time.perf_counter() - t
+    assert count == n, f"listed {count} of {n} objects"
+    return count, elapsed
+
+
+SCENARIOS: Dict[str, Callable[[float], Tuple[int, float]]] = {
+    "flow_overhead_single": flow_overhead_single,
+    "flow_overhead_batched": flow_overhead_batched,
+    "flow_overhead_single_logged": flow_overhead_single_logged,
+    "flow_overhead_batched_logged": flow_overhead_batched_logged,
+    "image_reader_decode": image_reader_decode,
+    "file_appender_write": file_appender_write,
+    "storage_upload": storage_upload,
+    "storage_listing": storage_listing,
+}
+
+# scenarios measured with logging on, to catch the overhead of logging and timing
+LOGGED_SCENARIOS = {"flow_overhead_single_logged", "flow_overhead_batched_logged"}
@@ -13,3 +13,11 @@ DEVICE_TYPES = [GPU, CPU]
 BATCH = 0
 REALTIME = 1
 MODE = [BATCH, REALTIME]
+
+# max HTTP connections kept alive per storage api client
+MAX_POOL_CONNECTIONS = int(os.getenv("BATCHFLOW_MAX_POOL_CONNECTIONS", default=32))
+
+# order of the batches consumed when processors run in parallel
+ORDERED = "ordered"
+UNORDERED = "unordered"
+ORDERS = [ORDERED, UNORDERED]
@@ -0,0 +1,259 @@
+import json
+import os
+import struct
+from typing import Any, Dict, List, Tuple, Union
+
+import numpy as np
+
+from batchflow.core.node import ConsumerNode
+from batchflow.core.utils import batch_length
+
+# data of the .npy files starts after a header of this size, page aligned for memory maps
+HEADER_SIZE = 4096
+KEYS_FILE = "keys.jsonl"
+
+
+def _write_npy_header(f, dtype, shape, size: int = HEADER_SIZE):
+    """Writes a .npy (version 1.0) header of `shape` padded to `size` bytes at the start of `f`"""
+    header = repr(
+        {
+            "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+            "fortran_order": False,
+            "shape": tuple(shape),
+        }
+    ).encode("latin1")
+    prefix = np.lib.format.magic(1, 0)
+    padding = size - len(prefix) - 2 - len(header) - 1
+    if padding < 0:
+        raise ValueError(f"npy header of shape {shape} does not fit in {size} bytes")
+    f.seek(0)
+    f.write(prefix + struct.pack("<H", size - len(prefix) - 2) + header + b" " * padding + b"\n")
+
+
+def _read_npy_header(f) -> Tuple[Tuple[int, ...], np.dtype, int]:
+    """Returns (shape, dtype, data offset) of an .npy file"""
+    f.seek(0)
+    version = np.lib.format.read_magic(f)
+    if version != (1, 0):
+        raise ValueError(f"npy version {version} can not be appended to")
+    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    if fortran_order:
+        raise ValueError("fortran ordered npy can not be appended to")
+    return shape, dtype, f.tell()
+
+
+class _GrowableArray:
+    """Rows appended to an .npy file memory mapped in place, grown `chunk_rows` rows at a time"""
+
+    def __init__(self, path, dtype, row_shape, chunk_rows, append):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.count = 0
+        self.offset = HEADER_SIZE
+        if append and os.path.exists(path):
+            with open(path, "rb") as f:
+                shape, dtype, self.offset = _read_npy_header(f)
+            row_shape, self.count = tuple(shape[1:]), shape[0]
+            self._file = open(path, "r+b")
+        else:
+            self._file = open(path, "w+b")
+            _write_npy_header(self._file, dtype, (0,) + tuple(row_shape), self.offset)
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.row_bytes = self.dtype.itemsize * int(np.prod(self.row_shape, dtype=np.int64))
+        self.capacity = self.count
+        self._map = None
+
+    def _grow(self, rows):
+        capacity = self.capacity
+        while capacity < self.count + rows:
+            capacity += self.chunk_rows
+        if self._map is not None:
+            self._map.flush()
+            self._map = None
+        # preallocate (sparse on most filesystems), the map covers the new capacity
+        self._file.truncate(self.offset + capacity * self.row_bytes)
+        self._map = np.memmap(
+            self._file,
+            dtype=self.dtype,
+            mode="r+",
+            offset=self.offset,
+            shape=(capacity,) + self.row_shape,
+        )
+        self.capacity = capacity
+
+    def append(self, rows: np.ndarray):
+        n = len(rows)
+        if rows.shape[1:] != self.row_shape:
+            raise ValueError(
+                f"{self.path}: rows of shape {rows.shape[1:]}, expected {self.row_shape}"
+            )
+        if self._map is None or self.count + n > self.capacity:
+            self._grow(n)
+        self._map[self.count : self.count + n] = rows
+        self.count += n
+
+    def close(self):
+        if self._map is not None:
+            self._map.flush()
+            self._map = None
+        # drop the preallocated rows and write the final shape
+        self._file.truncate(self.offset + self.count * self.row_bytes)
+        _write_npy_header(self._file, self.dtype, (self.count,) + self.row_shape, self.offset)
+        self._file.close()
+
+
+def load_array_store(path: str, mmap: bool = True) -> Tuple[Dict[str, np.ndarray], List[str]]:
+    """
+    Loads an ArrayStoreConsumer output directory, returns the arrays by key (memory mapped
+    read-only with `mmap`) and the item keys (e.g. filenames) of the rows
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    arrays = {}
+    for key in meta["keys"]:
+        file = os.path.join(path, f"{key}.npy")
+        if not os.path.exists(file) and meta["count"] == 0:
+            # stores of a run without rows may lack the arrays
+            arrays[key] = np.empty(0, dtype=meta["dtypes"].get(key, np.float32))
+        else:
+            arrays[key] = np.load(file, mmap_mode="r" if mmap else None)
+    with open(os.path.join(path, KEYS_FILE)) as f:
+        keys = [json.loads(line) for line in f]
+    return arrays, keys
+
+
+class ArrayStoreConsumer(ConsumerNode):
+    def __init__(
+        self,
+        output: str,
+        keys: List[str],
+        id_key: str = "filename",
+        dtype: Union[str, np.dtype, Dict[str, Any]] = np.float32,
+        chunk_rows: int = 65536,
+        mode: str = "w",
+        **kwargs,
+    ):
+        """
+        Appends fixed shape numeric outputs (embeddings, scores) of the items as rows of .npy files,
+        one file per key in the `output` directory, memory mapped and preallocated `chunk_rows`
+        rows at a time. The item ids are written in ``keys.jsonl``, one per row.
+        Read the store back with ``load_array_store`` or ``ArrayStoreReader``.
+
+        Args:
+            output (str): output directory
+            keys (List[str]): keys of the arrays to store, every item should have them all
+            id_key (str, optional): key of the id of an item (row). Defaults to "filename".
+            dtype (optional): dtype of the arrays, or a dict of dtype by key. Defaults to np.float32.
+            chunk_rows (int, optional): rows preallocated at once. Defaults to 65536.
+            mode (str, optional): "w" to overwrite or "a" to append to an existing store. Defaults to "w".
+        """
+        super(ArrayStoreConsumer, self).__init__(**kwargs)
+        if mode not in ("w", "a"):
+            raise ValueError(f"mode {mode} should be w or a")
+        self.output = output
+        self.keys = list(keys)
+        self.id_key = id_key
+        self.dtype = dtype
+        self.chunk_rows = chunk_rows
+        self.mode = mode
+        self._arrays = None
+        self._keys_file = None
+
+    def _dtype(self, key):
+        if isinstance(self.dtype, dict):
+            return np.dtype(self.dtype.get(key, np.float32))
+        return np.dtype(self.dtype)
+
+    def open(self):
+        os.makedirs(self.output, exist_ok=True)
+        self._arrays = {}
+        self._keys_file = open(
+            os.path.join(self.output, KEYS_FILE), self.mode, buffering=1024 * 1024
+        )
+        for key in self.keys:
+            if not os.path.exists(self._path(key)):
+                continue
+            if self.mode == "a":
+                array = _GrowableArray(
+                    self._path(key), self._dtype(key), (), self.chunk_rows, append=True
+                )
+                if array.count:
+                    self._arrays[key] = array
+                    continue
+                array._file.close()
+            # a key without rows must not leave the array of a previous run,
+            # arrays are (re)created on their first rows
+            os.remove(self._path(key))
+        counts = {key: array.count for key, array in self._arrays.items()}
+        if self.mode == "a" and len(set(counts.values())) > 1:
+            raise ValueError(f"{self}: arrays of {self.output} are misaligned, rows {counts}")
+
+    def _path(self, key):
+        return os.path.join(self.output, f"{key}.npy")
+
+    @property
+    def count(self) -> int:
+        """rows stored so far"""
+        return min((a.count for a in (self._arrays or {}).values()), default=0)
+
+    def close(self):
+        if self._arrays is None:
+            return
+        for key in self.keys:
+            if key not in self._arrays:
+                # no rows: an empty array, its row shape is unknown
+                self._arrays[key] = _GrowableArray(
+                    self._path(key), self._dtype(key), (), self.chunk_rows, append=False
+                )
+        counts = {key: array.count for key, array in self._arrays.items()}
+        for array in self._arrays.values():
+            array.close()
+        self._keys_file.close()
+        with open(os.path.join(self.output, "meta.json"), "w") as f:
+            json.dump(
+                {
+                    "keys": self.keys,
+                    "count": self.count,
+                    "dtypes": {k: a.dtype.str for k, a in self._arrays.items()},
+                    "shapes": {k: list(a.row_shape) for k, a in self._arrays.items()},
+                },
+                f,
+            )
+        self._logger.info(f"{self}: stored {counts} rows in {self.output}")
+        self._arrays = None
+
+    def consume_batch(self, batch: Dict[str, Any]):
+        n = batch_length(batch)
+        if n == 0:
+            return
+        # every key is checked before writing any, a bad batch must not misalign the arrays
+        ids = list(batch[self.id_key])
+        if len(ids) != n:
+            raise ValueError(f"{self}: {len(ids)} {self.id_key} for {n} items")
+        rows = {}
+        for key in self.keys:
+            rows[key] = np.asarray(batch[key], dtype=self._dtype(key))
+            shape = rows[key].shape
+            if rows[key].ndim == 0 or shape[0] != n:
+                raise ValueError(f"{self}: {key} should have one row per item, got shape {shape}")
+            if key in self._arrays and shape[1:] != self._arrays[key].row_shape:
+                raise ValueError(
+                    f"{self}: {key} rows of shape {shape[1:]}, expected {self._arrays[key].row_shape}"
+                )
+        for key, values in rows.items():
+            if key not in self._arrays:
+                self._arrays[key] = _GrowableArray(
+                    self._path(key), values.dtype, values.shape[1:], self.chunk_rows, append=False
+                )
+            self._arrays[key].append(values)
+        self._keys_file.writelines(json.dumps(str(k)) + "\n" for k in ids)
+
+    def consume(self, item: Dict[str, Any]):
+        self.consume_batch(
+            {
+                **{key: [item[key]] for key in self.keys},
+                self.id_key: [item[self.id_key]],
+                "batch_size": 1,
+            }
+        )
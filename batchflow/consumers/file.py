@@ -1,9 +1,20 @@
 import csv
+import gzip
+import io
+import os
+import time
+from operator import itemgetter
+
+import numpy as np
 
 from batchflow.core.node import ConsumerNode
+from batchflow.core.utils import batch_length, split_batch, take_batch
 
 
 class FileAppenderConsumer(ConsumerNode):
+    # rows are appended (and indexed) in the order of the inputs
+    requires_order = True
+
     def __init__(
         self,
         output,
@@ -13,12 +24,40 @@ class FileAppenderConsumer(ConsumerNode):
         group_by=False,
         group_by_column_name=None,
         mode="w",
+        buffer_size=1024 * 1024,
+        flush_interval=None,
+        fsync=False,
+        compress=None,
+        compresslevel=6,
     ):
+        """
+        Appends the items (dicts, or lists of dicts with `key`) as rows of a csv file.
+        Every row should have the keys of the first row, TypeError otherwise.
+
+        Args:
+            output (str): csv file path
+            key (str, optional): key of the rows of an item. Defaults to None (the item is the row).
+            header (bool, optional): write the keys of the first row as header. Defaults to True.
+            index (bool, optional): prepend a running row index. Defaults to True.
+            group_by (bool, optional): prepend the index of the item the row comes from. Defaults to False.
+            group_by_column_name (str, optional): header of the group by column. Defaults to None.
+            mode (str, optional): "w" to overwrite or "a" to append. Defaults to "w".
+            buffer_size (int, optional): bytes buffered before writing to the file. Defaults to 1MB.
+            flush_interval (float, optional): flush the buffer at most every `flush_interval` seconds,
+                None to flush only when the buffer is full and at close. Defaults to None.
+            fsync (bool, optional): fsync the file on every flush and at close. Defaults to False.
+            compress (str, optional): "gzip" to write a gzip file, inferred from a .gz output. Defaults to None.
+            compresslevel (int, optional): gzip level, 1 (fastest) to 9 (smallest). Defaults to 6.
+        """
         self.output_file = output
         self._header = header
         self._first_item = True
         self._file = None
+        self._raw = None
+        self._gzip = None
         self._writer = None
+        self._row = None
+        self._columns = None
         self.key = key
         self.index = index
         self.group_by = group_by
@@ -27,50 +66,170 @@ class FileAppenderConsumer(ConsumerNode):
         if self.group_by:
             self._group_by_counter = 1
         self._mode = mode
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        if compress is None and str(output).endswith(".gz"):
+            compress = "gzip"
+        if compress not in (None, "gzip"):
+            raise ValueError(f"compress {compress} should be gzip or None")
+        self.compress = compress
+        self.compresslevel = compresslevel
+        self._last_flush = None
 
         self.group_by_column_name = group_by_column_name
         super(FileAppenderConsumer, self).__init__()
 
     def open(self):
-        self._file = open(self.output_file, self._mode)
+        if self.compress == "gzip":
+            self._raw = open(self.output_file, self._mode + "b")
+            self._gzip = gzip.GzipFile(
+                fileobj=self._raw,
+                mode=self._mode + "b",
+                compresslevel=self.compresslevel,
+            )
+            stream = io.BufferedWriter(self._gzip, self.buffer_size)
+            self._file = io.TextIOWrapper(stream, newline="")
+        else:
+            self._file = open(
+                self.output_file, self._mode, buffering=self.buffer_size, newline=""
+            )
+            self._raw = self._file
         self._writer = csv.writer(self._file)
+        self._last_flush = time.monotonic()
 
     def close(self):
+        if self._file is None:
+            return
         self._file.close()
+        if self._raw is not self._file:
+            # gzip writes its trailer on close, then the file is synced
+            if self.fsync:
+                self._raw.flush()
+                os.fsync(self._raw.fileno())
+            self._raw.close()
+        elif self.fsync:
+            with open(self.output_file, "rb") as f:
+                os.fsync(f.fileno())
+        self._file = self._raw = self._gzip = None
 
-    def consume(self, item):
-        # item should be serializable, otherwise error.
+    def flush(self):
+        self._file.flush()
+        if self._gzip is not None:
+            # data compressed so far, it is buffered by zlib otherwise
+            self._gzip.flush()
+        if self._raw is not self._file:
+            self._raw.flush()
+        if self.fsync:
+            os.fsync(self._raw.fileno())
+        self._last_flush = time.monotonic()
+
+    def _maybe_flush(self):
+        if (
+            self.flush_interval is not None
+            and time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def _write_header(self, first_row):
+        row = []
+        if self.index:
+            row.append("index")
+        if self.group_by:
+            row.append(self.group_by_column_name)
+        row.extend(list(first_row.keys()))
+        self._writer.writerow(row)
+        self._first_item = False
+
+    def _rows(self, item):
+        """Returns the csv rows of an item"""
         if self.key is not None:
             item = item[self.key]
-        try:
-            if not isinstance(item, list):
-                item = [item]
-
+        if not isinstance(item, list):
+            item = [item]
+        if not item:
             if self._header and self._first_item:
-                row = []
-                try:
-                    if self.index:
-                        row.append("index")
-                    if self.group_by:
-                        row.append(self.group_by_column_name)
-
-                    row.extend(list(item[0].keys()))
-                    self._writer.writerow(row)
-                    self._first_item = False
-                except IndexError:
-                    print("data is None will try to take header in next iteration")
-
-            for i in item:
-                row = []
-                if self.index:
-                    row.append(self._index_counter)
-                    self._index_counter += 1
-                if self.group_by:
-                    row.append(self._group_by_counter)
-                row.extend(list(i.values()))
-                self._writer.writerow(row)
-
+                self._logger.warning(
+                    f"{self}: no rows to take the header from, will try with the next item"
+                )
             if self.group_by:
                 self._group_by_counter += 1
-        except TypeError:
-            print("Type Error")
+            return []
+        if self._row is None:
+            # values are taken in the order of the keys of the first row
+            self._set_columns(item[0].keys())
+        if self._header and self._first_item:
+            self._write_header(item[0])
+
+        try:
+            values = [self._row(i) for i in item]
+            if any(len(i) != len(self._columns) for i in item):
+                raise KeyError("extra keys")
+        except (TypeError, KeyError) as e:
+            raise TypeError(
+                f"{self}: rows should be dicts with the keys of the first row, got {item!r}"
+            ) from e
+
+        prefix = []
+        if self.group_by:
+            prefix.append(self._group_by_counter)
+            self._group_by_counter += 1
+        if self.index:
+            start = self._index_counter
+            self._index_counter += len(values)
+            return [
+                [start + n, *prefix, *value] for n, value in enumerate(values)
+            ]
+        return [[*prefix, *value] for value in values]
+
+    def consume(self, item):
+        # item should be serializable, otherwise error.
+        self._writer.writerows(self._rows(item))
+        self._maybe_flush()
+
+    def _set_columns(self, keys):
+        keys = list(keys)
+        getter = itemgetter(*keys)
+        self._row = (lambda i: [getter(i)]) if len(keys) == 1 else getter
+        self._columns = keys
+
+    def _batch_rows(self, batch):
+        """Rows of a batch of one row per item, built column wise"""
+        n = batch_length(batch)
+        if n == 0:
+            return []
+        if self._row is None:
+            self._set_columns(split_batch(take_batch(batch, [0]))[0].keys())
+        if self._header and self._first_item:
+            self._write_header(dict.fromkeys(self._columns))
+        try:
+            columns = [batch[k] for k in self._columns]
+        except KeyError as e:
+            raise TypeError(f"{self}: batch is missing column {e}") from e
+        extra = [
+            k
+            for k, v in batch.items()
+            if k not in self._columns
+            and isinstance(v, (list, tuple, np.ndarray))
+            and len(v) == n
+        ]
+        if extra:
+            raise TypeError(f"{self}: batch has columns {extra} not in the header")
+        prefix = []
+        if self.index:
+            prefix.append(range(self._index_counter, self._index_counter + n))
+            self._index_counter += n
+        if self.group_by:
+            prefix.append(range(self._group_by_counter, self._group_by_counter + n))
+            self._group_by_counter += n
+        return zip(*prefix, *columns)
+
+    def consume_batch(self, batch):
+        if self.key is None:
+            self._writer.writerows(self._batch_rows(batch))
+        else:
+            rows = []
+            for value in batch[self.key]:
+                rows.extend(self._rows({self.key: value}))
+            self._writer.writerows(rows)
+        self._maybe_flush()
@@ -0,0 +1,367 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from batchflow.core.node import ConsumerNode
+
+COSINE = "cosine"
+L2 = "l2"
+METRICS = [COSINE, L2]
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    np.maximum(norms, 1e-12, out=norms)
+    return x / norms
+
+
+def _merge_top_k(best_scores, best_idx, scores, idx, k):
+    """Merges candidate (scores, idx) of shape (nq, m) into the running top k (higher is better)"""
+    scores = np.concatenate([best_scores, scores], axis=1)
+    idx = np.concatenate([best_idx, idx], axis=1)
+    if scores.shape[1] > k:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, top, axis=1)
+        idx = np.take_along_axis(idx, top, axis=1)
+    return scores, idx
+
+
+def kmeans(x: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Returns `k` centroids of the rows of `x` (Lloyd's algorithm, vectorized)"""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        # squared l2 distance up to the ||x||^2 constant
+        assign = np.argmax(x @ centroids.T - 0.5 * (centroids**2).sum(1), axis=1)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+def _ids_array(ids) -> np.ndarray:
+    """Ids as a numeric or str array (saved without pickle), mixed types become str"""
+    ids = np.asarray(list(ids))
+    if ids.dtype.kind not in "biufU":
+        ids = ids.astype(str)
+    return ids
+
+
+def _object_array(ids) -> np.ndarray:
+    """Ids in an object array of python values"""
+    out = np.empty(len(ids), dtype=object)
+    out[:] = np.asarray(ids).tolist() if isinstance(ids, np.ndarray) else list(ids)
+    return out
+
+
+class EmbeddingIndex:
+    """
+    Embeddings in one contiguous float32 matrix with an id per row, searched with
+    chunked matrix multiplications.
+
+    With ``build_ivf(nlist)`` the rows are clustered in `nlist` lists (IVF) and a search
+    only scans the `nprobe` lists closest to the query, rows added afterwards are kept
+    in an unclustered tail scanned by every search until the next ``build_ivf``.
+
+    - Arguments:
+        - dim: embedding size
+        - metric: ``cosine`` (embeddings are normalized on add) or ``l2``
+    """
+
+    def __init__(self, dim: int, metric: str = COSINE, capacity: int = 1024):
+        if metric not in METRICS:
+            raise ValueError(f"metric {metric} should be one of {METRICS}")
+        self.dim = dim
+        self.metric = metric
+        self._vectors = np.empty((capacity, dim), dtype=np.float32)
+        self._ids = np.empty(capacity, dtype=object)
+        self._count = 0
+        # ivf: centroids and row offsets of the lists, rows >= offsets[-1] are the tail
+        self.centroids = None
+        self.list_offsets = None
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[: self._count]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[: self._count]
+
+    def _reserve(self, n):
+        capacity = len(self._vectors)
+        if self._count + n <= capacity:
+            return
+        capacity = max(capacity * 2, self._count + n)
+        vectors = np.empty((capacity, self.dim), dtype=np.float32)
+        vectors[: self._count] = self.vectors
+        ids = np.empty(capacity, dtype=object)
+        ids[: self._count] = self.ids
+        self._vectors, self._ids = vectors, ids
+
+    def add(self, ids, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        if len(ids) != len(embeddings):
+            raise ValueError(f"{len(ids)} ids for {len(embeddings)} embeddings")
+        if self.metric == COSINE:
+            embeddings = _normalize(embeddings)
+        self._reserve(len(embeddings))
+        self._vectors[self._count : self._count + len(embeddings)] = embeddings
+        self._ids[self._count : self._count + len(embeddings)] = list(ids)
+        self._count += len(embeddings)
+
+    def build_ivf(self, nlist: int, iterations: int = 10, sample: int = 256):
+        """Clusters the rows in `nlist` lists, trained on at most `sample` rows per list"""
+        vectors = self.vectors
+        if len(vectors) < nlist:
+            raise ValueError(f"{len(vectors)} rows can not be clustered in {nlist} lists")
+        rng = np.random.default_rng(0)
+        train = vectors
+        if len(vectors) > sample * nlist:
+            train = vectors[rng.choice(len(vectors), size=sample * nlist, replace=False)]
+        centroids = kmeans(train, nlist, iterations)
+        assign = self._assign(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        # reordered into new arrays, the vectors may be a read-only memory map
+        self._vectors = vectors[order]
+        self._ids = self.ids[order]
+        self.centroids = centroids
+        self.list_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assign, minlength=nlist))]
+        )
+
+    def _assign(self, vectors, centroids, chunk_size=65536):
+        return np.concatenate(
+            [
+                np.argmax(
+                    vectors[i : i + chunk_size] @ centroids.T
+                    - 0.5 * (centroids**2).sum(1),
+                    axis=1,
+                )
+                for i in range(0, len(vectors), chunk_size)
+            ]
+        )
+
+    def _scores(self, queries, rows):
+        """similarity of queries to rows, higher is better (negated squared l2 for l2)"""
+        scores = queries @ rows.T
+        if self.metric == L2:
+            scores *= 2
+            scores -= (rows**2).sum(1)
+            scores -= (queries**2).sum(1, keepdims=True)
+        return scores
+
+    def _scan(self, queries, start, stop, best, k, chunk_size):
+        best_scores, best_idx = best
+        for i in range(start, stop, chunk_size):
+            j = min(i + chunk_size, stop)
+            scores = self._scores(queries, self._vectors[i:j])
+            idx = np.broadcast_to(np.arange(i, j), scores.shape)
+            best_scores, best_idx = _merge_top_k(best_scores, best_idx, scores, idx, k)
+        return best_scores, best_idx
+
+    def search(
+        self, queries, k: int = 10, nprobe: int = 8, chunk_size: int = 65536
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (ids, scores) of shape (num queries, k) of the `k` nearest rows of every query,
+        best first. Scores are cosine similarities, or l2 distances for the l2 metric.
+        Missing results (less than k rows) have id None.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        if self.metric == COSINE:
+            queries = _normalize(queries)
+        nq = len(queries)
+        best = (
+            np.full((nq, 0), -np.inf, dtype=np.float32),
+            np.zeros((nq, 0), dtype=np.int64),
+        )
+
+        if self.centroids is None:
+            best = self._scan(queries, 0, self._count, best, k, chunk_size)
+        else:
+            nprobe = min(nprobe, len(self.centroids))
+            closest = np.argpartition(
+                -self._scores(queries, self.centroids), nprobe - 1, axis=1
+            )[:, :nprobe]
+            # scan every probed list once for all the queries probing it
+            for lst in np.unique(closest):
+                qs = np.nonzero((closest == lst).any(axis=1))[0]
+                start, stop = self.list_offsets[lst], self.list_offsets[lst + 1]
+                sub = (best[0][qs], best[1][qs])
+                sub = self._scan(queries[qs], start, stop, sub, k, chunk_size)
+                best = self._pad(best, sub[0].shape[1])
+                best[0][qs], best[1][qs] = self._pad(sub, best[0].shape[1])
+            best = self._scan(queries, self.list_offsets[-1], self._count, best, k, chunk_size)
+
+        scores, idx = self._pad(best, k)
+        order = np.argsort(-scores, axis=1, kind="stable")
+        scores = np.take_along_axis(scores, order, axis=1)
+        idx = np.take_along_axis(idx, order, axis=1)
+        ids = np.where(np.isfinite(scores), self._ids[idx], None)
+        if self.metric == L2:
+            scores = np.sqrt(np.maximum(-scores, 0))
+        return ids, scores
+
+    @staticmethod
+    def _pad(best, width):
+        scores, idx = best
+        missing = width - scores.shape[1]
+        if missing <= 0:
+            return scores, idx
+        return (
+            np.pad(scores, ((0, 0), (0, missing)), constant_values=-np.inf),
+            np.pad(idx, ((0, 0), (0, missing))),
+        )
+
+    @classmethod
+    def from_arrays(cls, vectors: np.ndarray, ids, metric: str = COSINE) -> "EmbeddingIndex":
+        """Wraps (e.g. memory mapped) `vectors` without copy, cosine vectors should be normalized"""
+        index = cls(vectors.shape[1], metric, capacity=1)
+        index._vectors = vectors
+        index._ids = _object_array(ids)
+        index._count = len(vectors)
+        return index
+
+    def save(self, path: str):
+        """
+        Saves the index in directory `path` as .npy files, ``load`` memory maps them.
+        Ids are saved as numbers if they all are, otherwise as strings.
+        """
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), self.vectors)
+        np.save(os.path.join(path, "ids.npy"), _ids_array(self.ids))
+        meta = {"dim": self.dim, "metric": self.metric, "count": self._count}
+        if self.centroids is not None:
+            np.save(os.path.join(path, "centroids.npy"), self.centroids)
+            np.save(os.path.join(path, "list_offsets.npy"), self.list_offsets)
+            meta["nlist"] = len(self.centroids)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "EmbeddingIndex":
+        """
+        Loads an index saved by ``save``, with `mmap` the vectors are memory mapped read-only
+        (pages are read on demand), adding rows or ``build_ivf`` copies them to memory.
+        """
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        mmap_mode = "r" if mmap else None
+        index = cls(meta["dim"], meta["metric"], capacity=1)
+        index._vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mmap_mode)
+        index._ids = _object_array(np.load(os.path.join(path, "ids.npy")))
+        index._count = meta["count"]
+        if "nlist" in meta:
+            index.centroids = np.load(os.path.join(path, "centroids.npy"))
+            index.list_offsets = np.load(os.path.join(path, "list_offsets.npy"))
+        return index
+
+
+class EmbeddingIndexConsumer(ConsumerNode):
+    def __init__(
+        self,
+        dim: int,
+        embedding_key: str = "embedding",
+        id_key: str = "filename",
+        metric: str = COSINE,
+        output: Optional[str] = None,
+        nlist: int = 0,
+        sync=None,
+        sync_every: int = 0,
+        **kwargs,
+    ):
+        """
+        Appends the embeddings of the items to an EmbeddingIndex, searchable while the flow runs.
+
+        Args:
+            dim (int): embedding size
+            embedding_key (str, optional): key of the embedding (or list of embeddings) of an item. Defaults to "embedding".
+            id_key (str, optional): key of the id of an item. Defaults to "filename".
+            metric (str, optional): cosine or l2. Defaults to "cosine".
+            output (Optional[str], optional): directory the index is saved to at close. Defaults to None.
+            nlist (int, optional): if > 0 the index is clustered in `nlist` IVF lists at close. Defaults to 0.
+            sync (Optional[IndexSync], optional): uploads the new rows as delta segments at close. Defaults to None.
+            sync_every (int, optional): also upload the new rows every `sync_every` batches, 0 only at close. Defaults to 0.
+        """
+        super(EmbeddingIndexConsumer, self).__init__(**kwargs)
+        self.dim = dim
+        self.embedding_key = embedding_key
+        self.id_key = id_key
+        self.metric = metric
+        self.output = output
+        self.nlist = nlist
+        self.sync = sync
+        self.sync_every = sync_every
+        self.index = None
+        self._synced = 0
+        self._batches = 0
+        # searches run in other threads while the flow adds rows (and reallocates the arrays)
+        self._lock = threading.Lock()
+
+    def open(self):
+        self.index = EmbeddingIndex(self.dim, self.metric)
+        self._synced = 0
+        self._batches = 0
+
+    def _sync(self):
+        """Uploads the rows added since the last sync as a delta segment"""
+        if self.sync is None or self._synced == len(self.index):
+            return
+        self.sync.append(
+            self.index.ids[self._synced :], self.index.vectors[self._synced :]
+        )
+        self._synced = len(self.index)
+
+    def close(self):
+        # rows are uploaded before build_ivf reorders them
+        self._sync()
+        if self.sync is not None:
+            self.sync.wait()
+        if self.nlist and len(self.index) >= self.nlist:
+            with self._lock:
+                self.index.build_ivf(self.nlist)
+        if self.output is not None:
+            self.index.save(self.output)
+            self._logger.info(f"{self}: saved {len(self.index)} embeddings to {self.output}")
+
+    def _add(self, ids: List[Any], embeddings: List[Any]):
+        # an item may have several embeddings (e.g. faces of a photo), all get its id
+        rows_ids, rows = [], []
+        for id, embedding in zip(ids, embeddings):
+            embedding = np.asarray(embedding, dtype=np.float32).reshape(-1, self.dim)
+            rows_ids.extend([id] * len(embedding))
+            rows.append(embedding)
+        if rows:
+            self._add_rows(rows_ids, np.concatenate(rows))
+
+    def _add_rows(self, ids, embeddings):
+        with self._lock:
+            self.index.add(ids, embeddings)
+
+    def consume(self, item: Dict[str, Any]):
+        self._add([item[self.id_key]], [item[self.embedding_key]])
+
+    def consume_batch(self, batch: Dict[str, Any]):
+        embeddings = batch[self.embedding_key]
+        if isinstance(embeddings, np.ndarray) and embeddings.ndim == 2:
+            # one embedding per item, already stacked
+            self._add_rows(list(batch[self.id_key]), embeddings)
+        else:
+            self._add(batch[self.id_key], embeddings)
+        self._batches += 1
+        if self.sync_every and self._batches % self.sync_every == 0:
+            self._sync()
+
+    def search(self, queries, k: int = 10, nprobe: int = 8):
+        """Searches the rows added so far, safe to call from other threads while the flow runs"""
+        with self._lock:
+            return self.index.search(queries, k=k, nprobe=nprobe)
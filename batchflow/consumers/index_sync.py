@@ -0,0 +1,271 @@
+import json
+import os
+import tempfile
+import threading
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import loguru
+import numpy as np
+
+from batchflow.consumers.index import COSINE, L2, EmbeddingIndex, _ids_array
+from batchflow.errors import StorageFileNotFound
+from batchflow.storage.base import BaseStorage
+
+logger = loguru.logger
+
+MANIFEST = "manifest.json"
+
+
+class IndexSync:
+    """
+    Keeps an embedding index in object storage as append-only segments listed by a small
+    manifest, e.g. under ``BackBlazeStorage.create_index_bucket_path(admin_user_id, event_name)``.
+
+    ``append`` writes the new rows as a delta segment, uploads it and then the manifest, so
+    an update uploads the new data only. Once `compact_every` deltas pile up they are merged
+    with the base segment into a new base in a background thread. Segments are two .npy files
+    (vectors, ids), ``reader`` loads them lazily and memory mapped from the local cache.
+
+    Segments dropped from the manifest by a compaction are left in storage (remove them
+    with a lifecycle rule), readers holding an old manifest can still load them.
+
+    - Arguments:
+        - storage: storage backend, authenticated
+        - prefix: key prefix of the index
+        - dim, metric: of the embeddings, see EmbeddingIndex
+        - cache_dir: local directory caching the segments, a temporary directory by default
+        - compact_every: deltas triggering a compaction, 0 to never compact
+        - background: compact in a background thread
+    """
+
+    def __init__(
+        self,
+        storage: BaseStorage,
+        prefix: str,
+        dim: int,
+        metric: str = COSINE,
+        cache_dir: Optional[str] = None,
+        compact_every: int = 16,
+        background: bool = True,
+    ):
+        self.storage = storage
+        self.prefix = prefix.rstrip("/")
+        self.dim = dim
+        self.metric = metric
+        self.cache_dir = cache_dir or tempfile.mkdtemp(prefix="batchflow-index-")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.compact_every = compact_every
+        self.background = background
+        self.manifest = None
+        self._lock = threading.Lock()
+        self._compaction = None
+        # error of the background compaction, raised by wait()
+        self._compaction_error = None
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}/{name}"
+
+    def _cache_path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    @staticmethod
+    def _files(segment: str) -> List[str]:
+        return [f"{segment}.vectors.npy", f"{segment}.ids.npy"]
+
+    def load_manifest(self) -> Dict:
+        """Downloads the manifest of the writer, a new empty one if the index does not exist yet"""
+        manifest = self.fetch_manifest()
+        with self._lock:
+            self.manifest = manifest
+        return manifest
+
+    def fetch_manifest(self) -> Dict:
+        """Downloads the manifest (a new empty one if the index does not exist yet) without using it"""
+        path = self._cache_path(f"{MANIFEST}.{uuid.uuid4().hex}")
+        try:
+            self.storage.download(path, key=self._key(MANIFEST))
+            with open(path) as f:
+                manifest = json.load(f)
+        except (StorageFileNotFound, FileNotFoundError):
+            manifest = None
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        if manifest is None:
+            manifest = {
+                "version": 0,
+                "dim": self.dim,
+                "metric": self.metric,
+                "base": None,
+                "deltas": [],
+            }
+        elif manifest["dim"] != self.dim or manifest["metric"] != self.metric:
+            raise ValueError(
+                f"index at {self.prefix} is {manifest['dim']}d {manifest['metric']}, "
+                f"not {self.dim}d {self.metric}"
+            )
+        return manifest
+
+    def _upload_manifest(self):
+        self.manifest["version"] += 1
+        self.storage.upload_bytes(
+            self._key(MANIFEST), json.dumps(self.manifest).encode("utf-8")
+        )
+
+    def _write_segment(self, vectors: np.ndarray, ids) -> Dict:
+        name = f"segment-{uuid.uuid4().hex}"
+        vectors_file, ids_file = self._files(name)
+        np.save(self._cache_path(vectors_file), np.ascontiguousarray(vectors, dtype=np.float32))
+        np.save(self._cache_path(ids_file), _ids_array(ids))
+        for file in (vectors_file, ids_file):
+            self.storage.upload(self._key(file), self._cache_path(file))
+        return {"name": name, "count": len(vectors)}
+
+    def _load_segment(self, segment: Dict) -> Tuple[np.ndarray, np.ndarray]:
+        paths = []
+        for file in self._files(segment["name"]):
+            path = self._cache_path(file)
+            if not os.path.exists(path):
+                part = f"{path}.{uuid.uuid4().hex}.part"
+                self.storage.download(part, key=self._key(file))
+                os.replace(part, path)
+            paths.append(path)
+        return np.load(paths[0], mmap_mode="r"), np.load(paths[1])
+
+    def append(self, ids, vectors: np.ndarray) -> Dict:
+        """
+        Uploads `vectors` (as stored by EmbeddingIndex, i.e. normalized for cosine) and their
+        ids as a delta segment, then the manifest. Returns the segment.
+        """
+        if len(ids) == 0:
+            return None
+        if self.manifest is None:
+            self.load_manifest()
+        segment = self._write_segment(vectors, ids)
+        with self._lock:
+            self.manifest["deltas"].append(segment)
+            self._upload_manifest()
+            deltas = len(self.manifest["deltas"])
+        logger.info(
+            f"Uploaded delta {segment['name']} of {segment['count']} rows to {self.prefix}"
+        )
+        if self.compact_every and deltas >= self.compact_every:
+            self.compact(wait=not self.background)
+        return segment
+
+    def compact(self, wait: bool = True):
+        """Merges the base and the current deltas into a new base segment"""
+        if self._compaction is None or not self._compaction.is_alive():
+            self._compaction = threading.Thread(
+                target=self._run_compaction, name="index-compaction", daemon=True
+            )
+            self._compaction.start()
+        if wait:
+            self.wait()
+
+    def _run_compaction(self):
+        try:
+            compacted = self._compact()
+            # deltas appended while compacting may have reached the threshold again
+            while compacted and self.compact_every and self._deltas() >= self.compact_every:
+                compacted = self._compact()
+        except Exception as e:
+            logger.error(f"Compaction of {self.prefix} failed: {e!r}")
+            self._compaction_error = e
+
+    def _compact(self):
+        with self._lock:
+            base = self.manifest["base"]
+            deltas = list(self.manifest["deltas"])
+        segments = ([base] if base else []) + deltas
+        if len(segments) < 2:
+            return False
+        arrays = [self._load_segment(segment) for segment in segments]
+        merged = self._write_segment(
+            np.concatenate([vectors for vectors, _ in arrays]),
+            np.concatenate([ids for _, ids in arrays]),
+        )
+        with self._lock:
+            # deltas appended while compacting stay deltas
+            self.manifest["base"] = merged
+            self.manifest["deltas"] = self.manifest["deltas"][len(deltas) :]
+            self._upload_manifest()
+        for segment in segments:
+            for file in self._files(segment["name"]):
+                path = self._cache_path(file)
+                if os.path.exists(path):
+                    os.remove(path)
+        logger.info(
+            f"Compacted {len(segments)} segments of {self.prefix} into {merged['count']} rows"
+        )
+        return True
+
+    def _deltas(self) -> int:
+        with self._lock:
+            return len(self.manifest["deltas"])
+
+    def wait(self):
+        """Waits for the background compaction, if any, and raises its error"""
+        if self._compaction is not None:
+            self._compaction.join()
+        error, self._compaction_error = self._compaction_error, None
+        if error is not None:
+            raise error
+
+    def reader(self) -> "SegmentedIndex":
+        return SegmentedIndex(self)
+
+
+class SegmentedIndex:
+    """
+    Read side of an IndexSync: searches the base and delta segments of the manifest,
+    downloading (once, to the cache) and memory mapping a segment on its first search.
+    ``refresh`` picks up the segments added since, unchanged segments are not reloaded.
+    """
+
+    def __init__(self, sync: IndexSync):
+        self.sync = sync
+        self._segments = {}  # name -> EmbeddingIndex
+        self._names = []
+        self.refresh()
+
+    def refresh(self):
+        # own copy, the manifest of the writer is only changed under its lock
+        manifest = self.sync.fetch_manifest()
+        segments = ([manifest["base"]] if manifest["base"] else []) + manifest["deltas"]
+        self._names = [segment["name"] for segment in segments]
+        self._counts = {segment["name"]: segment["count"] for segment in segments}
+        # drop the segments merged by a compaction
+        self._segments = {
+            name: index for name, index in self._segments.items() if name in self._counts
+        }
+
+    def __len__(self):
+        return sum(self._counts.values())
+
+    def _index(self, name) -> EmbeddingIndex:
+        if name not in self._segments:
+            vectors, ids = self.sync._load_segment({"name": name})
+            self._segments[name] = EmbeddingIndex.from_arrays(vectors, ids, self.sync.metric)
+        return self._segments[name]
+
+    def search(self, queries, k: int = 10, chunk_size: int = 65536):
+        """Returns (ids, scores) of the `k` nearest rows over all the segments, see EmbeddingIndex.search"""
+        results = [
+            self._index(name).search(queries, k=k, chunk_size=chunk_size)
+            for name in self._names
+        ]
+        if not results:
+            nq = len(np.asarray(queries).reshape(-1, self.sync.dim))
+            return np.full((nq, k), None, dtype=object), np.full((nq, k), np.nan)
+        ids = np.concatenate([r[0] for r in results], axis=1)
+        scores = np.concatenate([r[1] for r in results], axis=1).astype(np.float64)
+        # missing results sort last
+        missing = np.equal(ids, None)
+        if self.sync.metric == L2:
+            keys = np.where(missing, np.inf, scores)
+        else:
+            keys = np.where(missing, np.inf, -scores)
+        order = np.argsort(keys, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1)
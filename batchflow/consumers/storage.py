@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Union
+
+import cv2
+import numpy as np
+import tenacity
+
+from batchflow.core.memory import nbytes
+from batchflow.core.node import ConsumerNode
+from batchflow.core.utils import split_batch
+from batchflow.errors import StorageUploadFailed
+from batchflow.storage import get_storage
+from batchflow.storage.base import BaseStorage
+
+
+def encode_output(data: Any, key: str) -> bytes:
+    """
+    Default encoder of UploadConsumer.
+    Images (numpy arrays, RGB) are encoded to the format of the key extension (jpg by default),
+    bytes are passed as it is, str is utf-8 encoded and everything else is dumped as json.
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return data
+    if isinstance(data, str):
+        return data.encode("utf-8")
+    if isinstance(data, np.ndarray):
+        ext = os.path.splitext(key)[-1] or ".jpg"
+        image = data[..., ::-1] if data.ndim == 3 else data  # RGB to BGR
+        ok, buffer = cv2.imencode(ext, image)
+        if not ok:
+            raise ValueError(f"Failed to encode image for {key}")
+        return buffer.tobytes()
+    return json.dumps(data).encode("utf-8")
+
+
+class UploadConsumer(ConsumerNode):
+    # an item uploaded again overwrites its object
+    idempotent = True
+
+    def __init__(
+        self,
+        storage: Union[str, BaseStorage],
+        storage_kwargs: Optional[Dict[str, Any]] = None,
+        data_key: str = "image",
+        name_key: str = "filename",
+        prefix: str = "",
+        key_fn: Optional[Callable[[Dict[str, Any]], str]] = None,
+        encoder: Callable[[Any, str], bytes] = encode_output,
+        workers: int = 8,
+        max_pending: Optional[int] = None,
+        retries: int = 3,
+        raise_on_failure: bool = False,
+        **kwargs,
+    ):
+        """
+        Uploads outputs to object storage (S3/B2) with bounded concurrency.
+
+        Every item is encoded and uploaded in worker threads, `consume` blocks once
+        `max_pending` uploads are in flight so a slow storage slows the flow down instead
+        of buffering without limit. `close` waits for all the uploads to finish.
+
+        Args:
+            storage (Union[str, BaseStorage]): storage object or storage name passed to `get_storage`
+            storage_kwargs (Optional[Dict[str, Any]], optional): kwargs for `get_storage`. Defaults to None.
+            data_key (str, optional): key of the data to upload in the item. Defaults to "image".
+            name_key (str, optional): key of the item used as object name. Defaults to "filename".
+            prefix (str, optional): prefix added to the object name. Defaults to "".
+            key_fn (Optional[Callable], optional): returns object key of an item, overrides name_key and prefix. Defaults to None.
+            encoder (Callable[[Any, str], bytes], optional): encodes data of an item to bytes (or a file-like object) given the object key,
+                the result is uploaded from memory with `upload_bytes`. Defaults to encode_output.
+            workers (int, optional): num of upload threads. Defaults to 8.
+            max_pending (Optional[int], optional): max uploads in flight, defaults to 2 * workers.
+            retries (int, optional): attempts per upload, for storages that do not retry uploads themselves
+                (S3 does, B2 only for bytes). Streams are only retried if they are seekable. Defaults to 3.
+            raise_on_failure (bool, optional): raise StorageUploadFailed in `close` if any upload failed. Defaults to False.
+        """
+        super(UploadConsumer, self).__init__(**kwargs)
+        self._storage = storage
+        self._storage_kwargs = storage_kwargs or {}
+        self.data_key = data_key
+        self.name_key = name_key
+        self.prefix = prefix
+        self.key_fn = key_fn
+        self.encoder = encoder
+        self.workers = workers
+        self.max_pending = max_pending if max_pending is not None else 2 * workers
+        self.retries = retries
+        self.raise_on_failure = raise_on_failure
+        self.failed_keys = []
+        self.uploaded = 0
+        self._executor = None
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        if isinstance(self._storage, str):
+            self.storage = get_storage(self._storage, **self._storage_kwargs)
+        else:
+            self.storage = self._storage
+        if getattr(self.storage, "bucket", True) is None:
+            self.storage.authenticate()
+
+        self.failed_keys = []
+        self.uploaded = 0
+        self._pending = threading.BoundedSemaphore(self.max_pending)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.num_workers,
+            thread_name_prefix="upload",
+            initializer=self.worker_initializer,
+        )
+        self._retrying = tenacity.Retrying(
+            stop=tenacity.stop_after_attempt(self.retries),
+            wait=tenacity.wait_exponential(multiplier=1, min=1, max=30),
+            reraise=True,
+        )
+
+    def close(self):
+        if self._executor is None:
+            return
+        # wait for all the in-flight uploads
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        self._logger.info(
+            f"{self}: uploaded {self.uploaded} objects, {len(self.failed_keys)} failed"
+        )
+        if self.failed_keys:
+            self._logger.error(f"{self}: failed to upload keys {self.failed_keys}")
+            if self.raise_on_failure:
+                raise StorageUploadFailed(
+                    f"Failed to upload {len(self.failed_keys)} objects: {self.failed_keys}"
+                )
+
+    @property
+    def num_workers(self):
+        return self.worker_threads(self.workers)
+
+    def object_key(self, item: Dict[str, Any]) -> str:
+        if self.key_fn is not None:
+            return self.key_fn(item)
+        return self.prefix + str(item[self.name_key])
+
+    def _upload(self, key: str, data: bytes) -> str:
+        """Uploads `data` to `key`, returns the uri of the object"""
+        return self.storage.upload_bytes(key, data)
+
+    def _upload_with_retry(self, key: str, data: Any) -> str:
+        if not hasattr(data, "read"):
+            if getattr(self.storage, "retries_uploads", False):
+                # retried by the storage, retrying here too would multiply the attempts
+                return self._upload(key, data)
+            return self._retrying.copy()(self._upload, key, data)
+        if getattr(self.storage, "retries_streams", False):
+            return self._upload(key, data)
+        if not (hasattr(data, "seekable") and data.seekable()):
+            # a stream partially read can not be uploaded again
+            return self._upload(key, data)
+        start = data.tell()
+
+        def upload():
+            data.seek(start)
+            return self._upload(key, data)
+
+        return self._retrying.copy()(upload)
+
+    def _encode_and_upload(self, key: str, data: Any, size: int):
+        try:
+            uri = self._upload_with_retry(key, self.encoder(data, key))
+            self._logger.debug(f"{self}: uploaded {uri}")
+            with self._lock:
+                self.uploaded += 1
+        except Exception as e:
+            self._logger.error(f"{self}: upload of {key} failed: {e}")
+            with self._lock:
+                self.failed_keys.append(key)
+        finally:
+            if self.memory_budget is not None:
+                self.memory_budget.release(size)
+            self._pending.release()
+
+    def consume(self, item):
+        key = self.object_key(item)
+        data = item[self.data_key]
+        # backpressure: wait for a free slot
+        self._pending.acquire()
+        size = 0
+        if self.memory_budget is not None:
+            # the flow reserved the item with its batch and releases it once consumed,
+            # the upload keeps holding it: counted again without blocking on it
+            size = nbytes(data)
+            self.memory_budget.adjust(size)
+        try:
+            self._executor.submit(self._encode_and_upload, key, data, size)
+        except Exception:
+            if self.memory_budget is not None:
+                self.memory_budget.release(size)
+            self._pending.release()
+            raise
+
+    def consume_batch(self, items):
+        for item in split_batch(items):
+            self.consume(item)
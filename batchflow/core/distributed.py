@@ -0,0 +1,363 @@
+import itertools
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from multiprocessing.managers import BaseManager
+from typing import Iterable, List, Optional, Tuple
+
+import loguru
+
+from .node import ProducerNode
+
+logger = loguru.logger
+
+DEFAULT_ADDRESS = ("127.0.0.1", 50515)
+DEFAULT_AUTHKEY = b"batchflow"
+
+
+class WorkQueue:
+    """
+    Backend of the coordinator/worker queue of work units (file paths, object keys).
+    Work is handed out in leases, a lease not acked before it expires is requeued.
+    Implement this interface to plug another backend (redis, sqs, ...).
+    """
+
+    def put(self, units: List[str]):
+        """adds work units to the queue"""
+        raise NotImplementedError("Implement this method in subclass")
+
+    def close_input(self):
+        """no more work units will be put"""
+        raise NotImplementedError("Implement this method in subclass")
+
+    def lease(
+        self, worker_id: str, max_units: int
+    ) -> Optional[Tuple[str, List[str]]]:
+        """returns (lease id, units) of at most `max_units` units, None if no work is available now"""
+        raise NotImplementedError("Implement this method in subclass")
+
+    def extend(self, lease_id: str):
+        """heartbeat, pushes back the expiry of the lease"""
+        raise NotImplementedError("Implement this method in subclass")
+
+    def ack(self, lease_id: str):
+        """units of the lease are done"""
+        raise NotImplementedError("Implement this method in subclass")
+
+    def nack(self, lease_id: str):
+        """units of the lease failed, requeue them now"""
+        raise NotImplementedError("Implement this method in subclass")
+
+    def done(self) -> bool:
+        """True once the input is closed and every unit is acked (or failed too many times)"""
+        raise NotImplementedError("Implement this method in subclass")
+
+    def stats(self) -> dict:
+        raise NotImplementedError("Implement this method in subclass")
+
+
+class LocalWorkQueue(WorkQueue):
+    """
+    In-memory lease based work queue, thread safe. Serve it to workers of other
+    processes / machines with `serve_work_queue`.
+
+    - Arguments:
+        - lease_timeout: seconds a lease lives without heartbeat before its units are requeued
+        - max_attempts: leases of a unit before it is given up as failed
+    """
+
+    def __init__(self, lease_timeout: float = 300, max_attempts: int = 3):
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self._pending = deque()
+        self._leases = {}  # lease id -> (worker id, units, deadline)
+        self._attempts = {}  # unit -> num of leases
+        self._failed = []
+        self._acked = 0
+        self._input_closed = False
+        self._lock = threading.Lock()
+
+    def put(self, units):
+        with self._lock:
+            self._pending.extend(units)
+
+    def close_input(self):
+        with self._lock:
+            self._input_closed = True
+
+    def _requeue(self, units):
+        retry = []
+        for unit in units:
+            if self._attempts.get(unit, 0) >= self.max_attempts:
+                logger.error(f"Giving up {unit} after {self.max_attempts} attempts")
+                self._failed.append(unit)
+            else:
+                retry.append(unit)
+        # retried units go first so stragglers do not wait for the whole queue
+        self._pending.extendleft(reversed(retry))
+
+    def _reap_expired(self):
+        now = time.monotonic()
+        for lease_id, (worker_id, units, deadline) in list(self._leases.items()):
+            if deadline < now:
+                logger.warning(
+                    f"Lease {lease_id} of worker {worker_id} expired, requeue {len(units)} units"
+                )
+                del self._leases[lease_id]
+                self._requeue(units)
+
+    def lease(self, worker_id, max_units):
+        with self._lock:
+            self._reap_expired()
+            if not self._pending:
+                return None
+            units = [
+                self._pending.popleft()
+                for _ in range(min(max_units, len(self._pending)))
+            ]
+            for unit in units:
+                self._attempts[unit] = self._attempts.get(unit, 0) + 1
+            lease_id = uuid.uuid4().hex
+            self._leases[lease_id] = (
+                worker_id,
+                units,
+                time.monotonic() + self.lease_timeout,
+            )
+            return lease_id, units
+
+    def extend(self, lease_id):
+        with self._lock:
+            if lease_id in self._leases:
+                worker_id, units, _ = self._leases[lease_id]
+                self._leases[lease_id] = (
+                    worker_id,
+                    units,
+                    time.monotonic() + self.lease_timeout,
+                )
+
+    def ack(self, lease_id):
+        with self._lock:
+            lease = self._leases.pop(lease_id, None)
+            if lease is None:
+                # expired and requeued, the duplicate run is harmless for idempotent flows
+                logger.warning(f"Ack of unknown or expired lease {lease_id}")
+                return
+            self._acked += len(lease[1])
+
+    def nack(self, lease_id):
+        with self._lock:
+            lease = self._leases.pop(lease_id, None)
+            if lease is not None:
+                self._requeue(lease[1])
+
+    def done(self):
+        with self._lock:
+            self._reap_expired()
+            return self._input_closed and not self._pending and not self._leases
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "leased": sum(len(units) for _, units, _ in self._leases.values()),
+                "acked": self._acked,
+                "failed": list(self._failed),
+            }
+
+
+class _QueueClient(BaseManager):
+    pass
+
+
+# the client registry has no callable, the servers register theirs on their own class
+_QueueClient.register("get_queue")
+
+
+def serve_work_queue(
+    queue: WorkQueue, address=DEFAULT_ADDRESS, authkey: bytes = DEFAULT_AUTHKEY
+):
+    """
+    Serves `queue` over a socket in a background thread, returns the server,
+    stop it with ``stop_work_queue(server)``.
+    """
+
+    class _QueueServer(BaseManager):
+        # a registry per server, a process can serve several queues and connect to them
+        pass
+
+    _QueueServer.register("get_queue", callable=lambda: queue)
+    manager = _QueueServer(address=address, authkey=authkey)
+    server = manager.get_server()
+
+    def serve():
+        try:
+            server.serve_forever()
+        except SystemExit:
+            # serve_forever exits once stopped
+            pass
+
+    thread = threading.Thread(target=serve, name="work-queue-server", daemon=True)
+    thread.start()
+    server.thread = thread
+    logger.info(f"Serving work queue on {server.address}")
+    return server
+
+
+def stop_work_queue(server):
+    """Stops a server of ``serve_work_queue`` and closes its socket"""
+    server.stop_event.set()
+    # unblocks the accepter thread and frees the address
+    server.listener.close()
+    server.thread.join()
+
+
+def connect_work_queue(
+    address=DEFAULT_ADDRESS, authkey: bytes = DEFAULT_AUTHKEY
+) -> WorkQueue:
+    """Returns a proxy of the work queue served by the coordinator at `address`"""
+    manager = _QueueClient(address=address, authkey=authkey)
+    manager.connect()
+    return manager.get_queue()
+
+
+class Coordinator:
+    """
+    Lists the work units of `producer` into `queue` and waits until workers processed them all.
+
+    - Arguments:
+        - producer: producer whose ``list_work_units`` gives the work
+        - queue: work queue backend, a LocalWorkQueue served on `address` by default
+        - address, authkey: socket the local queue is served on, None to not serve it
+    """
+
+    def __init__(
+        self,
+        producer: ProducerNode,
+        queue: Optional[WorkQueue] = None,
+        address=DEFAULT_ADDRESS,
+        authkey: bytes = DEFAULT_AUTHKEY,
+        put_chunk_size: int = 1000,
+        poll_interval: float = 1.0,
+    ):
+        self.producer = producer
+        self.queue = queue if queue is not None else LocalWorkQueue()
+        self.address = address
+        self.authkey = authkey
+        self.put_chunk_size = put_chunk_size
+        self.poll_interval = poll_interval
+        self._server = None
+
+    def _put_units(self, units: Iterable[str]):
+        # put in chunks while listing, workers can start before the listing ends
+        units = iter(units)
+        total = 0
+        while True:
+            chunk = list(itertools.islice(units, self.put_chunk_size))
+            if not chunk:
+                break
+            self.queue.put(chunk)
+            total += len(chunk)
+        self.queue.close_input()
+        logger.info(f"Queued {total} work units")
+
+    def run(self):
+        if self.address is not None and isinstance(self.queue, LocalWorkQueue):
+            self._server = serve_work_queue(self.queue, self.address, self.authkey)
+        try:
+            self._put_units(self.producer.list_work_units())
+            while not self.queue.done():
+                time.sleep(self.poll_interval)
+            stats = self.queue.stats()
+            logger.info(
+                f"All work done, acked {stats['acked']} units, failed {len(stats['failed'])}"
+            )
+            return stats
+        finally:
+            if self._server is not None:
+                stop_work_queue(self._server)
+                self._server = None
+
+
+class Worker:
+    """
+    Pulls chunks of work units from `queue`, runs `flow` on each chunk and acks it.
+    The flow is opened once (models stay loaded), its producer is reset to the
+    leased units with ``assign_work_units`` for every chunk.
+
+    - Arguments:
+        - flow: flow to run, its (single) producer must support work units
+        - queue: work queue, e.g. ``connect_work_queue(address)``
+        - chunk_size: units leased at once
+        - heartbeat_interval: seconds between lease extensions while a chunk runs
+    """
+
+    def __init__(
+        self,
+        flow,
+        queue: WorkQueue,
+        chunk_size: int = 64,
+        worker_id: Optional[str] = None,
+        poll_interval: float = 1.0,
+        heartbeat_interval: float = 30.0,
+    ):
+        self.flow = flow
+        self.queue = queue
+        self.chunk_size = chunk_size
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+
+    def _heartbeat(self, lease_id, stop):
+        while not stop.wait(self.heartbeat_interval):
+            try:
+                self.queue.extend(lease_id)
+            except (EOFError, ConnectionError):
+                # the worker notices it when the chunk ends
+                return
+
+    def run(self):
+        from .flow import FLOW_STATUS
+
+        flow = self.flow
+        flow.setup()
+        producer = flow.producers[0][0]
+        flow.open()
+        processed = 0
+        try:
+            while True:
+                lease = self.queue.lease(self.worker_id, self.chunk_size)
+                if lease is None:
+                    if self.queue.done():
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+
+                lease_id, units = lease
+                stop = threading.Event()
+                heartbeat = threading.Thread(
+                    target=self._heartbeat, args=(lease_id, stop), daemon=True
+                )
+                heartbeat.start()
+                try:
+                    producer.assign_work_units(units)
+                    flow.run(manual=True)
+                finally:
+                    stop.set()
+                    heartbeat.join()
+
+                if flow.status[0] == FLOW_STATUS.COMPLETE:
+                    self.queue.ack(lease_id)
+                    processed += len(units)
+                else:
+                    logger.error(f"Worker {self.worker_id}: chunk failed, requeue")
+                    self.queue.nack(lease_id)
+        except (EOFError, ConnectionError):
+            # any call of the queue proxy fails once the coordinator is gone
+            logger.info(f"Worker {self.worker_id}: coordinator is gone, stopping")
+        finally:
+            flow.close()
+        logger.info(f"Worker {self.worker_id} processed {processed} units")
+        return processed
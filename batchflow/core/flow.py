@@ -1,13 +1,23 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from platform import node
-from typing import List
+from queue import Queue
+from typing import List, Optional
 
 from loguru import logger
 
+from batchflow.constants import ORDERED, ORDERS, UNORDERED
 from batchflow.decorators import log_time
 
 from .graph import GraphEngine
-from .node import ConsumerNode, ProcessorNode, ProducerNode
+from .memory import MemoryBudget, nbytes
+from .node import ConsumerNode, ProcessorNode, ProducerNode, carry_batch_id
+from .policy import SKIPPED, ErrorPolicy
+from .queue import ReorderBuffer, SpillQueue
+from .resources import ResourceConfig, apply_library_threads, check_threads, pin_cpus
+from .trace import ChromeTracer
 from enum import Enum
+from collections import OrderedDict
 
 
 class FLOW_STATUS(Enum):
@@ -40,15 +50,88 @@ def _task_data_from_node_tsort(tsort_l):
     return producers, processer, consumers
 
 
+class _FeedEnd:
+    """End of the batches fed to the processor threads, `submitted` batches or an `error`"""
+
+    def __init__(self, submitted: int, error: Optional[Exception] = None):
+        self.submitted = submitted
+        self.error = error
+
+
 class Flow:
     def __init__(
         self,
         producers: List[ProducerNode],
         consumers: List[ConsumerNode],
         batch_size: int = 1,
+        trace: Optional[str] = None,
+        memory_budget: Optional[int] = None,
+        on_error: Optional[ErrorPolicy] = None,
+        resources: Optional[ResourceConfig] = None,
+        strict_resources: bool = False,
+        consumer_queue: Optional[SpillQueue] = None,
+        workers: int = 1,
+        order: str = ORDERED,
+        reorder_window: Optional[int] = None,
     ) -> None:
+        """
+        - Arguments:
+            - producers: producer nodes of the graph
+            - consumers: consumer nodes of the graph
+            - batch_size: units produced, processed and consumed per call
+            - trace: if set, spans of every node call are recorded and written to \
+                this path as a Chrome Trace Event json at ``close()``
+            - memory_budget: max bytes of batch data in flight in batch mode \
+                (not used with batch_size 1), producers block while the budget is \
+                exhausted, data kept by consumers after their call (e.g. in-flight \
+                uploads) is counted until released
+            - on_error: error policy of the nodes without their own ``on_error``, \
+                by default any error ends the flow
+            - resources: library threads and cpu pinning of the process applied at open, \
+                its `threads` is the thread budget of the flow (the available cpus by default)
+            - strict_resources: raise instead of warning when the threads planned by \
+                the nodes exceed the thread budget
+            - consumer_queue: in batch mode, consumers run in their own thread fed by \
+                this queue (e.g. ``SpillQueue``) so a lagging consumer does not slow \
+                the processors down, batches spilled to disk give back their memory budget
+            - workers: in batch mode, batches processed at once by the processors \
+                (in threads), every batch is then tagged with its sequence number ``batch_id`` \
+                (as with a trace, or a consumer queue with a memory budget). \
+                Processors run batch by batch in the workers, ``pipeline_depth`` is not used
+            - order: with several workers, ``ordered`` consumes the batches in sequence \
+                order, ``unordered`` as soon as they are processed (consumers with \
+                ``requires_order`` still get them in order)
+            - reorder_window: max batches processed ahead of the oldest unfinished one \
+                when ordering, bounds the reorder buffer. Defaults to 2 * workers
+        """
+        if order not in ORDERS:
+            raise ValueError(f"order {order} should be one of {ORDERS}")
+        if workers < 1:
+            raise ValueError(f"workers should be >= 1, got {workers}")
         self._graph_engine = GraphEngine(producers, consumers)
         self.batch_size = batch_size
+        self.trace = trace
+        self._tracer = None
+        self._memory_budget = (
+            MemoryBudget(memory_budget) if memory_budget is not None else None
+        )
+        # bytes held by the batches in flight, by batch_id, updated by the producer,
+        # consumer and main threads
+        self._inflight_bytes = OrderedDict()
+        self._inflight_lock = threading.Lock()
+        self.on_error = on_error
+        self.resources = resources
+        self.strict_resources = strict_resources
+        self.consumer_queue = consumer_queue
+        self.workers = workers
+        self.order = order
+        self.reorder_window = reorder_window or 2 * workers
+        # reorders the batches for the consumers requiring order in unordered mode
+        self._consumer_reorder = None
+        # batches carry their sequence number ``batch_id`` (set in run when it is needed)
+        self._tag_batches = False
+        # nodes given the flow error policy on open
+        self._default_policy_nodes = []
         self._status = FLOW_STATUS.IDLE
         self._message = ""
         self._exception = None
@@ -62,6 +145,31 @@ class Flow:
     def status(self):
         return self._status, self._message, self._exception
 
+    @property
+    def memory_high_water_mark(self):
+        """max bytes in flight during the last run, None without memory budget"""
+        if self._memory_budget is None:
+            return None
+        return self._memory_budget.high_water_mark
+
+    @property
+    def failures(self):
+        """failed inputs dropped by error policies during the last run, by node"""
+        return {
+            str(node): node.error_count
+            for node in self._all_nodes()
+            if node.error_count
+        }
+
+    def _dead_letters(self):
+        dead_letters = []
+        for node in self._all_nodes():
+            policy = node.on_error
+            if policy is not None and policy.dead_letter is not None:
+                if all(policy.dead_letter is not d for d in dead_letters):
+                    dead_letters.append(policy.dead_letter)
+        return dead_letters
+
     @staticmethod
     def _open_nodes(nodes, batch_size):
         for node_data in nodes:
@@ -69,22 +177,89 @@ class Flow:
             node.batch_size = batch_size
             node.open()
 
+    def _all_nodes(self):
+        return [
+            node_data[0]
+            for node_data in self.producers + self.processors + self.consumers
+        ]
+
     @staticmethod
     def _close_nodes(nodes):
         for node_data in nodes:
             node = node_data[0]
             node.close()
 
-    def open(self):
+    def open(self, producers: bool = True):
+        """
+        Opens the nodes of the flow, `producers` False leaves the producers closed
+        (used by FlowService whose inputs are submitted)
+        """
+        self._check_resources()
+        if self.trace is not None:
+            self._tracer = ChromeTracer(self.trace)
+            for node in self._all_nodes():
+                node._tracer = self._tracer
+        if self._memory_budget is not None:
+            for node in self._all_nodes():
+                node.memory_budget = self._memory_budget
+        if self.on_error is not None:
+            self._default_policy_nodes = [
+                node for node in self._all_nodes() if node.on_error is None
+            ]
+            for node in self._default_policy_nodes:
+                node.on_error = self.on_error
+        for dead_letter in self._dead_letters():
+            dead_letter.open()
+
         # open all tasks
-        self._open_nodes(self.producers, self.batch_size)
+        if producers:
+            self._open_nodes(self.producers, self.batch_size)
         self._open_nodes(self.processors, self.batch_size)
         self._open_nodes(self.consumers, self.batch_size)
 
-    def close(self):
-        self._close_nodes(self.producers)
+    def _check_resources(self):
+        nodes = self._all_nodes()
+        for node in nodes:
+            # planned threads may depend on the batch size
+            node.batch_size = self.batch_size
+        cpus = None
+        # process-wide, applied here in the main thread before the node pools start
+        apply_library_threads(self.resources, nodes)
+        if self.resources is not None:
+            if self.resources.cpus is not None:
+                pin_cpus(self.resources.cpus)
+            cpus = self.resources.threads or (
+                len(self.resources.cpus) if self.resources.cpus else None
+            )
+        # the consumers run in their own thread with a consumer queue
+        flow_threads = 1 if self.consumer_queue is None or self.batch_size == 1 else 2
+        if self.batch_size > 1 and self.workers > 1:
+            # processor workers and the producer thread
+            flow_threads += self.workers + 1
+        check_threads(nodes, cpus, strict=self.strict_resources, flow_threads=flow_threads)
+
+    def close(self, producers: bool = True):
+        if producers:
+            self._close_nodes(self.producers)
         self._close_nodes(self.processors)
         self._close_nodes(self.consumers)
+        for dead_letter in self._dead_letters():
+            dead_letter.close()
+        for node in self._all_nodes():
+            if node.timeout is not None:
+                node.timeout.close(node)
+        for node in self._default_policy_nodes:
+            node.on_error = None
+        self._default_policy_nodes = []
+
+        if self._tracer is not None:
+            for node in self._all_nodes():
+                node._tracer = None
+            self._tracer.save()
+            self._tracer = None
+        if self._memory_budget is not None:
+            for node in self._all_nodes():
+                node.memory_budget = None
 
     def setup(self):
         tsort = self._graph_engine.topological_sort()
@@ -97,10 +272,261 @@ class Flow:
         self.processors = processer
         self.consumers = consumers
 
+    def _produce_batches(self):
+        budget = self._memory_budget
+        batch_id = 0
+        reserved = 0
+        while True:
+            if budget is not None:
+                # block before producing, assuming the batch is as large as the last one
+                budget.acquire(reserved)
+
+            # get the self.producers output
+            ctx = {}
+            try:
+                for prod_data in self.producers:
+                    prod = prod_data[0]
+                    out = prod.invoke("next_batch", batch_id=batch_id)
+                    if out is SKIPPED:
+                        break
+                    ctx = {**out}
+            except StopIteration:
+                if budget is not None:
+                    budget.release(reserved)
+                return
+            if out is SKIPPED:
+                # batch dropped by the error policy of the producer
+                if budget is not None:
+                    budget.release(reserved)
+                    reserved = 0
+                continue
+            if self._tag_batches:
+                ctx["batch_id"] = batch_id
+
+            if budget is not None:
+                size = nbytes(ctx)
+                budget.adjust(size - reserved)
+                with self._inflight_lock:
+                    self._inflight_bytes[batch_id] = size
+                reserved = size
+
+            batch_id += 1
+            yield ctx
+
+    def _release_batch(self, ctx):
+        if self._memory_budget is None:
+            return
+        batch_id = ctx.get("batch_id", None) if isinstance(ctx, dict) else None
+        with self._inflight_lock:
+            if batch_id is not None:
+                # None if already released (spilled to disk)
+                size = self._inflight_bytes.pop(batch_id, None)
+            elif self._inflight_bytes:
+                # untagged or batch_id lost by a processor, batches are consumed in order
+                _, size = self._inflight_bytes.popitem(last=False)
+            else:
+                size = None
+        if size is not None:
+            self._memory_budget.release(size)
+
+    def _consume_batch(self, ctx):
+        """Consumes a batch and releases its memory, returns False for empty batches"""
+        # every item dropped by error policies
+        empty = ctx.get("batch_size", None) == 0
+        reorder = self._consumer_reorder
+        for con_data in self.consumers:
+            con = con_data[0]
+            if not empty and (reorder is None or not con.requires_order):
+                con.invoke("consume_batch", ctx)
+        if reorder is None:
+            self._release_batch(ctx)
+            return not empty
+
+        for ready in reorder.push(ctx["batch_id"], ctx):
+            if ready.get("batch_size", None) != 0:
+                for con_data in self.consumers:
+                    con = con_data[0]
+                    if con.requires_order:
+                        con.invoke("consume_batch", ready)
+            self._release_batch(ready)
+        return not empty
+
+    def _process_chain(self, batch):
+        seq = batch["batch_id"]
+        for proc_data in self.processors:
+            proc = proc_data[0]
+            batch = carry_batch_id(batch, proc.invoke_batch("process_batch", batch))
+        batch["batch_id"] = seq
+        return batch
+
+    def _process_parallel(self, batches, ordered: bool, bounded: bool):
+        """
+        Runs the processors on `workers` batches at once in threads, yields the processed
+        batches in sequence order if `ordered`, else as they complete. If `bounded` no batch
+        is started more than `reorder_window` batches ahead of the oldest unfinished one.
+
+        The batches are pulled from the producers in their own thread: producers may block
+        on the memory budget until the batches yielded here are consumed.
+        """
+        executor = ThreadPoolExecutor(self.workers, thread_name_prefix="process")
+        reorder = ReorderBuffer() if ordered else None
+        done = Queue()  # completed futures, then the end of the feed
+        cond = threading.Condition()
+        # sequence numbers started and not processed yet
+        unfinished = set()
+        state = {"next_seq": 0, "stop": False}
+
+        def ahead():
+            if not bounded:
+                return len(unfinished) >= self.workers
+            if reorder is not None:
+                # oldest batch not yielded yet
+                oldest = reorder.next_seq
+            else:
+                oldest = min(unfinished, default=state["next_seq"])
+            return state["next_seq"] - oldest >= self.reorder_window
+
+        def feed():
+            submitted, error = 0, None
+            try:
+                while True:
+                    with cond:
+                        cond.wait_for(lambda: state["stop"] or not ahead())
+                        if state["stop"]:
+                            break
+                    try:
+                        batch = next(batches)
+                    except StopIteration:
+                        break
+                    with cond:
+                        unfinished.add(batch["batch_id"])
+                        state["next_seq"] = batch["batch_id"] + 1
+                    future = executor.submit(self._process_chain, batch)
+                    future.add_done_callback(done.put)
+                    submitted += 1
+            except Exception as e:
+                error = e
+            finally:
+                batches.close()
+                done.put(_FeedEnd(submitted, error))
+
+        feeder = threading.Thread(target=feed, name="producers", daemon=True)
+        feeder.start()
+        received, total = 0, None
+        try:
+            while total is None or received < total:
+                out = done.get()
+                if isinstance(out, _FeedEnd):
+                    if out.error is not None:
+                        raise out.error
+                    total = out.submitted
+                    continue
+                received += 1
+                batch = out.result()
+                with cond:
+                    unfinished.discard(batch["batch_id"])
+                    if reorder is not None:
+                        ready = reorder.push(batch["batch_id"], batch)
+                    else:
+                        ready = [batch]
+                    cond.notify_all()
+                yield from ready
+        finally:
+            with cond:
+                state["stop"] = True
+                cond.notify_all()
+            if feeder.is_alive() and self._memory_budget is not None:
+                # the producers may wait for memory the stopped flow never releases
+                self._memory_budget.interrupt()
+            executor.shutdown(wait=True, cancel_futures=True)
+            feeder.join()
+
+    def _consume_queued(self, batches):
+        """Feeds the batches to the consumers running in a thread through the consumer queue"""
+        queue = self.consumer_queue
+        stop = threading.Event()
+        state = {"last_ctx": None, "error": None}
+
+        def consume():
+            try:
+                while not stop.is_set():
+                    ctx = queue.get()
+                    if ctx is None:
+                        return
+                    if self._consume_batch(ctx):
+                        state["last_ctx"] = ctx
+            except Exception as e:
+                state["error"] = e
+                if self._memory_budget is not None:
+                    # the producers may wait for memory the consumers never release
+                    self._memory_budget.interrupt()
+
+        thread = threading.Thread(target=consume, name="consumers", daemon=True)
+        thread.start()
+        try:
+            for ctx in batches:
+                if state["error"] is not None:
+                    break
+                if queue.put(ctx):
+                    # spilled to disk, its memory is free
+                    self._release_batch(ctx)
+            # end of the batches
+            queue.put(None)
+            thread.join()
+        finally:
+            stop.set()
+            if thread.is_alive():
+                queue.put(None)
+                thread.join()
+            if queue.spilled_batches:
+                logger.info(
+                    f"Spilled {queue.spilled_batches} batches ({queue.spilled_bytes} bytes) to disk"
+                )
+            queue.close()
+        if state["error"] is not None:
+            raise state["error"]
+        return state["last_ctx"]
+
+    def run_coordinator(self, **kwargs):
+        """
+        Coordinator of a distributed run: lists the work units of the producer into
+        a lease based work queue served to the workers, returns once all are processed.
+        See ``batchflow.core.distributed.Coordinator`` for the arguments.
+        """
+        from .distributed import Coordinator
+
+        self.setup()
+        return Coordinator(self.producers[0][0], **kwargs).run()
+
+    def run_worker(self, queue=None, **kwargs):
+        """
+        Worker of a distributed run: runs this flow on chunks of work units pulled
+        from `queue` (the coordinator's queue on the default local address by default).
+        See ``batchflow.core.distributed.Worker`` for the arguments.
+        """
+        from .distributed import Worker, connect_work_queue
+
+        if queue is None:
+            queue = connect_work_queue()
+        return Worker(self, queue, **kwargs).run()
+
+    def serve(self, **kwargs):
+        """
+        Returns a started FlowService keeping the processors and consumers of this flow
+        open to process items submitted by callers. See ``batchflow.core.service.FlowService``.
+        """
+        from .service import FlowService
+
+        return FlowService(self, **kwargs).start()
+
     @log_time
     def run(self, manual=False):
         logger.info("Running Flow...\n\n")
         logger.info(f"Batch size={self.batch_size}")
+        if self.workers > 1 and self.batch_size == 1:
+            logger.warning("workers are only used in batch mode (batch_size > 1)")
+        if self._memory_budget is not None and self.batch_size == 1:
+            logger.warning("memory_budget is only enforced in batch mode (batch_size > 1)")
         
         if not manual:
             self.setup()
@@ -112,10 +538,15 @@ class Flow:
 
         last_ctx = None
         self._status = FLOW_STATUS.RUNNING
+        self._message = ""
+        self._exception = None
+        for node in self._all_nodes():
+            node.error_count = 0
         try:
             if self.batch_size == 1:
 
                 # process the flow sequentially
+                item_id = 0
                 while True:
 
                     # get the producers output
@@ -123,47 +554,96 @@ class Flow:
                     try:
                         for prod_data in self.producers:
                             prod = prod_data[0]
-                            out = prod.next()
+                            out = prod.invoke("next", batch_id=item_id)
+                            if out is SKIPPED:
+                                ctx = SKIPPED
+                                break
                             ctx = {**out, **ctx}
                     except StopIteration:
                         break
 
-                    # process the unit
+                    # process the unit, stop at the first node dropping it
                     for proc_data in self.processors:
+                        if ctx is SKIPPED:
+                            break
                         proc = proc_data[0]
-                        ctx = proc.process(ctx)
+                        ctx = proc.invoke("process", ctx, batch_id=item_id)
+
+                    item_id += 1
+                    if ctx is SKIPPED:
+                        continue
 
                     # consume the unit
                     for con_data in self.consumers:
                         con = con_data[0]
-                        con.consume(ctx)
+                        con.invoke("consume", ctx, batch_id=item_id - 1)
 
                     last_ctx = ctx
             else:
-                # process the flow sequentially
-                while True:
-
-                    # get the self.producers output
-                    ctx = {}
-                    try:
-                        for prod_data in self.producers:
-                            prod = prod_data[0]
-                            out = prod.next_batch()
-                            ctx = {**out}
-                    except StopIteration:
-                        break
-
-                    # process the unit
+                # the sequence number is only added to the batches for the trace, the
+                # parallel workers and the release of batches spilled to disk
+                self._tag_batches = (
+                    self._tracer is not None
+                    or self.workers > 1
+                    or (self._memory_budget is not None and self.consumer_queue is not None)
+                )
+                # chain the batches through the processors, processors may
+                # work on several batches at once (see process_batch_iter)
+                batches = self._produce_batches()
+                if self.workers > 1:
+                    # the worker threads call process_batch, overlapping process_batch_iter
+                    # implementations are not used
+                    pipelined = [
+                        str(proc_data[0])
+                        for proc_data in self.processors
+                        if getattr(proc_data[0], "pipeline_depth", 0) > 0
+                    ]
+                    if pipelined:
+                        logger.warning(
+                            f"pipeline_depth of {pipelined} is ignored with workers > 1, "
+                            "the stages of a batch run in its worker thread"
+                        )
+                    reorder_consumers = self.order == UNORDERED and any(
+                        con_data[0].requires_order for con_data in self.consumers
+                    )
+                    if reorder_consumers:
+                        self._consumer_reorder = ReorderBuffer()
+                    batches = self._process_parallel(
+                        batches,
+                        ordered=self.order == ORDERED,
+                        bounded=self.order == ORDERED or reorder_consumers,
+                    )
+                else:
                     for proc_data in self.processors:
                         proc = proc_data[0]
-                        ctx = proc.process_batch(ctx)
-
-                    # consume the unit
-                    for con_data in self.consumers:
-                        con = con_data[0]
-                        con.consume_batch(ctx)
-                    last_ctx = ctx
+                        batches = proc.process_batch_iter(batches)
+
+                if self._memory_budget is not None:
+                    self._memory_budget.reset()
+                    with self._inflight_lock:
+                        self._inflight_bytes.clear()
+                try:
+                    if self.consumer_queue is None:
+                        for ctx in batches:
+                            if self._consume_batch(ctx):
+                                last_ctx = ctx
+                    else:
+                        last_ctx = self._consume_queued(batches)
+                finally:
+                    if self._memory_budget is not None:
+                        # unblock producers waiting for memory to stop
+                        self._memory_budget.interrupt()
+                        logger.info(
+                            f"Memory high water mark {self._memory_budget.high_water_mark} bytes"
+                            f" of {self._memory_budget.max_bytes}"
+                        )
+                    batches.close()
+                    self._consumer_reorder = None
             self._status = FLOW_STATUS.COMPLETE
+            failures = self.failures
+            if failures:
+                self._message = f"Completed with dropped inputs: {failures}"
+                logger.warning(self._message)
         except Exception as e:
             import traceback
 
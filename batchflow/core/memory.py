@@ -0,0 +1,102 @@
+import threading
+
+import loguru
+import numpy as np
+
+logger = loguru.logger
+
+
+def nbytes(obj) -> int:
+    """
+    Returns approximate memory held by the data of `obj`: numpy arrays, bytes and str,
+    recursing into dicts, lists and tuples. Other objects count as 0.
+    """
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (bytes, bytearray, str)):
+        return len(obj)
+    if isinstance(obj, memoryview):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sum(nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(nbytes(v) for v in obj)
+    return 0
+
+
+class MemoryBudget:
+    """
+    Bytes of data allowed in flight in a flow, shared by producers, queues and async consumers.
+
+    ``acquire`` blocks while the budget is exhausted and some memory is held by others,
+    a single request larger than the budget is granted once nothing else is in flight.
+    Only acquire memory that is not held yet: a node keeping data of a batch the flow
+    reserved (e.g. in-flight uploads) counts it with ``adjust``, blocking on it could wait
+    for the release of the batch it is consuming.
+
+    ``acquire`` only returns early once the budget is interrupted: a flow stopping on an error
+    interrupts it before waiting for threads which may be blocked on memory nobody releases.
+    """
+
+    def __init__(self, max_bytes: int):
+        if max_bytes <= 0:
+            raise ValueError("memory budget should be > 0 bytes")
+        self.max_bytes = max_bytes
+        self._used = 0
+        self._high_water_mark = 0
+        self._interrupted = False
+        self._cond = threading.Condition()
+
+    @property
+    def used(self) -> int:
+        return self._used
+
+    @property
+    def high_water_mark(self) -> int:
+        """max bytes in flight since the last reset"""
+        return self._high_water_mark
+
+    def acquire(self, n: int):
+        with self._cond:
+            while (
+                not self._interrupted
+                and self._used > 0
+                and self._used + n > self.max_bytes
+            ):
+                self._cond.wait()
+            self._add(n)
+
+    def try_acquire(self, n: int) -> bool:
+        with self._cond:
+            if self._used > 0 and self._used + n > self.max_bytes:
+                return False
+            self._add(n)
+            return True
+
+    def adjust(self, n: int):
+        """Changes the bytes held by `n` (negative to give back) without blocking"""
+        with self._cond:
+            self._add(n)
+            if n < 0:
+                self._cond.notify_all()
+
+    def release(self, n: int):
+        self.adjust(-n)
+
+    def _add(self, n):
+        self._used += n
+        if self._used > self._high_water_mark:
+            self._high_water_mark = self._used
+
+    def interrupt(self):
+        """Wakes up and stops blocking all the waiters, used when the flow stops"""
+        with self._cond:
+            self._interrupted = True
+            self._cond.notify_all()
+
+    def reset(self):
+        with self._cond:
+            self._used = 0
+            self._high_water_mark = 0
+            self._interrupted = False
+            self._cond.notify_all()
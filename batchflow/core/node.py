@@ -1,16 +1,29 @@
 from __future__ import absolute_import, division, print_function
 
+import itertools
+
 import loguru
 
 from batchflow.storage.base import BaseStorage
 
 logger = loguru.logger
 
-from typing import Any, List
+from typing import Any, Dict, Iterable, Iterator, List
 
 import numpy as np
 
 from batchflow.constants import BATCH, CPU, DEVICE_TYPES, GPU, MODE, REALTIME
+from batchflow.core.policy import SKIPPED, ErrorPolicy
+from batchflow.core.resources import ResourceConfig, pin_cpus
+from batchflow.core.timeout import TimeoutPolicy
+from batchflow.core.utils import empty_batch, shard_keys
+
+
+def carry_batch_id(inp, out):
+    """Copies the ``batch_id`` tag of the input batch to the output batch"""
+    if isinstance(out, dict) and isinstance(inp, dict) and "batch_id" in inp:
+        out.setdefault("batch_id", inp["batch_id"])
+    return out
 
 
 class Node:
@@ -19,7 +32,22 @@ class Node:
         It can be call with the list of parents on which it depends.
     """
 
-    def __init__(self, name=None, mode=BATCH):
+    # calls can be repeated: retried by the error policy, speculated by the timeout policy
+    _retry_calls = True
+
+    @property
+    def _speculative_calls(self) -> bool:
+        """calls may run twice at once, duplicated by a speculative timeout policy"""
+        return self._retry_calls
+
+    def __init__(
+        self,
+        name=None,
+        mode=BATCH,
+        on_error: ErrorPolicy = None,
+        timeout: TimeoutPolicy = None,
+        resources: ResourceConfig = None,
+    ):
         if name is None:
             name = self.__class__.__name__
 
@@ -34,6 +62,17 @@ class Node:
         self._logger = self._configure_logger()
         self._logger.debug(f"Created Node with id {self._id}")
         self._batch_size = 1
+        self._tracer = None
+        # memory budget of the flow, set by the flow on open when configured
+        self.memory_budget = None
+        # what to do when a call of this node fails, see ErrorPolicy
+        self.on_error = on_error
+        self.error_count = 0
+        # time limits of the calls of this node, see TimeoutPolicy
+        self.timeout = timeout
+        # threads and cpus of the workers of this node, see ResourceConfig
+        self.resources = resources
+        self._worker_index = itertools.count()
         if mode in MODE:
             self.mode = MODE
         else:
@@ -118,6 +157,70 @@ class Node:
         """
         pass
 
+    def invoke(self, method: str, *args, batch_id=None):
+        """
+        Calls `method` of the node with `args`, the flow calls nodes through this method
+        to record them in the trace (when enabled) and apply the error and timeout policies.
+        Returns ``SKIPPED`` when the error policy dropped the input.
+
+        - Arguments:
+            - method: name of the method e.g. ``process_batch``
+            - batch_id: id of the batch traced with the call, taken from \
+                the ``batch_id`` of the input batch by default.
+        """
+        if self.on_error is None:
+            return self._call(method, *args, batch_id=batch_id)
+        return self.on_error.run(
+            self,
+            method,
+            lambda method, *args: self._call(method, *args, batch_id=batch_id),
+            *args,
+            retry=self._retry_calls,
+            position=None if args else lambda: self._call_position(batch_id),
+        )
+
+    def _call_position(self, batch_id):
+        """identifies the input of a call without argument in the failure records"""
+        return None
+
+    def _call(self, method: str, *args, batch_id=None):
+        if self._tracer is None:
+            return self._call_timed(method, *args)
+
+        if batch_id is None and args and isinstance(args[0], dict):
+            batch_id = args[0].get("batch_id", None)
+        with self._tracer.span(method, self, batch_id):
+            return self._call_timed(method, *args)
+
+    def _call_timed(self, method: str, *args):
+        if self.timeout is None:
+            return getattr(self, method)(*args)
+        return self.timeout.run(
+            self, method, getattr(self, method), *args, speculative=self._speculative_calls
+        )
+
+    def handle_item_error(self, method: str, item, error: Exception):
+        """
+        Called by nodes failing on a single item they handle internally (e.g. an image
+        a reader can not decode). Raises `error` without error policy, otherwise the item
+        is recorded as failed (and dead-lettered) and should be dropped by the caller.
+        """
+        if self.on_error is None:
+            raise error
+        self.on_error.fail(self, method, item, error)
+
+    def invoke_batch(self, method: str, batch):
+        """
+        Like ``invoke`` for batch stage methods, a dropped batch becomes an empty batch
+        (keeping its ``batch_id``) and empty batches are passed through without calling the node.
+        """
+        if isinstance(batch, dict) and batch.get("batch_size", None) == 0:
+            return batch
+        out = self.invoke(method, batch)
+        if out is SKIPPED:
+            return empty_batch(batch)
+        return out
+
     @property
     def id(self):
         """
@@ -190,6 +293,31 @@ class Node:
     def batch_size(self, batch_size):
         self._batch_size = batch_size
 
+    def worker_threads(self, default: int) -> int:
+        """Size of the worker pool of the node, `default` unless set by its ResourceConfig"""
+        if self.resources is None or self.resources.threads is None:
+            return default
+        return self.resources.threads
+
+    @property
+    def num_workers(self) -> int:
+        """Threads the node runs besides the flow thread, override in nodes running a worker pool"""
+        return self.worker_threads(0)
+
+    def planned_threads(self) -> int:
+        """Threads used by the node (workers times their library threads), checked by the flow"""
+        library_threads = self.resources.library_threads if self.resources else 1
+        return self.num_workers * library_threads
+
+    def worker_initializer(self):
+        """
+        Initializer of the worker pool of the node, pins every worker to its share of the cpus
+        of its ResourceConfig (library threads are process-wide, applied by the flow)
+        """
+        if self.resources is not None and self.resources.cpus:
+            index = next(self._worker_index)
+            pin_cpus(self.resources.worker_cpus(index, self.num_workers))
+
 
 class Leaf(Node):
     """
@@ -208,6 +336,18 @@ class ConsumerNode(Leaf):
             output of parent nodes, receives metadata produced by parent nodes.
     """
 
+    # the consumer needs the batches in the order they were produced, with
+    # ``Flow(order="unordered")`` they are reordered for it
+    requires_order = False
+    # consuming items again has no effect (e.g. uploads overwriting the same keys), error
+    # policies isolate the items of a failing batch only for idempotent consumers
+    idempotent = False
+
+    @property
+    def _speculative_calls(self) -> bool:
+        # a duplicate call would consume the items twice
+        return self.idempotent
+
     def __init__(self, metadata=False, **kwargs):
         self._metadata = metadata
         super(ConsumerNode, self).__init__(**kwargs)
@@ -402,6 +542,15 @@ class ProcessorNode(Node):
                             by subclass"
         )
 
+    def process_batch_iter(self, batches: Iterable[Any]) -> Iterator[Any]:
+        """
+        Processes a stream of batches, used by the flow in batch mode.
+        By default calls ``process_batch`` on every batch, override to overlap work
+        across batches. Outputs must be yielded in the order of the input batches.
+        """
+        for batch in batches:
+            yield carry_batch_id(batch, self.invoke_batch("process_batch", batch))
+
 
 class ProducerNode(Node):
     """
@@ -413,15 +562,83 @@ class ProducerNode(Node):
         in a multiprocessing setting.
     """
 
-    def __init__(self, *args, **kwargs):
+    # next/next_batch move the producer forward, repeating them would skip inputs,
+    # producers retry the failing input themselves (see ErrorPolicy.call_with_retries)
+    _retry_calls = False
+
+    def __init__(
+        self,
+        *args,
+        shard_index: int = 0,
+        num_shards: int = 1,
+        shard_strategy: str = "hash",
+        **kwargs,
+    ):
+        """
+        - Arguments (keyword only, positional arguments go to ``Node``):
+            - shard_index: index of the shard of the inputs produced by this producer
+            - num_shards: num of shards the inputs are split in, launch one flow per shard \
+                to split the work across machines without coordination
+            - shard_strategy: ``hash`` (stable hash of the input key) or ``range`` \
+                (contiguous range of the sorted inputs)
+        """
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(
+                f"shard_index {shard_index} should be in [0, num_shards={num_shards})"
+            )
+        if shard_strategy not in ("hash", "range"):
+            raise ValueError(
+                f"shard strategy {shard_strategy} should be one of hash, range"
+            )
+        self.shard_index = shard_index
+        self.num_shards = num_shards
+        self.shard_strategy = shard_strategy
         super(ProducerNode, self).__init__(*args, **kwargs)
 
+    def position(self) -> Dict[str, Any]:
+        """
+        Where the producer is in its inputs, recorded as the failed input of a failing
+        ``next`` / ``next_batch`` (e.g. in dead letters). Override it to add the inputs
+        read last, e.g. the file path.
+        """
+        return {}
+
+    def _call_position(self, batch_id):
+        return {"batch_id": batch_id, **self.position()}
+
+    def shard(self, keys: List[str], key=None) -> List[str]:
+        """
+        Returns the input keys (e.g. file paths) belonging to the shard of this producer,
+        `key` maps an input to the value it is sharded by (it should not depend on the machine).
+        """
+        return shard_keys(
+            keys, self.shard_index, self.num_shards, self.shard_strategy, key=key
+        )
+
     def restore(self):
         p = 0
         while p != self.progress:
             self.next()
             p += 1
 
+    def list_work_units(self) -> Iterable[str]:
+        """
+        Returns the work units (e.g. file paths, object keys) this producer would produce
+        from, used by the distributed coordinator. Implement to support distributed runs.
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not support distributed runs"
+        )
+
+    def assign_work_units(self, units: List[str]):
+        """
+        Makes the (opened) producer produce exactly `units` from the start,
+        used by distributed workers for every leased chunk.
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not support distributed runs"
+        )
+
     def next(self) -> any:
         """
         Returns next produced element.
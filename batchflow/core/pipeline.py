@@ -0,0 +1,94 @@
+import queue
+import threading
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+_END = object()
+
+
+class _Failure:
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+def pipeline(
+    items: Iterable[Any],
+    stages: List[Callable[[Any], Any]],
+    depth: int = 2,
+    on_stop: Optional[Callable[[], None]] = None,
+) -> Iterator[Any]:
+    """
+    Runs every item of `items` through `stages` with one thread per stage (and one
+    pulling `items`), so stage k works on item n while stage k+1 works on item n-1.
+
+    Stages are connected by queues of size `depth` which bounds the items in flight,
+    outputs are yielded in input order. An exception raised by `items` or by a stage
+    is re-raised in the caller, closing the generator stops all the threads.
+    `on_stop` is called before joining threads still running, to wake up `items`
+    blocked on a resource the stopped pipeline never gives back (e.g. a memory budget).
+    """
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=depth) for _ in range(len(stages) + 1)]
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def feed():
+        try:
+            for item in items:
+                if not put(queues[0], item):
+                    return
+        except BaseException as e:
+            put(queues[0], _Failure(e))
+            return
+        put(queues[0], _END)
+
+    def work(stage, q_in, q_out):
+        while not stop.is_set():
+            try:
+                item = q_in.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _END or isinstance(item, _Failure):
+                put(q_out, item)
+                return
+            try:
+                out = stage(item)
+            except BaseException as e:
+                put(q_out, _Failure(e))
+                return
+            if not put(q_out, out):
+                return
+
+    threads = [threading.Thread(target=feed, name="pipeline-feed", daemon=True)]
+    for i, stage in enumerate(stages):
+        threads.append(
+            threading.Thread(
+                target=work,
+                args=(stage, queues[i], queues[i + 1]),
+                name=f"pipeline-{getattr(stage, '__name__', i)}",
+                daemon=True,
+            )
+        )
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = queues[-1].get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.exception
+            yield item
+    finally:
+        stop.set()
+        if on_stop is not None and any(thread.is_alive() for thread in threads):
+            on_stop()
+        for thread in threads:
+            thread.join()
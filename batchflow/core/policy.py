@@ -0,0 +1,140 @@
+import threading
+import time
+
+import loguru
+
+from .utils import batch_length, merge_batches, take_batch
+
+logger = loguru.logger
+
+RAISE = "raise"
+SKIP = "skip"
+DEAD_LETTER = "dead_letter"
+ACTIONS = [RAISE, SKIP, DEAD_LETTER]
+
+
+class _Skipped:
+    def __repr__(self):
+        return "SKIPPED"
+
+
+# returned by a node call whose input was dropped by the error policy
+SKIPPED = _Skipped()
+
+
+class ErrorPolicy:
+    """
+    What a node does when a call fails.
+
+    The call is retried `retries` times with exponential backoff, if it still fails:
+        - ``raise``: the error ends the flow (default behaviour without policy)
+        - ``skip``: the failing input is dropped and the flow goes on
+        - ``dead_letter``: like skip, and the failing input is passed to `dead_letter` consumer
+
+    With `isolate_items` a failing batch call is retried item by item, only the failing
+    items are dropped and the outputs of the others are merged back in a batch.
+    A ``consume_batch`` failing partway already consumed some items, it is only retried
+    item by item for consumers declaring it safe with ``idempotent``.
+
+    - Arguments:
+        - action: one of raise, skip, dead_letter
+        - retries: retries of a failing call
+        - backoff: seconds before the first retry, doubled every retry up to `max_backoff`
+        - dead_letter: consumer receiving ``{"node", "method", "error", "item"}`` of failed inputs
+        - isolate_items: retry failing batches item by item
+    """
+
+    def __init__(
+        self,
+        action: str = SKIP,
+        retries: int = 0,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        dead_letter=None,
+        isolate_items: bool = True,
+    ):
+        if action not in ACTIONS:
+            raise ValueError(f"error action {action} should be one of {ACTIONS}")
+        if action == DEAD_LETTER and dead_letter is None:
+            raise ValueError("pass a dead_letter consumer for dead_letter action")
+        self.action = action
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.dead_letter = dead_letter
+        self.isolate_items = isolate_items
+        self._lock = threading.Lock()
+
+    def call_with_retries(self, fn, *args, name=None):
+        attempt = 0
+        while True:
+            try:
+                return fn(*args)
+            except StopIteration:
+                raise
+            except Exception as e:
+                if attempt >= self.retries:
+                    raise e
+                wait = min(self.backoff * (2 ** attempt), self.max_backoff)
+                attempt += 1
+                logger.warning(
+                    f"{name or getattr(fn, '__name__', fn)} failed ({e!r}), retry {attempt}/{self.retries} in {wait}s"
+                )
+                time.sleep(wait)
+
+    def fail(self, node, method, item, error):
+        """Records a failed input of `node`, raises `error` with the raise action"""
+        if self.action == RAISE:
+            raise error
+        with self._lock:
+            node.error_count += 1
+        logger.error(f"{node}.{method} failed, dropping input: {error!r}")
+        if self.action == DEAD_LETTER:
+            with self._lock:
+                self.dead_letter.consume(
+                    {"node": str(node), "method": method, "error": repr(error), "item": item}
+                )
+
+    def run(self, node, method, call, *args, retry=True, position=None):
+        """
+        Calls ``call(method, *args)`` applying the policy, returns SKIPPED if the input is dropped.
+        Pass `retry` False for calls that are not idempotent. For calls without input
+        (producer calls) ``position()`` is recorded as the failed input.
+        """
+        try:
+            if not retry:
+                return call(method, *args)
+            return self.call_with_retries(call, method, *args, name=f"{node}.{method}")
+        except StopIteration:
+            raise
+        except Exception as e:
+            if self.action == RAISE:
+                raise e
+            if args:
+                inp = args[0]
+            else:
+                inp = position() if position is not None else None
+            if (
+                self.isolate_items
+                and method.endswith("_batch")
+                and (method != "consume_batch" or getattr(node, "idempotent", False))
+                and isinstance(inp, dict)
+                and batch_length(inp) > 1
+            ):
+                return self._run_items(node, method, call, inp)
+            self.fail(node, method, inp, e)
+            return SKIPPED
+
+    def _run_items(self, node, method, call, batch):
+        outputs = []
+        for i in range(batch_length(batch)):
+            item = take_batch(batch, [i])
+            try:
+                outputs.append(call(method, item))
+            except Exception as e:
+                self.fail(node, method, item, e)
+        if method == "consume_batch":
+            return None
+        if not outputs:
+            return SKIPPED
+        return merge_batches(outputs)
@@ -0,0 +1,214 @@
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import threading
+from collections import deque
+from typing import Optional
+
+import loguru
+
+from .memory import nbytes
+
+logger = loguru.logger
+
+# record header: num of out of band buffers, pickle length, then the length of every buffer
+_HEADER = struct.Struct("<IQ")
+_LENGTH = struct.Struct("<Q")
+
+
+def write_record(f, obj):
+    """
+    Writes `obj` as a record of the segment log: pickle protocol 5 with numpy arrays
+    (and other buffers) written out of band, as they are, without copies.
+    """
+    buffers = []
+    data = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    raws = [b.raw() for b in buffers]
+    f.write(_HEADER.pack(len(raws), len(data)))
+    for raw in raws:
+        f.write(_LENGTH.pack(raw.nbytes))
+    f.write(data)
+    for raw in raws:
+        f.write(raw)
+    return _HEADER.size + _LENGTH.size * len(raws) + len(data) + sum(r.nbytes for r in raws)
+
+
+def read_record(f):
+    """Reads a record written by ``write_record``, arrays are backed by writable buffers"""
+    num_buffers, length = _HEADER.unpack(f.read(_HEADER.size))
+    sizes = [_LENGTH.unpack(f.read(_LENGTH.size))[0] for _ in range(num_buffers)]
+    data = f.read(length)
+    buffers = []
+    for size in sizes:
+        buffer = bytearray(size)
+        f.readinto(buffer)
+        buffers.append(buffer)
+    return pickle.loads(data, buffers=buffers)
+
+
+class SpillQueue:
+    """
+    FIFO queue of batches between stages holding at most `max_bytes` of batches in memory,
+    batches overflowing the cap are appended to a segment log on local disk and read back
+    in order once the consumer catches up. ``put`` never blocks, a slow consumer costs disk
+    space instead of memory or producer throughput.
+
+    - Arguments:
+        - max_bytes: bytes of batches kept in memory (see ``nbytes``)
+        - spill_dir: directory of the segment log, a temporary directory by default
+        - segment_bytes: size of a segment file, read segments are deleted
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        spill_dir: Optional[str] = None,
+        segment_bytes: int = 64 * 1024 * 1024,
+    ):
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self._spill_dir = spill_dir
+        self._dir = None
+        self._memory = deque()  # (item, size)
+        self._memory_bytes = 0
+        # segments: deque of [path, records written]; the last one is written, the first one read
+        self._segments = deque()
+        self._writer = None
+        self._written = 0
+        self._reader = None
+        self._read = 0
+        self._spilled = 0  # records on disk not read yet
+        self.spilled_batches = 0
+        self.spilled_bytes = 0
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._memory) + self._spilled
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._memory_bytes
+
+    def put(self, item) -> bool:
+        """Queues `item`, returns True if it was spilled to disk"""
+        size = nbytes(item)
+        with self._cond:
+            # once spilling, keep appending to disk until it is drained to keep the order
+            spill = self._spilled > 0 or (
+                self._memory and self._memory_bytes + size > self.max_bytes
+            )
+            if spill:
+                self._spill(item)
+            else:
+                self._memory.append((item, size))
+                self._memory_bytes += size
+            self._cond.notify()
+            return spill
+
+    def get(self):
+        """Returns the oldest item, blocks while the queue is empty"""
+        with self._cond:
+            while not self._memory and not self._spilled:
+                self._cond.wait()
+            if self._memory:
+                item, size = self._memory.popleft()
+                self._memory_bytes -= size
+                return item
+            return self._unspill()
+
+    def _spill(self, item):
+        if self._writer is None or self._written >= self.segment_bytes:
+            self._open_segment()
+        size = write_record(self._writer, item)
+        self._writer.flush()
+        self._written += size
+        self.spilled_bytes += size
+        self._segments[-1][1] += 1
+        self._spilled += 1
+        self.spilled_batches += 1
+        if self.spilled_batches == 1 or self.spilled_batches % 100 == 0:
+            logger.warning(
+                f"Consumer lagging, spilled {self.spilled_batches} batches "
+                f"({self.spilled_bytes} bytes) to {self._dir}"
+            )
+
+    def _open_segment(self):
+        if self._dir is None:
+            if self._spill_dir is not None:
+                os.makedirs(self._spill_dir, exist_ok=True)
+            self._dir = tempfile.mkdtemp(prefix="batchflow-spill-", dir=self._spill_dir)
+        if self._writer is not None:
+            self._writer.close()
+        path = os.path.join(self._dir, f"segment-{self.spilled_batches:012d}.log")
+        self._writer = open(path, "wb")
+        self._written = 0
+        self._segments.append([path, 0])
+
+    def _unspill(self):
+        path, records = self._segments[0]
+        if self._reader is None:
+            self._reader = open(path, "rb")
+            self._read = 0
+        item = read_record(self._reader)
+        self._read += 1
+        self._spilled -= 1
+        writing = len(self._segments) == 1
+        if self._read == records and not writing:
+            # segment fully read and no longer written
+            self._reader.close()
+            self._reader = None
+            os.remove(path)
+            self._segments.popleft()
+        elif self._spilled == 0 and writing:
+            # drained, the next spill starts a new segment
+            self._reader.close()
+            self._reader = None
+            self._writer.close()
+            self._writer = None
+            os.remove(path)
+            self._segments.popleft()
+        return item
+
+    def close(self):
+        """Drops the queued items and removes the segment log"""
+        with self._cond:
+            for f in (self._reader, self._writer):
+                if f is not None:
+                    f.close()
+            self._reader = self._writer = None
+            self._memory.clear()
+            self._memory_bytes = 0
+            self._segments.clear()
+            self._spilled = 0
+            self.spilled_batches = 0
+            self.spilled_bytes = 0
+            if self._dir is not None:
+                shutil.rmtree(self._dir, ignore_errors=True)
+                self._dir = None
+
+
+class ReorderBuffer:
+    """
+    Puts items completed out of order back in sequence order: ``push`` returns the items
+    that are ready, in order. Sequence numbers start at `start` and have no gaps.
+    """
+
+    def __init__(self, start: int = 0):
+        self.next_seq = start
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def push(self, seq: int, item) -> list:
+        if seq < self.next_seq or seq in self._pending:
+            raise ValueError(f"sequence number {seq} was already pushed")
+        self._pending[seq] = item
+        ready = []
+        while self.next_seq in self._pending:
+            ready.append(self._pending.pop(self.next_seq))
+            self.next_seq += 1
+        return ready
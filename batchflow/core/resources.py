@@ -0,0 +1,173 @@
+import os
+from typing import Iterable, List, Optional
+
+import loguru
+
+logger = loguru.logger
+
+# thread pools of the BLAS / OpenMP libraries, read when the library is loaded
+BLAS_ENV_VARS = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+]
+
+
+def available_cpus() -> int:
+    """Returns num of cpus this process may run on (its affinity, cgroup cpusets included)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def set_library_threads(cv2_threads: Optional[int] = None, blas_threads: Optional[int] = None):
+    """
+    Limits the internal thread pools of OpenCV and BLAS libraries of the current process.
+    BLAS limits are set through threadpoolctl when installed, and in the environment
+    so they apply to libraries loaded later and to child processes.
+    The limits are process-wide: call it from the main thread before starting thread pools.
+    """
+    if cv2_threads is not None:
+        import cv2
+
+        cv2.setNumThreads(cv2_threads)
+    if blas_threads is not None:
+        for var in BLAS_ENV_VARS:
+            os.environ[var] = str(blas_threads)
+        try:
+            from threadpoolctl import threadpool_limits
+        except ImportError:
+            pass
+        else:
+            threadpool_limits(blas_threads)
+
+
+def pin_cpus(cpus: Iterable[int]):
+    """
+    Pins the calling thread to `cpus` (on linux ``sched_setaffinity`` of pid 0 applies to the
+    calling thread, threads started afterwards inherit it)
+    """
+    if not hasattr(os, "sched_setaffinity"):
+        logger.warning("CPU pinning is not supported on this platform, ignoring")
+        return
+    os.sched_setaffinity(0, set(cpus))
+
+
+class ResourceConfig:
+    """
+    Threads and cpus used by a flow or a node.
+
+    On a flow it applies to the whole process at open: library threads and cpu pinning,
+    and the flow checks that the threads of all the nodes fit the cpus.
+    On a node it sets the size of the worker pool of the node (e.g. decode threads of a reader,
+    upload threads) and splits its `cpus` between the workers.
+
+    Library threads are process-wide (OpenCV and BLAS have one thread pool per process):
+    the flow applies them once from the main thread at open, nodes asking for different
+    values than the flow or other nodes are warned about and the last one applied wins.
+
+    - Arguments:
+        - threads: worker threads of the node, the node default when None
+        - cv2_threads: OpenCV threads of the process (``cv2.setNumThreads``), 1 is best when
+          nodes already run several workers
+        - blas_threads: BLAS / OpenMP threads of the process
+        - cpus: cpu ids to pin the process (flow) to, or split between the workers (node)
+    """
+
+    def __init__(
+        self,
+        threads: Optional[int] = None,
+        cv2_threads: Optional[int] = None,
+        blas_threads: Optional[int] = None,
+        cpus: Optional[List[int]] = None,
+    ):
+        if threads is not None and threads < 1:
+            raise ValueError(f"threads should be >= 1, got {threads}")
+        self.threads = threads
+        self.cv2_threads = cv2_threads
+        self.blas_threads = blas_threads
+        self.cpus = list(cpus) if cpus is not None else None
+
+    @property
+    def library_threads(self) -> int:
+        """threads a worker may use in libraries, 1 if not limited (counted as the worker itself)"""
+        return max(self.cv2_threads or 1, self.blas_threads or 1)
+
+    @property
+    def sets_library_threads(self) -> bool:
+        return self.cv2_threads is not None or self.blas_threads is not None
+
+    def apply_library_threads(self):
+        """Applies the library threads to the process, from the main thread"""
+        set_library_threads(self.cv2_threads, self.blas_threads)
+
+    def apply(self):
+        """Applies the library threads and cpu pinning to the process, from the main thread"""
+        self.apply_library_threads()
+        if self.cpus is not None:
+            pin_cpus(self.cpus)
+
+    def worker_cpus(self, index: int, workers: int) -> List[int]:
+        """
+        Share of `cpus` of the worker `index` of `workers`: contiguous slices of the cpus,
+        or one cpu per worker (round robin) when there are more workers than cpus
+        """
+        if workers <= 1 or not self.cpus:
+            return list(self.cpus or [])
+        index %= workers
+        if workers >= len(self.cpus):
+            return [self.cpus[index % len(self.cpus)]]
+        bounds = [len(self.cpus) * i // workers for i in range(workers + 1)]
+        return self.cpus[bounds[index] : bounds[index + 1]]
+
+    def initializer(self):
+        """
+        Worker initializer of process pools: ``ProcessPoolExecutor(initializer=cfg.initializer)``,
+        every process gets the library threads and the cpus
+        """
+        self.apply()
+
+
+def apply_library_threads(flow_resources: Optional[ResourceConfig], nodes):
+    """
+    Applies the library threads of the flow and of the `nodes` to the process (from the main
+    thread, before the worker pools start), warns when they ask for different values
+    """
+    configs = [(str(node), node.resources) for node in nodes if node.resources is not None]
+    if flow_resources is not None:
+        configs.insert(0, ("flow", flow_resources))
+    configs = [(name, cfg) for name, cfg in configs if cfg.sets_library_threads]
+    values = {name: (cfg.cv2_threads, cfg.blas_threads) for name, cfg in configs}
+    if len(set(values.values())) > 1:
+        logger.warning(
+            f"Library threads (cv2, blas) are process-wide, got different values {values}, "
+            f"{configs[-1][0]} applies last"
+        )
+    for _, cfg in configs:
+        cfg.apply_library_threads()
+
+
+def check_threads(
+    nodes, cpus: Optional[int] = None, strict: bool = False, flow_threads: int = 1
+) -> int:
+    """
+    Sums the threads planned by `nodes` (``Node.planned_threads``) and the `flow_threads`
+    running the nodes, warns (raises ValueError if `strict`) when they exceed `cpus`,
+    the available cpus by default. Returns the total.
+    """
+    cpus = cpus or available_cpus()
+    planned = {str(node): node.planned_threads() for node in nodes}
+    total = flow_threads + sum(planned.values())
+    if total > cpus:
+        message = (
+            f"Flow plans {total} threads on {cpus} cpus {planned}, "
+            f"limit the node threads with ResourceConfig to avoid oversubscription"
+        )
+        if strict:
+            raise ValueError(message)
+        logger.warning(message)
+    else:
+        logger.info(f"Flow plans {total} threads on {cpus} cpus")
+    return total
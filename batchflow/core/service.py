@@ -0,0 +1,198 @@
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional
+
+import loguru
+
+from batchflow.errors import ItemDropped
+
+from .utils import batch_length, split_batch, stack_items
+
+logger = loguru.logger
+
+# per item key tagging submitted items to map the outputs back to their futures
+SERVICE_ID = "_service_id"
+
+_STOP = object()
+
+
+class FlowService:
+    """
+    Keeps the processors and consumers of a flow open and warm, and runs the items
+    submitted by callers through them. Items submitted at about the same time (by any
+    threads) are batched together into ``process_batch`` / ``consume_batch`` calls.
+
+    The producers of the flow are not used, submitted items take their place and should
+    look like the items they produce (e.g. ``{"image": ..., "filename": ...}``).
+
+    .. code-block:: python
+
+        with FlowService(flow, max_batch_size=16) as service:
+            future = service.submit({"image": image, "filename": "a.jpg"})
+            out = future.result()
+
+    - Arguments:
+        - flow: flow whose processors and consumers serve the items
+        - max_batch_size: max items per batch, the flow batch size by default
+        - max_wait: seconds to wait for more items after the first of a batch
+        - max_pending: max submitted items waiting, submit blocks above it (0 for unbounded)
+    """
+
+    def __init__(
+        self,
+        flow,
+        max_batch_size: Optional[int] = None,
+        max_wait: float = 0.005,
+        max_pending: int = 0,
+    ):
+        self.flow = flow
+        self.max_batch_size = max_batch_size or max(flow.batch_size, 1)
+        self.max_wait = max_wait
+        self._queue = queue.Queue(max_pending)
+        self._ids = itertools.count()
+        self._thread = None
+        self._running = False
+        self._lock = threading.Lock()
+        # submitters putting to the queue, which may block while it is full
+        self._submitting = 0
+        self._submitted = threading.Condition(self._lock)
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return self
+            self.flow.setup()
+            self.flow.open(producers=False)
+            self._running = True
+            self._thread = threading.Thread(
+                target=self._serve, name="flow-service", daemon=True
+            )
+            self._thread.start()
+        logger.info(f"FlowService started, max batch size {self.max_batch_size}")
+        return self
+
+    def stop(self):
+        """Stops accepting items, processes the pending ones and closes the nodes"""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+        # not under the lock, the queue may be full until the serving thread gets items
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        self._fail_pending()
+        self.flow.close(producers=False)
+        logger.info("FlowService stopped")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def submit(self, item: dict) -> Future:
+        """
+        Queues `item`, returns a future of the item output by the processors
+        (once the consumers consumed it)
+        """
+        future = Future()
+        with self._lock:
+            if not self._running:
+                raise RuntimeError("FlowService is not running, call start()")
+            self._submitting += 1
+        try:
+            # blocks while max_pending items are waiting, without blocking the other callers
+            self._queue.put((next(self._ids), item, future))
+        finally:
+            with self._lock:
+                self._submitting -= 1
+                self._submitted.notify_all()
+        return future
+
+    def _fail_pending(self):
+        """Fails the items submitted after the stop, once the submitters blocked on the queue put them"""
+        with self._lock:
+            while True:
+                done = self._submitting == 0
+                while True:
+                    try:
+                        request = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if request is not _STOP:
+                        request[2].set_exception(RuntimeError("FlowService stopped"))
+                if done:
+                    return
+                self._submitted.wait(0.01)
+
+    def _next_requests(self):
+        """Blocks for the first request, then gathers more for up to `max_wait`"""
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        requests = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(requests) < self.max_batch_size:
+            try:
+                request = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if request is _STOP:
+                # serve what was gathered, then stop
+                self._queue.put(_STOP)
+                break
+            requests.append(request)
+        return requests
+
+    def _serve(self):
+        while True:
+            requests = self._next_requests()
+            if requests is None:
+                return
+            futures = {}
+            items = []
+            for request_id, item, future in requests:
+                if future.set_running_or_notify_cancel():
+                    futures[request_id] = future
+                    items.append({**item, SERVICE_ID: request_id})
+            if not items:
+                continue
+            try:
+                self._resolve(futures, self._process(stack_items(items)))
+            except Exception as e:
+                logger.error(f"FlowService batch of {len(items)} items failed: {e!r}")
+                for future in futures.values():
+                    future.set_exception(e)
+
+    def _process(self, batch):
+        for proc_data in self.flow.processors:
+            batch = proc_data[0].invoke_batch("process_batch", batch)
+        if batch_length(batch) > 0:
+            consumed = {k: v for k, v in batch.items() if k != SERVICE_ID}
+            for con_data in self.flow.consumers:
+                con_data[0].invoke("consume_batch", consumed)
+        return batch
+
+    @staticmethod
+    def _resolve(futures, batch):
+        outputs = split_batch(batch) if batch_length(batch) > 0 else []
+        if outputs and SERVICE_ID not in outputs[0]:
+            if len(outputs) != len(futures):
+                raise ValueError(
+                    f"processors dropped {SERVICE_ID} and items, outputs can not be matched"
+                )
+            # the key was dropped by a processor but the items are in order
+            outputs = [
+                {**out, SERVICE_ID: request_id}
+                for out, request_id in zip(outputs, futures)
+            ]
+        for out in outputs:
+            future = futures.pop(out.pop(SERVICE_ID), None)
+            if future is not None:
+                future.set_result(out)
+        for future in futures.values():
+            future.set_exception(ItemDropped("item dropped by the flow error policy"))
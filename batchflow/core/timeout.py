@@ -0,0 +1,198 @@
+import queue
+import threading
+import time
+from collections import deque
+
+import loguru
+import numpy as np
+
+from batchflow.errors import NodeTimeout
+
+logger = loguru.logger
+
+
+class _CallThreads:
+    """
+    Persistent daemon threads running the calls of a node, so thread local state of the node
+    (e.g. API clients) is kept across calls. Calls are taken in submission order.
+    """
+
+    def __init__(self, name: str, threads: int):
+        self.threads = threads
+        self._tasks = queue.Queue()
+        for i in range(threads):
+            threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True).start()
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            task()
+
+    def submit(self, task):
+        self._tasks.put(task)
+
+    def close(self):
+        """Stops the threads once their current call (if any) returns"""
+        for _ in range(self.threads):
+            self._tasks.put(None)
+
+
+class TimeoutPolicy:
+    """
+    Time limits of the calls of a node.
+
+    Calls run in daemon threads of the node (kept across calls) so the flow stops waiting
+    for them:
+        - past `soft` seconds a warning is logged
+        - past `hard` seconds ``NodeTimeout`` is raised (handled by the error policy of the
+          node like any error), python can not kill threads so the hung call is abandoned
+        - with `speculative`, once a call takes longer than the `percentile` latency of the
+          previous calls a duplicate call is launched and the first one to finish wins.
+          Only use it for idempotent nodes, producers and consumers (unless ``idempotent``)
+          are never speculated.
+
+    Every thread calling a node gets its own call threads for it. Calls that are not
+    speculated run in a single thread and never overlap: after a hard timeout the next calls
+    wait for the abandoned one, and time out as well while it hangs, instead of changing the
+    state of the node (e.g. the position of a producer) concurrently.
+
+    - Arguments:
+        - soft: seconds before warning about a slow call
+        - hard: seconds before giving up a call
+        - speculative: launch a duplicate of straggling calls
+        - percentile: latency percentile (of the last `window` calls) triggering the duplicate
+        - min_samples: calls measured before speculating
+    """
+
+    def __init__(
+        self,
+        soft: float = None,
+        hard: float = None,
+        speculative: bool = False,
+        percentile: float = 95,
+        min_samples: int = 20,
+        window: int = 200,
+    ):
+        if soft is not None and hard is not None and soft > hard:
+            raise ValueError(f"soft timeout {soft} should be <= hard timeout {hard}")
+        self.soft = soft
+        self.hard = hard
+        self.speculative = speculative
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self.speculated = 0
+        self.speculation_wins = 0
+        self._latencies = {}
+        self._lock = threading.Lock()
+        # call threads by (node, calling thread)
+        self._threads = {}
+
+    def _record(self, method, latency):
+        with self._lock:
+            if method not in self._latencies:
+                self._latencies[method] = deque(maxlen=self.window)
+            self._latencies[method].append(latency)
+
+    def speculation_threshold(self, method):
+        """seconds after which a call of `method` is duplicated, None until enough calls are measured"""
+        with self._lock:
+            latencies = self._latencies.get(method, ())
+            if len(latencies) < self.min_samples:
+                return None
+            return float(np.percentile(latencies, self.percentile))
+
+    def _call_threads(self, key, node, speculative) -> _CallThreads:
+        with self._lock:
+            threads = self._threads.get(key)
+            if threads is None:
+                # a straggler and its duplicate
+                threads = _CallThreads(str(node), 2 if speculative else 1)
+                self._threads[key] = threads
+            return threads
+
+    def _abandon(self, key, threads: _CallThreads):
+        """New calls of a speculated node get new threads, the hung call keeps its thread"""
+        if threads.threads == 1:
+            return
+        with self._lock:
+            if self._threads.get(key) is threads:
+                del self._threads[key]
+        threads.close()
+
+    def close(self, node=None):
+        """Stops the call threads of `node` (of all the nodes by default), used at flow close"""
+        with self._lock:
+            keys = [k for k in self._threads if node is None or k[0] is node]
+            closed = [self._threads.pop(k) for k in keys]
+        for threads in closed:
+            threads.close()
+
+    def run(self, node, method, fn, *args, speculative=True):
+        """Calls ``fn(*args)`` within the time limits, `speculative` False disables duplicates"""
+        speculative = speculative and self.speculative
+        key = (node, threading.get_ident())
+        threads = self._call_threads(key, node, speculative)
+        results = queue.Queue()
+        abandoned = threading.Event()
+
+        def attempt(i):
+            if abandoned.is_set():
+                # timed out waiting for its thread, never started
+                return
+            try:
+                results.put((i, True, fn(*args)))
+            except BaseException as e:
+                results.put((i, False, e))
+
+        def launch(i):
+            threads.submit(lambda: attempt(i))
+
+        start = time.monotonic()
+        launch(0)
+        running = 1
+        threshold = self.speculation_threshold(method) if speculative else None
+        warned = False
+        while True:
+            elapsed = time.monotonic() - start
+            deadlines = [
+                d
+                for d in (None if warned else self.soft, self.hard, threshold)
+                if d is not None
+            ]
+            wait = max(min(deadlines) - elapsed, 0) if deadlines else None
+            try:
+                i, ok, out = results.get(timeout=wait)
+            except queue.Empty:
+                elapsed = time.monotonic() - start
+                if self.hard is not None and elapsed >= self.hard:
+                    abandoned.set()
+                    self._abandon(key, threads)
+                    raise NodeTimeout(
+                        f"{node}.{method} did not finish in {self.hard}s, abandoning it"
+                    )
+                if not warned and self.soft is not None and elapsed >= self.soft:
+                    warned = True
+                    logger.warning(f"{node}.{method} is running for {elapsed:.1f}s")
+                if threshold is not None and elapsed >= threshold:
+                    logger.debug(
+                        f"{node}.{method} straggling ({elapsed:.2f}s > p{self.percentile} {threshold:.2f}s), speculating"
+                    )
+                    with self._lock:
+                        self.speculated += 1
+                    threshold = None
+                    launch(1)
+                    running += 1
+                continue
+
+            running -= 1
+            if ok:
+                self._record(method, time.monotonic() - start)
+                if i > 0:
+                    with self._lock:
+                        self.speculation_wins += 1
+                return out
+            if running == 0:
+                raise out
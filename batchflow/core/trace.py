@@ -0,0 +1,67 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import loguru
+
+logger = loguru.logger
+
+
+class ChromeTracer:
+    """
+    Records spans of node calls and writes them as a Chrome Trace Event file,
+    open it in chrome://tracing or https://ui.perfetto.dev
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._events = []
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._t0 = time.perf_counter()
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self._t0) * 1e6
+
+    @contextmanager
+    def span(self, name: str, node, batch_id=None):
+        thread = threading.current_thread()
+        start = self._now_us()
+        try:
+            yield
+        finally:
+            event = {
+                "name": f"{node}.{name}",
+                "cat": node.__class__.__name__,
+                "ph": "X",
+                "ts": start,
+                "dur": self._now_us() - start,
+                "pid": self._pid,
+                "tid": thread.ident,
+                "args": {"node": str(node), "batch_id": batch_id},
+            }
+            # list.append is atomic, the lock only guards the thread names
+            self._events.append(event)
+            if thread.ident not in self._threads:
+                with self._lock:
+                    self._threads[thread.ident] = thread.name
+
+    def save(self):
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": self._pid,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in self._threads.items()
+        ]
+        with open(self.path, "w") as f:
+            json.dump(
+                {"traceEvents": metadata + self._events, "displayTimeUnit": "ms"}, f
+            )
+        logger.info(f"Saved {len(self._events)} trace events to {self.path}")
@@ -1,5 +1,8 @@
+import zlib
 from collections.abc import Iterable
 
+import numpy as np
+
 
 def flatten(items):
     """Returns flattened iterable from any nested iterable"""
@@ -13,6 +16,121 @@ def flatten(items):
     return to_return
 
 
+def batch_length(batch):
+    """Returns number of items in a batch dict"""
+    if "batch_size" in batch:
+        return batch["batch_size"]
+    for value in batch.values():
+        if isinstance(value, (list, tuple, np.ndarray)):
+            return len(value)
+    return 0
+
+
+def split_batch(batch):
+    """
+    Splits a batch dict of lists (as produced by ``next_batch``) into a list of item dicts.
+    Values that are not per item (e.g. `batch_size`) are dropped.
+    """
+    n = batch_length(batch)
+    keys = [
+        k
+        for k, v in batch.items()
+        if isinstance(v, (list, tuple, np.ndarray)) and len(v) == n
+    ]
+    return [{k: batch[k][i] for k in keys} for i in range(n)]
+
+
+def stack_items(items):
+    """Builds a batch dict of lists from item dicts, the inverse of ``split_batch``"""
+    batch = {k: [item[k] for item in items] for k in items[0]} if items else {}
+    batch["batch_size"] = len(items)
+    return batch
+
+
+def _is_item_values(value, n):
+    return isinstance(value, (list, tuple, np.ndarray)) and len(value) == n
+
+
+def take_batch(batch, indices):
+    """
+    Returns a batch with the items at `indices` of `batch`, per item values keep their
+    type (lists stay lists, arrays are indexed). Other values are copied as they are.
+    """
+    n = batch_length(batch)
+    out = {}
+    for k, v in batch.items():
+        if _is_item_values(v, n):
+            if isinstance(v, np.ndarray):
+                out[k] = v[list(indices)]
+            else:
+                out[k] = type(v)(v[i] for i in indices)
+        else:
+            out[k] = v
+    out["batch_size"] = len(indices)
+    return out
+
+
+def merge_batches(batches):
+    """
+    Concatenates the per item values of `batches` into one batch, the other values
+    (e.g. ``batch_id``) are taken from the first batch.
+    """
+    batches = [b for b in batches if b is not None]
+    if not batches:
+        return None
+    lengths = [batch_length(b) for b in batches]
+    out = {}
+    for k, v in batches[0].items():
+        if _is_item_values(v, lengths[0]):
+            values = [b[k] for b in batches]
+            if isinstance(v, np.ndarray):
+                out[k] = np.concatenate(values)
+            else:
+                out[k] = type(v)(x for value in values for x in value)
+        else:
+            out[k] = v
+    if "batch_size" in out:
+        out["batch_size"] = sum(lengths)
+    return out
+
+
+def empty_batch(batch):
+    """Returns `batch` with all its items removed"""
+    if not isinstance(batch, dict):
+        return {"batch_size": 0}
+    return take_batch(batch, [])
+
+
+def shard_of(key: str, num_shards: int) -> int:
+    """Returns the shard of `key`, a stable hash so every process agrees on it"""
+    return zlib.crc32(str(key).encode("utf-8")) % num_shards
+
+
+def shard_keys(
+    keys, shard_index: int, num_shards: int, strategy: str = "hash", key=None
+):
+    """
+    Returns the keys belonging to shard `shard_index` of `num_shards`, every key
+    goes to exactly one shard.
+
+    - Arguments:
+        - strategy: ``hash`` assigns keys by a stable hash, ``range`` splits \
+            the sorted keys into contiguous ranges of (almost) equal size.
+        - key: function returning the value to shard an element of `keys` by, \
+            the element itself by default.
+    """
+    if num_shards == 1:
+        return list(keys)
+    key = key or str
+    if strategy == "hash":
+        return [k for k in keys if shard_of(key(k), num_shards) == shard_index]
+    elif strategy == "range":
+        keys = sorted(keys, key=key)
+        n = len(keys)
+        return keys[shard_index * n // num_shards : (shard_index + 1) * n // num_shards]
+    raise ValueError(f"shard strategy {strategy} should be one of hash, range")
+
+
 def _has_cycle_util(v, visited, rec):
     """
     - Arguments:
@@ -1,18 +1,80 @@
+import os
+
 import loguru
 
 logger = loguru.logger
 
+import functools
+import itertools
 import time
 
+# log_time can be turned off (BATCHFLOW_LOG_TIME=0) or sampled (log every Nth call)
+_time_enabled = os.getenv("BATCHFLOW_LOG_TIME", "1") != "0"
+_time_sample = int(os.getenv("BATCHFLOW_LOG_TIME_SAMPLE", "1"))
+
+# sample rate for functions called once per item / batch
+HOT_PATH_SAMPLE = 100
+
+
+def set_time_logging(enabled: bool = True, sample: int = None):
+    """
+    Enables / disables `log_time` at runtime and sets the default sample rate
+    of decorated functions that do not set their own.
+    """
+    global _time_enabled, _time_sample
+    _time_enabled = enabled
+    if sample is not None:
+        _time_sample = sample
+
+
+def time_logging_enabled() -> bool:
+    return _time_enabled
+
+
+def log_time(func=None, *, sample: int = None):
+    """
+    Logs run time of the function at TIME level.
 
-def log_time(func):
-    def log_time(*args, **kwargs):
-        t1 = time.time()
+    Can be used as ``@log_time`` or ``@log_time(sample=N)`` to time and log only
+    every Nth call, calls that are not sampled cost a counter increment. When
+    disabled with `set_time_logging` the function is called directly.
+    """
+    if func is None:
+        return functools.partial(log_time, sample=sample)
+
+    counter = itertools.count()
+    name = f"{func.__module__}:{func.__name__}"
+
+    @functools.wraps(func)
+    def timed(*args, **kwargs):
+        if not _time_enabled:
+            return func(*args, **kwargs)
+        n = sample if sample is not None else _time_sample
+        if n > 1 and next(counter) % n:
+            return func(*args, **kwargs)
+
+        t1 = time.perf_counter()
         r = func(*args, **kwargs)
+        # message is formatted by loguru only if a handler accepts TIME level
         logger.log(
             "TIME",
-            f"function {func.__module__}:{func.__name__} took run time: {time.time()-t1} sec",
+            "function {} took run time: {} sec{}",
+            name,
+            time.perf_counter() - t1,
+            f" (sampled 1/{n})" if n > 1 else "",
         )
         return r
 
-    return log_time
+    return timed
+
+
+_warned = set()
+
+
+def warn_once(message: str, key=None):
+    """Logs `message` as warning only the first time it is seen (or the first time for `key`)"""
+    key = message if key is None else key
+    if key in _warned:
+        return
+    _warned.add(key)
+    logger.opt(depth=1).warning(message)
@@ -1,2 +1,14 @@
 class StorageFileNotFound(Exception):
     pass
+
+
+class StorageUploadFailed(Exception):
+    pass
+
+
+class NodeTimeout(Exception):
+    pass
+
+
+class ItemDropped(Exception):
+    pass
@@ -1,10 +1,16 @@
-from typing import Any, Dict, List
+import functools
+import os
+from typing import Any, Dict, Iterable, Iterator, List
 
 import numpy as np
 
-from batchflow.core.node import ProcessorNode
+from batchflow.core.node import ProcessorNode, carry_batch_id
+from batchflow.core.pipeline import pipeline
+from batchflow.decorators import warn_once
+from batchflow.processors.registry import get_model
 from batchflow.storage import get_storage
 from batchflow.storage.base import BaseStorage
+from batchflow.storage.utils import fetch_file
 
 
 class ModelProcessor(ProcessorNode):
@@ -12,13 +18,26 @@ class ModelProcessor(ProcessorNode):
         self,
         model_path: str = None,
         model_source: Dict[str, str] = None,
+        lazy: bool = False,
+        pipeline_depth: int = 0,
         *args,
         **kwargs,
     ) -> None:
         """
         model_path: Model Path
+        lazy: resolve (download) model_path in open() instead of the constructor
+        model: subclasses implement load_model(model_path), the model is loaded in open()
+            through the per process model registry, one instance per (path, device, load_model),
+            processors sharing a load_model implementation share the model.
+            Call preload() in the parent process before starting workers to share the
+            weights copy-on-write.
+        pipeline_depth: if > 0, in batch mode preprocess, predict and postprocess run
+            in their own threads overlapping across batches, with at most `pipeline_depth`
+            batches queued between phases. Requires the three phases to work on whole
+            batches, process_batch is not called.
         model_source:
-            source: S3 / backblaze / gdrive
+            source: s3 / backblaze / gdrive
+            sha256: str optional sha256 hex digest, download is verified against it
 
             =================================
                        BackBlaze
@@ -29,36 +48,138 @@ class ModelProcessor(ProcessorNode):
                 bucket_name: str Name of the Bucket
                 key: str Key to the target file
                 filename: str local filepath with name after download
+
+            =================================
+                           S3
+            =================================
+
+            model_source:
+                source: str s3
+                bucket_name: str Name of the Bucket
+                key: str Key to the target file
+                filename: str local filepath with name after download
         """
         super().__init__(*args, **kwargs)
-        if model_path is not None:
-            self.model_path = model_path
-        elif model_source is not None:
+        self.model_path = model_path
+        self.model_source = model_source
+        if model_path is None and model_source is not None and not lazy:
             self.model_path = self.download_model(model_source)
         self.model = None
+        self.pipeline_depth = pipeline_depth
+
+    def _resolve_model_path(self):
+        if self.model_path is None and self.model_source is not None:
+            self.model_path = self.download_model(self.model_source)
+        return self.model_path
+
+    def load_model(self, model_path: str) -> Any:
+        """
+        Override to load and return the model from `model_path`, for numpy weights
+        `batchflow.processors.registry.map_weights` maps them read-only.
+        Returns None by default (model loaded by the subclass itself).
+        """
+        return None
+
+    def preload(self):
+        """
+        Loads the model in the model registry of this process, call it in the parent
+        before forking workers so they all share the same weights pages.
+        """
+        model_path = self._resolve_model_path()
+        if self.model is None and model_path is not None:
+            load_model = type(self).load_model
+            self.model = get_model(
+                model_path,
+                self.device_type,
+                lambda: self.load_model(model_path),
+                loader_name=f"{load_model.__module__}.{load_model.__qualname__}",
+            )
+        return self.model
+
+    @property
+    def num_workers(self):
+        # preprocess, predict and postprocess run in their own threads when pipelined
+        return 3 if self.pipeline_depth > 0 else self.worker_threads(0)
+
+    def open(self):
+        self.preload()
 
     def preprocess(self, image: np.asarray):
-        self._logger.warning(f"No preprocessing applied passed input image as it is")
+        warn_once(
+            f"{self}: No preprocessing applied passed input image as it is",
+            key=(self.id, "preprocess"),
+        )
         return image
 
     def postprocess(self, input: Any):
-        self._logger.warning(f"No post processing applied passed input as it is")
+        warn_once(
+            f"{self}: No post processing applied passed input as it is",
+            key=(self.id, "postprocess"),
+        )
         return input
 
     def predict(self, input: Any):
         raise NotImplemented("Implement this to predict model output in subclass")
 
+    def process_batch(self, inp: Any) -> Any:
+        return self.postprocess(self.predict(self.preprocess(inp)))
+
+    def _invoke_stage(self, method, batch):
+        return carry_batch_id(batch, self.invoke_batch(method, batch))
+
+    def process_batch_iter(self, batches: Iterable[Any]) -> Iterator[Any]:
+        if self.pipeline_depth <= 0:
+            yield from super().process_batch_iter(batches)
+        else:
+            stages = [
+                functools.partial(self._invoke_stage, "preprocess"),
+                functools.partial(self._invoke_stage, "predict"),
+                functools.partial(self._invoke_stage, "postprocess"),
+            ]
+            budget = self.memory_budget
+            yield from pipeline(
+                batches,
+                stages,
+                depth=self.pipeline_depth,
+                # the producers may wait for memory the stopped flow never releases
+                on_stop=budget.interrupt if budget is not None else None,
+            )
+
     def download_model(self, model_source: Dict[str, str]) -> str:
+        """
+        Downloads the model once per host, safe to call from many worker processes at once.
+        The first process downloads to a temp file (B2 and S3 fetch large files in parallel
+        ranges), verifies the checksum and renames it into place, the others wait and reuse it.
+        """
         source: str = model_source["source"].lower()
+        checksum = model_source.get("sha256", None)
         if source == "backblaze":
             bucket_name = model_source["bucket_name"]
 
-            storage: BaseStorage = get_storage("backblaze", bucket_name=bucket_name)
+            storage: BaseStorage = get_storage(
+                "backblaze", bucket_name=bucket_name, check_download_hash=True
+            )
             storage.authenticate()
 
             model_key: str = model_source["key"]
             filename: str = model_source["filename"]
-            model_path = storage.download(key=model_key, output=filename)
+            model_path = fetch_file(
+                filename,
+                lambda temp_path: storage.download(key=model_key, output=temp_path),
+                checksum=checksum,
+            )
+        elif source == "s3":
+            storage: BaseStorage = get_storage(
+                "s3", bucket_name=model_source["bucket_name"]
+            )
+
+            model_key: str = model_source["key"]
+            filename: str = model_source["filename"]
+            model_path = fetch_file(
+                filename,
+                lambda temp_path: storage.download(key=model_key, output=temp_path),
+                checksum=checksum,
+            )
         elif source == "gdrive":
             storage: BaseStorage = get_storage("gdrive")
             storage.authenticate()
@@ -66,7 +187,12 @@ class ModelProcessor(ProcessorNode):
             id = model_source.get("id", None)
             url = model_source.get("url", None)
             filename: str = model_source.get("filename")
-            model_path = storage.download(id=id, url=url, filename=filename)
+            # absolute temp path, it is not joined to the download root
+            model_path = fetch_file(
+                os.path.join(storage.get_download_root(), filename),
+                lambda temp_path: storage.download(id=id, url=url, filename=temp_path),
+                checksum=checksum,
+            )
         else:
             raise Exception(f"Storage {source} not supported for model download")
 
@@ -0,0 +1,366 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+from batchflow.core.node import ProcessorNode
+
+INTERPOLATIONS = {
+    "nearest": cv2.INTER_NEAREST,
+    "linear": cv2.INTER_LINEAR,
+    "area": cv2.INTER_AREA,
+    "cubic": cv2.INTER_CUBIC,
+}
+
+
+def stack_images(images: Union[np.ndarray, List[np.ndarray]]) -> np.ndarray:
+    """Returns the images of a batch as one (N, ...) array, images should have the same shape"""
+    if isinstance(images, np.ndarray):
+        return images
+    shapes = {image.shape for image in images}
+    if len(shapes) > 1:
+        raise ValueError(
+            f"images of different shapes {shapes} can not be stacked, resize them first"
+        )
+    return np.stack(images)
+
+
+def batch_spec(images) -> Tuple[Tuple[int, ...], Any]:
+    """Returns (shape, dtype) of the stacked images without stacking them"""
+    if isinstance(images, np.ndarray):
+        return images.shape, images.dtype
+    shapes = {image.shape for image in images}
+    if len(shapes) > 1:
+        raise ValueError(
+            f"images of different shapes {shapes} can not be stacked, resize them first"
+        )
+    return (len(images),) + images[0].shape, images[0].dtype
+
+
+class ImageBatchProcessor(ProcessorNode):
+    def __init__(
+        self,
+        key: str = "image",
+        out_key: Optional[str] = None,
+        workers: int = 0,
+        *args,
+        **kwargs,
+    ):
+        """
+        Base of the vectorized image processors: transforms all the images of a batch at once
+        into one preallocated (N, ...) output array, split in chunks over `workers` threads
+        (numpy and OpenCV release the GIL).
+
+        Subclasses implement `output_spec` and `transform_chunk`, which writes the transformed
+        images of a chunk into its slice of the output in place.
+
+        Args:
+            key (str, optional): key of the images in the batch. Defaults to "image".
+            out_key (Optional[str], optional): key of the output images, defaults to `key`.
+            workers (int, optional): threads transforming chunks of the batch, 0 to transform
+                in the calling thread. A ResourceConfig `threads` overrides it. Defaults to 0.
+        """
+        super().__init__(*args, **kwargs)
+        self.key = key
+        self.out_key = out_key or key
+        self.workers = workers
+        self._executor = None
+        # key of the per image metadata returned by transform_chunk, if any
+        self.meta_key = None
+
+    @property
+    def num_workers(self):
+        return self.worker_threads(self.workers)
+
+    def open(self):
+        if self.num_workers > 1:
+            self._executor = ThreadPoolExecutor(
+                self.num_workers,
+                thread_name_prefix=str(self),
+                initializer=self.worker_initializer,
+            )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def output_spec(self, images) -> Tuple[Tuple[int, ...], Any]:
+        """Returns (shape, dtype) of the output of `images`"""
+        raise NotImplementedError("Implement this method in subclass")
+
+    def transform_chunk(self, images, out: np.ndarray) -> Optional[List[Any]]:
+        """Writes the transformed `images` into `out`, may return per image metadata"""
+        raise NotImplementedError("Implement this method in subclass")
+
+    def transform(self, images) -> Tuple[np.ndarray, Optional[List[Any]]]:
+        """Returns the transformed images (stacked) and their metadata"""
+        shape, dtype = self.output_spec(images)
+        out = np.empty(shape, dtype=dtype)
+        n = len(images)
+        if self._executor is None or n < 2:
+            return out, self.transform_chunk(images, out)
+
+        chunk = -(-n // self.num_workers)
+        bounds = [(i, min(i + chunk, n)) for i in range(0, n, chunk)]
+        metas = list(
+            self._executor.map(
+                lambda b: self.transform_chunk(images[b[0] : b[1]], out[b[0] : b[1]]),
+                bounds,
+            )
+        )
+        if metas[0] is None:
+            return out, None
+        return out, [m for meta in metas for m in meta]
+
+    def process_batch(self, batch):
+        out, meta = self.transform(batch[self.key])
+        batch = {**batch, self.out_key: out}
+        if meta is not None:
+            batch[self.meta_key] = meta
+        return batch
+
+    def process(self, item):
+        out, meta = self.transform(self._single(item[self.key]))
+        item = {**item, self.out_key: out[0]}
+        if meta is not None:
+            item[self.meta_key] = meta[0]
+        return item
+
+    @staticmethod
+    def _single(image):
+        return image[np.newaxis] if isinstance(image, np.ndarray) else [image]
+
+
+class Resize(ImageBatchProcessor):
+    def __init__(
+        self,
+        size: Tuple[int, int],
+        letterbox: bool = False,
+        pad_value: int = 114,
+        interpolation: str = "linear",
+        *args,
+        **kwargs,
+    ):
+        """
+        Resizes the images (of any size) of a batch to `size`, stacked in one (N, H, W, C) array.
+
+        With `letterbox` the aspect ratio is kept and the image is centered and padded with
+        `pad_value`, the ``letterbox`` key of the batch gets the (scale, (pad_x, pad_y))
+        of every image to map predictions back to the original image.
+
+        Args:
+            size (Tuple[int, int]): output (width, height)
+            letterbox (bool, optional): keep aspect ratio and pad. Defaults to False.
+            pad_value (int, optional): value of the padding. Defaults to 114.
+            interpolation (str, optional): one of nearest, linear, area, cubic. Defaults to "linear".
+        """
+        super().__init__(*args, **kwargs)
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError(
+                f"interpolation {interpolation} should be one of {list(INTERPOLATIONS)}"
+            )
+        self.size = tuple(size)
+        self.letterbox = letterbox
+        self.pad_value = pad_value
+        self.interpolation = INTERPOLATIONS[interpolation]
+        if letterbox:
+            self.meta_key = "letterbox"
+
+    def output_spec(self, images):
+        w, h = self.size
+        return (len(images), h, w) + images[0].shape[2:], images[0].dtype
+
+    def transform_chunk(self, images, out):
+        w, h = self.size
+        meta = [] if self.letterbox else None
+        for image, dst in zip(images, out):
+            if not self.letterbox:
+                # resize straight into the output buffer
+                cv2.resize(image, (w, h), dst=dst, interpolation=self.interpolation)
+                continue
+            ih, iw = image.shape[:2]
+            scale = min(w / iw, h / ih)
+            nw, nh = max(int(round(iw * scale)), 1), max(int(round(ih * scale)), 1)
+            pad_x, pad_y = (w - nw) // 2, (h - nh) // 2
+            dst[...] = self.pad_value
+            region = dst[pad_y : pad_y + nh, pad_x : pad_x + nw]
+            region[...] = cv2.resize(image, (nw, nh), interpolation=self.interpolation).reshape(
+                region.shape
+            )
+            meta.append((scale, (pad_x, pad_y)))
+        return meta
+
+
+class CenterCrop(ImageBatchProcessor):
+    def __init__(self, size: Tuple[int, int], *args, **kwargs):
+        """
+        Crops the center (width, height) `size` of the images, images smaller than `size` raise.
+
+        Args:
+            size (Tuple[int, int]): output (width, height)
+        """
+        super().__init__(*args, **kwargs)
+        self.size = tuple(size)
+
+    def output_spec(self, images):
+        w, h = self.size
+        return (len(images), h, w) + images[0].shape[2:], images[0].dtype
+
+    def transform_chunk(self, images, out):
+        w, h = self.size
+        if isinstance(images, np.ndarray):
+            # same size, one sliced copy for the whole chunk
+            ih, iw = images.shape[1:3]
+            self._check(iw, ih)
+            y, x = (ih - h) // 2, (iw - w) // 2
+            out[...] = images[:, y : y + h, x : x + w]
+            return None
+        for image, dst in zip(images, out):
+            ih, iw = image.shape[:2]
+            self._check(iw, ih)
+            y, x = (ih - h) // 2, (iw - w) // 2
+            dst[...] = image[y : y + h, x : x + w]
+        return None
+
+    def _check(self, iw, ih):
+        w, h = self.size
+        if iw < w or ih < h:
+            raise ValueError(f"image of size {(iw, ih)} is smaller than the crop {self.size}")
+
+
+class ColorConvert(ImageBatchProcessor):
+    # luma weights of rgb channels (ITU-R BT.601, as OpenCV)
+    GRAY_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    CONVERSIONS = ["rgb2bgr", "bgr2rgb", "rgb2gray", "bgr2gray"]
+
+    def __init__(self, conversion: str = "rgb2bgr", *args, **kwargs):
+        """
+        Converts the color of (N, H, W, 3) images: channel reorder or gray, gray images are (N, H, W, 1).
+
+        Args:
+            conversion (str, optional): one of rgb2bgr, bgr2rgb, rgb2gray, bgr2gray. Defaults to "rgb2bgr".
+        """
+        super().__init__(*args, **kwargs)
+        if conversion not in self.CONVERSIONS:
+            raise ValueError(f"conversion {conversion} should be one of {self.CONVERSIONS}")
+        self.conversion = conversion
+
+    def output_spec(self, images):
+        shape, dtype = batch_spec(images)
+        if self.conversion.endswith("gray"):
+            return shape[:-1] + (1,), dtype
+        return shape, dtype
+
+    def transform_chunk(self, images, out):
+        images = stack_images(images)
+        if not self.conversion.endswith("gray"):
+            out[...] = images[..., ::-1]
+            return None
+        weights = self.GRAY_WEIGHTS
+        if self.conversion.startswith("bgr"):
+            weights = weights[::-1]
+        gray = images @ weights
+        if np.issubdtype(out.dtype, np.integer):
+            gray = np.rint(gray)
+        out[..., 0] = gray
+        return None
+
+
+class Normalize(ImageBatchProcessor):
+    def __init__(
+        self,
+        mean: Union[float, Sequence[float]] = 0.0,
+        std: Union[float, Sequence[float]] = 1.0,
+        scale: float = 1 / 255.0,
+        channel_axis: int = -1,
+        dtype=np.float32,
+        *args,
+        **kwargs,
+    ):
+        """
+        Computes ``(image * scale - mean) / std`` per channel into a float buffer, without temporaries.
+
+        Args:
+            mean (Union[float, Sequence[float]], optional): per channel mean (after scaling). Defaults to 0.
+            std (Union[float, Sequence[float]], optional): per channel std (after scaling). Defaults to 1.
+            scale (float, optional): multiplier applied first. Defaults to 1/255.
+            channel_axis (int, optional): axis of the channels of the stacked images, -1 for NHWC, 1 for NCHW.
+            dtype (optional): output dtype. Defaults to np.float32.
+        """
+        super().__init__(*args, **kwargs)
+        self.mean = np.asarray(mean, dtype=dtype)
+        self.inv_std = (1.0 / np.asarray(std, dtype=np.float64)).astype(dtype)
+        self.scale = scale
+        self.channel_axis = channel_axis
+        self.dtype = dtype
+
+    def output_spec(self, images):
+        return batch_spec(images)[0], self.dtype
+
+    def _per_channel(self, value, ndim):
+        if value.ndim == 0:
+            return value
+        shape = [1] * ndim
+        shape[self.channel_axis] = -1
+        return value.reshape(shape)
+
+    def transform_chunk(self, images, out):
+        images = stack_images(images)
+        np.multiply(images, self.scale, out=out, casting="unsafe")
+        out -= self._per_channel(self.mean, out.ndim)
+        out *= self._per_channel(self.inv_std, out.ndim)
+        return None
+
+
+class Cast(ImageBatchProcessor):
+    def __init__(self, dtype=np.float32, scale: Optional[float] = None, *args, **kwargs):
+        """
+        Casts the images to `dtype`, optionally multiplied by `scale`.
+
+        Args:
+            dtype (optional): output dtype. Defaults to np.float32.
+            scale (Optional[float], optional): multiplier. Defaults to None.
+        """
+        super().__init__(*args, **kwargs)
+        self.dtype = np.dtype(dtype)
+        self.scale = scale
+
+    def output_spec(self, images):
+        return batch_spec(images)[0], self.dtype
+
+    def transform_chunk(self, images, out):
+        images = stack_images(images)
+        if self.scale is None:
+            out[...] = images
+        else:
+            np.multiply(images, self.scale, out=out, casting="unsafe")
+        return None
+
+
+class Transpose(ImageBatchProcessor):
+    LAYOUTS = {("NHWC", "NCHW"): (0, 3, 1, 2), ("NCHW", "NHWC"): (0, 2, 3, 1)}
+
+    def __init__(self, source: str = "NHWC", target: str = "NCHW", *args, **kwargs):
+        """
+        Changes the layout of the stacked images into a contiguous array, e.g. HWC to NCHW for models.
+
+        Args:
+            source (str, optional): layout of the input. Defaults to "NHWC".
+            target (str, optional): layout of the output. Defaults to "NCHW".
+        """
+        super().__init__(*args, **kwargs)
+        if (source, target) not in self.LAYOUTS:
+            raise ValueError(f"layout change {source} -> {target} is not supported")
+        self.source = source
+        self.target = target
+        self.axes = self.LAYOUTS[(source, target)]
+
+    def output_spec(self, images):
+        shape, dtype = batch_spec(images)
+        return tuple(shape[a] for a in self.axes), dtype
+
+    def transform_chunk(self, images, out):
+        out[...] = stack_images(images).transpose(self.axes)
+        return None
@@ -0,0 +1,65 @@
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import loguru
+import numpy as np
+
+logger = loguru.logger
+
+# loaded models of this process keyed by (model path, device, loader name).
+# Models loaded before fork are inherited by the workers and shared copy-on-write.
+_models: Dict[Tuple[str, str, Optional[str]], Any] = {}
+_load_locks: Dict[Tuple[str, str, Optional[str]], threading.Lock] = {}
+_lock = threading.Lock()
+
+
+def get_model(
+    model_path: str, device: str, loader: Callable[[], Any], loader_name: Optional[str] = None
+) -> Any:
+    """
+    Returns the model loaded from `model_path` on `device`, calling `loader` only
+    the first time the (path, device, loader_name) triple is requested in this process.
+    Pass a `loader_name` identifying how `loader` loads the path (e.g. the qualified name
+    of the function), loaders of the same path with different names get their own model.
+    """
+    key = (model_path, device, loader_name)
+    with _lock:
+        if key in _models:
+            return _models[key]
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    # load outside the registry lock, concurrent requests of the same model wait here
+    with load_lock:
+        with _lock:
+            if key in _models:
+                return _models[key]
+        logger.info(f"Loading model {model_path} on {device}")
+        model = loader()
+        with _lock:
+            _models[key] = model
+    return model
+
+
+def release_model(model_path: str, device: str, loader_name: Optional[str] = None):
+    """Drops the model from the registry, it is freed once no processor holds it"""
+    key = (model_path, device, loader_name)
+    with _lock:
+        _models.pop(key, None)
+        _load_locks.pop(key, None)
+
+
+def clear_models():
+    with _lock:
+        _models.clear()
+        _load_locks.clear()
+
+
+def map_weights(path: str):
+    """
+    Maps numpy weight files (.npy / .npz) read-only instead of reading them in memory,
+    the pages are backed by the page cache and shared by all the processes mapping the file.
+    """
+    if path.endswith(".npz"):
+        # members of npz archives can not be mapped, prefer .npy for large weights
+        return dict(np.load(path))
+    return np.load(path, mmap_mode="r")
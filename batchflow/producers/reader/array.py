@@ -0,0 +1,115 @@
+from typing import List, Optional
+
+import numpy as np
+
+from batchflow.consumers.array import load_array_store
+from batchflow.core.node import ProducerNode
+from batchflow.decorators import HOT_PATH_SAMPLE, log_time
+
+
+class ArrayStoreReader(ProducerNode):
+    def __init__(
+        self,
+        path: str,
+        keys: Optional[List[str]] = None,
+        id_key: str = "filename",
+        max: int = -1,
+        *args,
+        **kwargs,
+    ):
+        """
+        Reads back the rows written by ArrayStoreConsumer. The arrays are memory mapped,
+        items and batches of consecutive rows are read-only views of the files (no copy).
+
+        Args:
+            path (str): directory of the array store
+            keys (Optional[List[str]], optional): keys of the arrays to read. Defaults to all the keys.
+            id_key (str, optional): key of the row ids in the items. Defaults to "filename".
+            max (int, optional): max rows to read (of this shard), pass -1 to read all the rows. Defaults to -1.
+            shard_index, num_shards, shard_strategy: read only a shard of the rows (sharded by id), see ProducerNode.
+                Batches of a shard are copies, unless their rows are contiguous in the store.
+        """
+        super().__init__(*args, **kwargs)
+        self.path = path
+        self.keys = keys
+        self.id_key = id_key
+        self.max = max
+        self._rows = None
+
+    def __len__(self):
+        """num of rows this reader produces, available after open()"""
+        return self._max_idx
+
+    def _load(self):
+        arrays, self.ids = load_array_store(self.path)
+        self.arrays = {key: arrays[key] for key in (self.keys or arrays)}
+        self.index = {id_: row for row, id_ in enumerate(self.ids)}
+
+    def _set_rows(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == len(self.ids) and np.array_equal(rows, np.arange(len(rows))):
+            # all the rows, in order: batches are plain slices
+            self._rows = None
+        else:
+            self._rows = rows
+        self._idx = 0
+        self._max_idx = len(rows) if self.max == -1 else min(len(rows), self.max)
+
+    def list_work_units(self):
+        self._load()
+        ids = self.shard(self.ids)
+        return ids if self.max == -1 else ids[: self.max]
+
+    def assign_work_units(self, units):
+        self._set_rows([self.index[unit] for unit in units])
+
+    def open(self):
+        self._load()
+        rows = self.shard(list(range(len(self.ids))), key=self.ids.__getitem__)
+        self._set_rows(rows)
+        if self.num_shards > 1:
+            self._logger.info(
+                f"Shard {self.shard_index}/{self.num_shards}: {len(rows)} of {len(self.ids)} rows"
+            )
+        self._logger.info(f"Producing {self._max_idx} rows of {list(self.arrays)}")
+
+    def close(self):
+        self._idx = 0
+        # drops the memory maps
+        self.arrays = {}
+
+    def position(self):
+        return {"index": self._idx}
+
+    def _take(self, start, stop):
+        """Rows [start, stop) of the shard, a view unless the shard rows are not contiguous"""
+        if self._rows is None:
+            rows = slice(start, stop)
+            ids = self.ids[start:stop]
+        else:
+            rows = self._rows[start:stop]
+            ids = [self.ids[row] for row in rows]
+            if len(rows) and rows[-1] - rows[0] == len(rows) - 1 and np.all(np.diff(rows) == 1):
+                rows = slice(int(rows[0]), int(rows[-1]) + 1)
+        return {key: array[rows] for key, array in self.arrays.items()}, ids
+
+    @log_time(sample=HOT_PATH_SAMPLE)
+    def next(self):
+        if self._idx >= self._max_idx:
+            raise StopIteration()
+        row = self._idx if self._rows is None else int(self._rows[self._idx])
+        self._idx += 1
+        item = {key: array[row] for key, array in self.arrays.items()}
+        item[self.id_key] = self.ids[row]
+        return item
+
+    @log_time(sample=HOT_PATH_SAMPLE)
+    def next_batch(self):
+        if self._idx >= self._max_idx:
+            raise StopIteration()
+        stop = min(self._idx + self.batch_size, self._max_idx)
+        batch, ids = self._take(self._idx, stop)
+        self._idx = stop
+        batch[self.id_key] = ids
+        batch["batch_size"] = len(ids)
+        return batch
@@ -7,12 +7,14 @@ import cv2
 import numpy as np
 
 from batchflow.core.node import ProducerNode
-from batchflow.decorators import log_time
+from batchflow.decorators import HOT_PATH_SAMPLE, log_time
 from loguru import logger
 
 def _read_image(img_path) -> np.array:
-    logger.debug(f"producing {img_path}")
+    logger.debug("producing {}", img_path)
     image = cv2.imread(img_path)
+    if image is None:
+        raise ValueError(f"can not read image {img_path}")
     # BGR to RGB
     image = image[..., ::-1]
     return img_path, image
@@ -32,7 +34,8 @@ class ImageFolderReader(ProducerNode):
         Args:
             path (Union[str,List[str]]): path to image folder
             formats (Optional[List[str]], optional): allowed image formats. Defaults to ["jpg", "jpeg", "png", "JPG", "JPEG", "bmp", "webp"].
-            max (int, optional): max images to read, pass -1 to read all the images. Defaults to -1.
+            max (int, optional): max images to read (of this shard), pass -1 to read all the images. Defaults to -1.
+            shard_index, num_shards, shard_strategy: read only a shard of the images, see ProducerNode.
         """
         super().__init__(*args, **kwargs)
         self.path = path
@@ -48,14 +51,30 @@ class ImageFolderReader(ProducerNode):
         return False
 
     def __len__(self):
-        return len(self.images)
+        """num of images this reader produces, available after open()"""
+        return self._max_idx
 
-    def open(self):
-        self.images = [
+    def _list_images(self):
+        # sorted, listing order differs across machines and shards must agree
+        return sorted(
             p
             for p in glob.glob(os.path.join(self.path, f"*"))
             if self._is_image_file(os.path.basename(p))
-        ]
+        )
+
+    def list_work_units(self):
+        images = self.shard(self._list_images(), key=os.path.basename)
+        return images if self.max == -1 else images[: self.max]
+
+    def assign_work_units(self, units):
+        self.images = list(units)
+        self.images_arr = np.array(self.images)
+        self._idx = 0
+        self._max_idx = len(self.images)
+
+    def open(self):
+        images = self._list_images()
+        self.images = self.shard(images, key=os.path.basename)
 
         self._idx = 0
         if len(self.images) == 0:
@@ -68,24 +87,56 @@ class ImageFolderReader(ProducerNode):
             len(self.images) if self.max == -1 else min(len(self.images), self.max)
         )
         self.images_arr = np.array(self.images)
+        if self.num_shards > 1:
+            self._logger.info(
+                f"Shard {self.shard_index}/{self.num_shards}: {len(self.images)} of {len(images)} images"
+            )
         self._logger.info(f"Producing {self._max_idx} images")
+        self._executor = ThreadPoolExecutor(
+            self.num_workers,
+            thread_name_prefix="decode",
+            initializer=self.worker_initializer,
+        )
 
     def close(self):
         self._idx = 0
+        if getattr(self, "_executor", None) is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    @property
+    def num_workers(self):
+        """decode threads, one per image of a batch unless set by the resource config"""
+        return self.worker_threads(self.batch_size)
+
+    def position(self):
+        position = {"index": self._idx}
+        if 0 < self._idx <= len(self.images):
+            # image read last, the failing one of `next`
+            position["filepath"] = self.images[self._idx - 1]
+        return position
 
     def _read_image(self) -> np.array:
         if self._idx < self._max_idx:
             img_path = self.images[self._idx]
-            self._logger.debug(f"producing {img_path}")
-            image = cv2.imread(img_path)
-            # BGR to RGB
-            image = image[..., ::-1]
+            # move forward first, an unreadable image must not be produced forever
             self._idx += 1
-            return img_path, image
+            return self._read_with_retries(img_path)
         else:
             raise StopIteration()
 
-    @log_time
+    def _read_with_retries(self, img_path):
+        if self.on_error is None:
+            return _read_image(img_path)
+        return self.on_error.call_with_retries(_read_image, img_path)
+
+    def _try_read_image(self, img_path):
+        try:
+            return img_path, self._read_with_retries(img_path)[1], None
+        except Exception as e:
+            return img_path, None, e
+
+    @log_time(sample=HOT_PATH_SAMPLE)
     def next(self) -> np.array:
         img_path, image = self._read_image()
         return {
@@ -94,19 +145,22 @@ class ImageFolderReader(ProducerNode):
             "filepath": img_path,
         }
 
-    @log_time
+    @log_time(sample=HOT_PATH_SAMPLE)
     def next_batch(self) -> any:
         image_batch = {"image": [], "filename": [], "filepath": [], "batch_size": 0}
         self._end_batch = False
 
         # for i in range(self.batch_size):
-        img_paths = self.images_arr[self._idx: self._idx+self.batch_size]
+        img_paths = self.images_arr[self._idx: min(self._idx+self.batch_size, self._max_idx)]
         self._idx += len(img_paths)
         if len(img_paths)!=0:
-            with ThreadPoolExecutor(self.batch_size) as e:
-                images = e.map(_read_image, img_paths)
-            
-            for img_path, image in images:
+            images = self._executor.map(self._try_read_image, img_paths)
+
+            for img_path, image, error in images:
+                if error is not None:
+                    # raises without error policy
+                    self.handle_item_error("next_batch", img_path, error)
+                    continue
                 image_batch["image"].append(image)
                 image_batch["filename"].append(os.path.basename(img_path))
                 image_batch["filepath"].append(img_path)
@@ -1,4 +1,35 @@
+import threading
+
 _storage_obj = dict()
+_storage_lock = threading.RLock()
+
+
+def _normalize_name(name):
+    if name == "google_drive":
+        return "gdrive"
+    return name
+
+
+def _freeze(value):
+    """Returns a hashable representation of a storage config value"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+def _storage_key(name, args, kwargs):
+    """
+    Registry key of a storage object. Instances are cached per backend and
+    configuration (bucket, credentials, pool size), so two buckets of the same
+    backend never share an object.
+    """
+    return (name, _freeze(args), _freeze(kwargs))
 
 
 def _init_storage(name, *args, **kwargs):
@@ -23,19 +54,35 @@ def _init_storage(name, *args, **kwargs):
 
 
 def get_storage(name, force=False, temp=False, *args, **kwargs):
-    global _storage_obj
-
-    if not force:
-        storage_obj = _storage_obj.get(name, None)
-        if storage_obj:
-            return storage_obj
-        else:
-            storage_obj = _init_storage(name, *args, **kwargs)
-            if not temp:
-                _storage_obj[name] = storage_obj
-    else:
+    """
+    Returns storage object of backend `name` configured with `args` and `kwargs`.
+
+    Storage objects are cached in a thread-safe registry keyed by backend and
+    configuration, the underlying api clients (and their HTTP connection pools)
+    are shared by all the storage objects using the same credentials.
+
+    Args:
+        name (str): backblaze / gdrive / s3
+        force (bool, optional): create a new storage object and replace the cached one. Defaults to False.
+        temp (bool, optional): do not cache the created storage object. Defaults to False.
+    """
+    name = _normalize_name(name)
+    key = _storage_key(name, args, kwargs)
+
+    with _storage_lock:
+        if not force:
+            storage_obj = _storage_obj.get(key, None)
+            if storage_obj:
+                return storage_obj
+
         storage_obj = _init_storage(name, *args, **kwargs)
         if not temp:
-            _storage_obj[name] = storage_obj
+            _storage_obj[key] = storage_obj
 
     return storage_obj
+
+
+def clear_storage():
+    """Drops all the cached storage objects"""
+    with _storage_lock:
+        _storage_obj.clear()
@@ -1,18 +1,21 @@
 import requests
 import os
+import threading
 from typing import List, Optional
 
 import loguru
 import tenacity
+from requests.adapters import HTTPAdapter
 
+from .. import constants as C
 from ..errors import StorageFileNotFound
-from .base import BaseStorage
+from .base import BaseStorage, StorageObject
 from concurrent.futures import ThreadPoolExecutor
 import io
 
 try:
     import b2sdk
-    from b2sdk.v2 import B2Api, InMemoryAccountInfo
+    from b2sdk.v2 import B2Api, B2HttpApiConfig, InMemoryAccountInfo
     from b2sdk import exception
 except:
     raise (
@@ -50,8 +53,28 @@ download_retry = tenacity.retry(
 )
 
 
+def _pooled_session_factory(max_pool_connections):
+    """Returns factory of requests sessions keeping `max_pool_connections` alive per host"""
+
+    def session_factory():
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=max_pool_connections, pool_maxsize=max_pool_connections
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    return session_factory
+
+
 class BackBlazeStorage(BaseStorage):
-    b2_api = None
+    # uploads of bytes are wrapped in `retry`, streams are not (they can not be rewound in general)
+    retries_uploads = True
+
+    # authorized b2api objects shared by storages, keyed by (key id, key, pool size, hash check)
+    _b2_apis = {}
+    _b2_api_lock = threading.Lock()
 
     def __init__(
         self,
@@ -59,6 +82,8 @@ class BackBlazeStorage(BaseStorage):
         application_key_id: Optional[str] = None,
         application_key: Optional[str] = None,
         force_new=False,
+        max_pool_connections: int = C.MAX_POOL_CONNECTIONS,
+        check_download_hash: bool = False,
     ):
         super().__init__()
         logger.info(f"Init backblazestorage")
@@ -68,6 +93,8 @@ class BackBlazeStorage(BaseStorage):
         self.application_key_id = application_key_id
         self.application_key = application_key
         self.force_new = force_new
+        self.max_pool_connections = max_pool_connections
+        self.check_download_hash = check_download_hash
 
     def authenticate(self):
         logger.info(f"Authenticating BackBlaze")
@@ -75,6 +102,8 @@ class BackBlazeStorage(BaseStorage):
             self.application_key_id,
             self.application_key,
             self.force_new,
+            self.max_pool_connections,
+            self.check_download_hash,
         )
 
         self.bucket = self._get_bucket()
@@ -84,39 +113,61 @@ class BackBlazeStorage(BaseStorage):
         return self.b2_api.get_bucket_by_name(self.bucket_name)
 
     @staticmethod
-    def get_b2_api(application_key_id, application_key, force_new):
-        if BackBlazeStorage.b2_api is None or force_new:
-            logger.info("Init singleton b2api object")
-            info = InMemoryAccountInfo()  # store credentials, tokens and cache in memor
-            b2_api = B2Api(info, check_download_hash=False)
-            if application_key_id:
-                b2_application_key_id = application_key_id
-                logger.info("Overring application key id")
-            else:
-                logger.info("using env application key id")
-                b2_application_key_id = os.getenv("B2_APPLICATION_KEY_ID", None)
-
-            if application_key:
-                logger.info("Overring application key")
-                b2_application_key = application_key
-            else:
-                logger.info("using env application key")
-                b2_application_key = os.getenv("B2_APPLICATION_KEY", None)
-
-            if b2_application_key is None:
-                raise Exception("set your B2_APPLICATION_KEY_ID in environment")
-            if b2_application_key is None:
-                raise Exception("set your B2_APPLICATION_KEY in environment")
-
-            b2_api.authorize_account(
-                "production", b2_application_key_id, b2_application_key
-            )
-            BackBlazeStorage.b2_api = b2_api
+    def get_b2_api(
+        application_key_id,
+        application_key,
+        force_new,
+        max_pool_connections=C.MAX_POOL_CONNECTIONS,
+        check_download_hash=False,
+    ):
+        if application_key_id:
+            b2_application_key_id = application_key_id
+            logger.info("Overring application key id")
+        else:
+            logger.info("using env application key id")
+            b2_application_key_id = os.getenv("B2_APPLICATION_KEY_ID", None)
 
-        if force_new:
-            return b2_api
+        if application_key:
+            logger.info("Overring application key")
+            b2_application_key = application_key
         else:
-            return BackBlazeStorage.b2_api
+            logger.info("using env application key")
+            b2_application_key = os.getenv("B2_APPLICATION_KEY", None)
+
+        if b2_application_key_id is None:
+            raise Exception("set your B2_APPLICATION_KEY_ID in environment")
+        if b2_application_key is None:
+            raise Exception("set your B2_APPLICATION_KEY in environment")
+
+        api_key = (
+            b2_application_key_id,
+            b2_application_key,
+            max_pool_connections,
+            check_download_hash,
+        )
+        with BackBlazeStorage._b2_api_lock:
+            b2_api = BackBlazeStorage._b2_apis.get(api_key, None)
+            if b2_api is None or force_new:
+                logger.info(
+                    f"Init b2api object with {max_pool_connections} pool connections"
+                )
+                info = InMemoryAccountInfo()  # store credentials, tokens and cache in memor
+                api_config = B2HttpApiConfig(
+                    http_session_factory=_pooled_session_factory(max_pool_connections)
+                )
+                b2_api = B2Api(
+                    info,
+                    api_config=api_config,
+                    max_upload_workers=max_pool_connections,
+                    check_download_hash=check_download_hash,
+                )
+                b2_api.authorize_account(
+                    "production", b2_application_key_id, b2_application_key
+                )
+                if not force_new:
+                    BackBlazeStorage._b2_apis[api_key] = b2_api
+
+        return b2_api
 
     @retry
     def upload(self, key, file):
@@ -132,6 +183,25 @@ class BackBlazeStorage(BaseStorage):
         logger.info(f"uploaded successful {file} to b2://{self.bucket_name}/{key}")
         return file_info
 
+    def upload_bytes(self, key, data):
+        if hasattr(data, "read"):
+            return self.upload_stream(key, data)
+        return self._upload_bytes(key, data)
+
+    @retry
+    def _upload_bytes(self, key, data):
+        logger.info(f"uploading {len(data)} bytes to b2://{self.bucket_name}/{key}")
+        self.bucket.upload_bytes(data, key)
+        logger.info(f"uploaded successful to b2://{self.bucket_name}/{key}")
+        return f"b2://{self.bucket_name}/{key}"
+
+    def upload_stream(self, key, stream):
+        # streams can not be rewound in general, so no retry here
+        logger.info(f"uploading stream to b2://{self.bucket_name}/{key}")
+        self.bucket.upload_unbound_stream(stream, key)
+        logger.info(f"uploaded successful to b2://{self.bucket_name}/{key}")
+        return f"b2://{self.bucket_name}/{key}"
+
     # download files from b2
     def download(
         self,
@@ -269,12 +339,30 @@ class BackBlazeStorage(BaseStorage):
             raise requests.ReadTimeout("Timeout")
         return file
 
+    def _iter_pages(self, prefix, page_size, recursive):
+        if self.bucket is None:
+            logger.error(f"Call authenticate() first")
+            raise Exception("Call authenticate first")
+
+        page = []
+        for f, _ in self.bucket.ls(prefix, recursive=recursive, fetch_count=page_size):
+            page.append(
+                StorageObject(
+                    key=f.file_name,
+                    size=f.size,
+                    etag=f.content_sha1,
+                    mtime=f.upload_timestamp / 1000,
+                )
+            )
+            if len(page) == page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
     def list_files(self, key):
-        list_files = []
-        for f, _ in self.bucket.ls(key):
-            list_files.append(f.file_name)
-        logger.debug(f"list files --")
-        logger.debug(list_files)
+        list_files = [f.key for f in self.iter_files(key, recursive=False)]
+        logger.debug(f"listed {len(list_files)} files from b2://{self.bucket_name}/{key}")
         return list_files
 
     @staticmethod
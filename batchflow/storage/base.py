@@ -1,15 +1,35 @@
 import os
+import queue
+import threading
 from abc import abstractmethod
 from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional
 
 import loguru
 
 from batchflow import constants as C
+from batchflow.core.utils import shard_of
 
 logger = loguru.logger
 
 
+class StorageObject(NamedTuple):
+    """Metadata of an object listed from storage"""
+
+    key: str
+    size: int
+    etag: Optional[str]
+    mtime: Optional[float]  # modification time, seconds since epoch
+
+
+_END_OF_LISTING = object()
+
+
 class BaseStorage:
+    # upload_bytes / upload_stream retry transient errors themselves, callers should not retry on top
+    retries_uploads = False
+    retries_streams = False
+
     def __init__(self):
         self.initalize_paths()
 
@@ -40,3 +60,144 @@ class BaseStorage:
     @abstractmethod
     def load(self):
         NotImplementedError("Implement this method in subclass")
+
+    def upload_bytes(self, key: str, data) -> str:
+        """
+        Uploads in-memory `data` to `key` without writing it to disk.
+
+        Args:
+            key (str): target key
+            data (Union[bytes, bytearray, memoryview, BinaryIO]): data to upload, file-like objects are passed to `upload_stream`
+
+        Returns:
+            str: uri of the uploaded object
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not support uploading bytes"
+        )
+
+    def upload_stream(self, key: str, stream) -> str:
+        """
+        Uploads data read from file-like object `stream` to `key`, large streams are uploaded in parts.
+
+        Returns:
+            str: uri of the uploaded object
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not support uploading streams"
+        )
+
+    def _iter_pages(
+        self, prefix: str, page_size: int, recursive: bool
+    ) -> Iterator[List[StorageObject]]:
+        """
+        Yields pages (lists of at most `page_size` StorageObject) of the objects under `prefix`.
+        Implement this method in subclass to support listing.
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not support listing files"
+        )
+
+    def iter_files(
+        self,
+        prefix: str = "",
+        page_size: int = 1000,
+        recursive: bool = True,
+        sub_prefixes: Optional[List[str]] = None,
+        workers: int = 1,
+        shard_index: int = 0,
+        num_shards: int = 1,
+    ) -> Iterator[StorageObject]:
+        """
+        Lazily lists the objects under `prefix` page by page, memory stays
+        constant no matter the number of objects.
+
+        Args:
+            prefix (str, optional): prefix (folder) to list. Defaults to "".
+            page_size (int, optional): objects fetched per listing request. Defaults to 1000.
+            recursive (bool, optional): list objects of nested prefixes too. Defaults to True.
+            sub_prefixes (Optional[List[str]], optional): list these prefixes (relative to `prefix`) in parallel instead. Defaults to None.
+            workers (int, optional): num of threads listing `sub_prefixes`. Defaults to 1.
+            shard_index (int, optional): yield only the objects of this shard. Defaults to 0.
+            num_shards (int, optional): num of shards, objects are assigned by a stable hash of the key. Defaults to 1.
+
+        Yields:
+            StorageObject: key, size, etag and mtime of every object. With
+            `sub_prefixes` objects of different sub-prefixes are interleaved.
+        """
+        if num_shards > 1:
+            for obj in self.iter_files(
+                prefix, page_size, recursive, sub_prefixes, workers
+            ):
+                if shard_of(obj.key, num_shards) == shard_index:
+                    yield obj
+            return
+
+        if not sub_prefixes:
+            for page in self._iter_pages(prefix, page_size, recursive):
+                yield from page
+            return
+
+        prefixes = [prefix + sub_prefix for sub_prefix in sub_prefixes]
+        if workers <= 1:
+            for _prefix in prefixes:
+                for page in self._iter_pages(_prefix, page_size, recursive):
+                    yield from page
+        else:
+            for page in self._iter_pages_parallel(
+                prefixes, page_size, recursive, workers
+            ):
+                yield from page
+
+    def _iter_pages_parallel(self, prefixes, page_size, recursive, workers):
+        # pages are handed over through a bounded queue, listing threads block
+        # while the caller is busy so at most ~2 pages per worker are held in memory
+        pages = queue.Queue(maxsize=2 * workers)
+        pending = queue.Queue()
+        for _prefix in prefixes:
+            pending.put(_prefix)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def list_prefixes():
+            try:
+                while not stop.is_set():
+                    try:
+                        _prefix = pending.get_nowait()
+                    except queue.Empty:
+                        break
+                    for page in self._iter_pages(_prefix, page_size, recursive):
+                        if not put(page):
+                            return
+            except Exception as e:
+                put(e)
+            finally:
+                put(_END_OF_LISTING)
+
+        threads = [
+            threading.Thread(target=list_prefixes, daemon=True)
+            for _ in range(min(workers, len(prefixes)))
+        ]
+        for thread in threads:
+            thread.start()
+
+        running = len(threads)
+        try:
+            while running:
+                page = pages.get()
+                if page is _END_OF_LISTING:
+                    running -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield page
+        finally:
+            stop.set()
@@ -1,3 +1,7 @@
+import hashlib
+import http.client
+import ssl
+import threading
 from concurrent.futures import ThreadPoolExecutor
 from http.client import UNAUTHORIZED
 from typing import Callable, Dict, List, Optional, Union
@@ -5,7 +9,7 @@ from typing import Callable, Dict, List, Optional, Union
 import loguru
 
 from ..errors import StorageFileNotFound
-from .base import BaseStorage
+from .base import BaseStorage, StorageObject
 
 # from itertools import izip
 
@@ -16,7 +20,7 @@ try:
     from google.auth.transport.requests import Request
     from google.oauth2.credentials import Credentials
     from googleapiclient.discovery import build
-    from googleapiclient.http import MediaIoBaseDownload
+    from googleapiclient.errors import HttpError
 
     SCOPES = ["https://www.googleapis.com/auth/drive.readonly"]
 
@@ -26,10 +30,40 @@ except:
     )
 import io
 import os
+from datetime import datetime, timezone
 
 import cv2 as cv
 import numpy as np
 
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+# bytes requested per range request while streaming private files to disk
+DOWNLOAD_CHUNK_SIZE = 32 * 1024 * 1024
+
+
+def _parse_rfc3339(timestamp: str) -> float:
+    return (
+        datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S.%fZ")
+        .replace(tzinfo=timezone.utc)
+        .timestamp()
+    )
+
+
+def _is_resumable_error(e) -> bool:
+    """network errors and throttling, not local errors such as a full disk"""
+    if isinstance(e, HttpError):
+        return e.resp.status == 429 or e.resp.status >= 500
+    return isinstance(
+        e, (ConnectionError, TimeoutError, ssl.SSLError, http.client.HTTPException)
+    )
+
+
+def _md5(path: str) -> str:
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
 
 class GDriveStorage(BaseStorage):
     def __init__(
@@ -37,6 +71,9 @@ class GDriveStorage(BaseStorage):
     ):
         super().__init__()
         self._service = None
+        self._credentials = None
+        # drive services are not thread safe, every thread builds and caches its own
+        self._thread_local = threading.local()
 
     def authenticate(
         self,
@@ -51,6 +88,7 @@ class GDriveStorage(BaseStorage):
             fail_callback=fail_callback,
         )
         self._service = self._get_service()
+        self._thread_local.service = self._service
 
     def download(
         self,
@@ -58,6 +96,7 @@ class GDriveStorage(BaseStorage):
         private=False,
         output: Union[str, List[str]] = None,
         workers=1,
+        chunk_size: int = DOWNLOAD_CHUNK_SIZE,
         *args,
         **kwargs,
     ) -> str:
@@ -71,7 +110,9 @@ class GDriveStorage(BaseStorage):
                 # download multiple ids
                 # check output num output same as ids
                 assert len(id) == len(output), "num of output should be same as num ids"
-                merge_arguments = [[_id, _output] for _id, _output in zip(id, output)]
+                merge_arguments = [
+                    [_id, _output, None, chunk_size] for _id, _output in zip(id, output)
+                ]
                 with ThreadPoolExecutor(max_workers=workers) as executor:
                     results = executor.map(
                         self._download_access_protected_file, *zip(*merge_arguments)
@@ -80,7 +121,7 @@ class GDriveStorage(BaseStorage):
             else:
                 logger.debug(f"Downloading access protected file")
                 local_file = self._download_access_protected_file(
-                    id=id, service=self._service, *args, **kwargs
+                    id=id, output=output, chunk_size=chunk_size, *args, **kwargs
                 )
 
                 return local_file
@@ -116,37 +157,118 @@ class GDriveStorage(BaseStorage):
             )
         return local_file
 
-    def _download_access_protected_file(self, id: str, output: str, service=None):
+    def _download_access_protected_file(
+        self,
+        id: str,
+        output: str,
+        service=None,
+        chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+        retries: int = 3,
+    ):
+        """
+        Streams file `id` to `output` chunk by chunk, memory used is bounded by `chunk_size`.
+        Data is written to `output`.part first, an interrupted download resumes from
+        the bytes already on disk (in this call or a later one) and the part file is
+        renamed to `output` once complete and checked against the md5 of the file.
+        A part file is only resumed if it belongs to the current version of the file
+        (same md5, recorded in `output`.part.md5) and is not larger than it.
+        """
         try:
             if service is None:
-                logger.debug("Getting new drive service")
-                service = self._get_service()
+                service = self._get_thread_service()
 
-                request = service.files().get_media(fileId=id)
-                fh = io.BytesIO()
-                downloader = MediaIoBaseDownload(fh, request)
-                done = False
-                while done is False:
-                    status, done = downloader.next_chunk()
-                fh.seek(0)
-                # file_bytes = np.asarray(bytearray(fh.read()), dtype=np.uint8)
-                with open(output, "wb") as f:
-                    f.write(fh.read())
-                logger.info(f"downloaded file to {output}")
-                return output
-                # img = cv.imdecode(file_bytes, cv.IMREAD_COLOR)
-            else:
-                logger.error(
-                    "Cannot download access protected files, Call authenticate first"
-                )
-                raise Exception(
-                    "Cannot download access protected files, Call authenticate first"
-                )
+            part_file = f"{output}.part"
+            meta = service.files().get(fileId=id, fields="size, md5Checksum").execute()
+            # google docs have neither: downloaded from scratch
+            size = int(meta["size"]) if "size" in meta else None
+            md5 = meta.get("md5Checksum", None)
+            self._prepare_part(part_file, size, md5)
+            attempt = 0
+            while True:
+                try:
+                    self._stream_to_file(service, id, part_file, chunk_size, size)
+                    break
+                except (HttpError, OSError, http.client.HTTPException) as e:
+                    attempt += 1
+                    if attempt > retries or not _is_resumable_error(e):
+                        raise e
+                    logger.warning(
+                        f"download of {id} interrupted ({e}), resuming attempt {attempt}/{retries}"
+                    )
+            if md5 is not None and _md5(part_file) != md5:
+                self._remove_part(part_file)
+                raise ValueError(f"md5 of the download of {id} does not match, dropped it")
+            self._remove_part(part_file, data=False)
+            os.replace(part_file, output)
+            logger.info(f"downloaded file to {output}")
+            return output
 
         except Exception as e:
             logger.error(e)
             return False
 
+    @staticmethod
+    def _remove_part(part_file, data=True):
+        paths = [f"{part_file}.md5"] + ([part_file] if data else [])
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _prepare_part(self, part_file, size, md5):
+        """Drops a part file that can not be resumed and records the md5 it is downloaded for"""
+        if os.path.exists(part_file):
+            recorded = None
+            if os.path.exists(f"{part_file}.md5"):
+                with open(f"{part_file}.md5") as f:
+                    recorded = f.read().strip()
+            if (
+                md5 is None
+                or size is None
+                or recorded != md5
+                or os.path.getsize(part_file) > size
+            ):
+                logger.info(f"dropping {part_file}, it is not a part of the current file")
+                self._remove_part(part_file)
+        if md5 is not None:
+            with open(f"{part_file}.md5", "w") as f:
+                f.write(md5)
+
+    def _stream_to_file(self, service, id, part_file, chunk_size, size=None):
+        with open(part_file, "ab") as f:
+            # resume after the bytes on disk (none requested once complete, a range past
+            # the end would fail), the part file was checked against the remote file by _prepare_part
+            start = f.tell()
+            if start:
+                logger.info(f"resuming download of {id} from byte {start}")
+            while size is None or start < size:
+                request = service.files().get_media(fileId=id)
+                request.headers["Range"] = f"bytes={start}-{start + chunk_size - 1}"
+                try:
+                    data = request.execute(num_retries=2)
+                except HttpError as e:
+                    if size is None and start > 0 and e.resp.status == 416:
+                        # size unknown, the previous chunk ended the file
+                        break
+                    raise
+                f.write(data)
+                start += len(data)
+                if len(data) < chunk_size and size is None:
+                    # size unknown, the last chunk is short
+                    break
+                if not data:
+                    raise http.client.IncompleteRead(b"", size - start)
+
+    def _get_thread_service(self):
+        service = getattr(self._thread_local, "service", None)
+        if service is None:
+            if self._credentials is None:
+                logger.error("Cannot access drive files, Call authenticate first")
+                raise Exception("Cannot access drive files, Call authenticate first")
+            logger.debug("Getting new drive service")
+            service = self._get_service()
+            self._thread_local.service = service
+        return service
+
     def _get_service(self):
         if self._credentials is None:
             raise UNAUTHORIZED("Authenticate storage first")
@@ -195,5 +317,43 @@ class GDriveStorage(BaseStorage):
                 return None
         return credentials
 
+    def _iter_pages(self, prefix, page_size, recursive):
+        """Lists files of folder id `prefix`, keys of the listed objects are file ids"""
+        service = self._get_thread_service()
+        folders = [prefix]
+        while folders:
+            folder_id = folders.pop()
+            page_token = None
+            while True:
+                response = (
+                    service.files()
+                    .list(
+                        q=f"'{folder_id}' in parents and trashed = false",
+                        pageSize=page_size,
+                        pageToken=page_token,
+                        fields="nextPageToken, files(id, mimeType, size, md5Checksum, modifiedTime)",
+                    )
+                    .execute()
+                )
+                page = []
+                for f in response.get("files", []):
+                    if f["mimeType"] == FOLDER_MIME_TYPE:
+                        if recursive:
+                            folders.append(f["id"])
+                        continue
+                    page.append(
+                        StorageObject(
+                            key=f["id"],
+                            size=int(f.get("size", 0)),
+                            etag=f.get("md5Checksum", None),
+                            mtime=_parse_rfc3339(f["modifiedTime"]),
+                        )
+                    )
+                if page:
+                    yield page
+                page_token = response.get("nextPageToken", None)
+                if page_token is None:
+                    break
+
     def upload(self):
         raise Exception("GDriveStorage does not support upload right now")
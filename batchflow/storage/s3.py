@@ -1,11 +1,14 @@
 import boto3
-from .base import BaseStorage
+from .base import BaseStorage, StorageObject
 import tenacity
 import requests
 from loguru import logger
+from .. import constants as C
 from ..errors import StorageFileNotFound
 import botocore
+from botocore.config import Config
 import io
+import threading
 
 
 retry = tenacity.retry(
@@ -26,13 +29,73 @@ download_retry = tenacity.retry(
     reraise=True,
 )
 
+# buffers larger than this are uploaded in parts by the managed transfer (its default
+# multipart threshold), put_object sends them in one request and is limited to 5GB
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+
+
+# s3 clients shared by storages, keyed by (credentials, region, endpoint, pool size).
+# boto3 clients are thread safe, sharing one keeps its connection pool warm.
+_s3_clients = {}
+_s3_clients_lock = threading.Lock()
+
+
+def get_s3_client(
+    aws_access_key_id=None,
+    aws_secret_access_key=None,
+    region_name=None,
+    endpoint_url=None,
+    max_pool_connections=C.MAX_POOL_CONNECTIONS,
+):
+    client_key = (
+        aws_access_key_id,
+        aws_secret_access_key,
+        region_name,
+        endpoint_url,
+        max_pool_connections,
+    )
+    with _s3_clients_lock:
+        s3_client = _s3_clients.get(client_key, None)
+        if s3_client is None:
+            logger.info(
+                f"Init s3 client with {max_pool_connections} pool connections"
+            )
+            # default boto3 session is not thread safe, create client from a new session
+            session = boto3.session.Session(
+                aws_access_key_id=aws_access_key_id,
+                aws_secret_access_key=aws_secret_access_key,
+                region_name=region_name,
+            )
+            s3_client = session.client(
+                "s3",
+                endpoint_url=endpoint_url,
+                config=Config(max_pool_connections=max_pool_connections),
+            )
+            _s3_clients[client_key] = s3_client
+    return s3_client
+
 
 class S3(BaseStorage):
+    # botocore retries transient errors of every request
+    retries_uploads = True
+    retries_streams = True
+
     def __init__(
         self,
         bucket_name: str,
+        aws_access_key_id: str = None,
+        aws_secret_access_key: str = None,
+        region_name: str = None,
+        endpoint_url: str = None,
+        max_pool_connections: int = C.MAX_POOL_CONNECTIONS,
     ):
-        self.s3_client = boto3.client("s3")
+        self.s3_client = get_s3_client(
+            aws_access_key_id=aws_access_key_id,
+            aws_secret_access_key=aws_secret_access_key,
+            region_name=region_name,
+            endpoint_url=endpoint_url,
+            max_pool_connections=max_pool_connections,
+        )
         self.bucket_name = bucket_name
 
     # @download_retry
@@ -94,3 +157,47 @@ class S3(BaseStorage):
         except Exception as e:
             logger.error(e)
             raise e
+
+    def upload_bytes(self, key, data):
+        if hasattr(data, "read"):
+            return self.upload_stream(key, data)
+        if isinstance(data, memoryview):
+            # botocore does not accept memoryview bodies
+            data = data.tobytes()
+        if len(data) > MULTIPART_THRESHOLD:
+            return self.upload_stream(key, io.BytesIO(data))
+        try:
+            self.s3_client.put_object(Body=data, Bucket=self.bucket_name, Key=key)
+            return f"s3://{self.bucket_name}/{key}"
+        except Exception as e:
+            logger.error(e)
+            raise e
+
+    def upload_stream(self, key, stream):
+        # managed transfer, switches to multipart upload for large streams
+        try:
+            self.s3_client.upload_fileobj(stream, self.bucket_name, key)
+            return f"s3://{self.bucket_name}/{key}"
+        except Exception as e:
+            logger.error(e)
+            raise e
+
+    def _iter_pages(self, prefix, page_size, recursive):
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        kwargs = {"Bucket": self.bucket_name, "Prefix": prefix}
+        if not recursive:
+            kwargs["Delimiter"] = "/"
+        for response in paginator.paginate(
+            PaginationConfig={"PageSize": page_size}, **kwargs
+        ):
+            page = [
+                StorageObject(
+                    key=obj["Key"],
+                    size=obj["Size"],
+                    etag=obj.get("ETag", "").strip('"') or None,
+                    mtime=obj["LastModified"].timestamp(),
+                )
+                for obj in response.get("Contents", [])
+            ]
+            if page:
+                yield page
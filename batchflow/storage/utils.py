@@ -0,0 +1,95 @@
+import hashlib
+import os
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+import loguru
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+logger = loguru.logger
+
+CHECKSUM_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Holds an exclusive inter-process lock on `path`.lock for the duration of the context,
+    other processes (and threads) locking the same path block until it is released.
+    """
+    lock_path = f"{path}.lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, "a") as f:
+        if fcntl is None:
+            logger.warning("fcntl not available, file lock is a no-op")
+            yield
+            return
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def file_checksum(path: str, algorithm: str = "sha256") -> str:
+    """Returns hex digest of the file, read in chunks"""
+    h = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHECKSUM_CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def fetch_file(
+    output: str,
+    download: Callable[[str], Optional[str]],
+    checksum: Optional[str] = None,
+    algorithm: str = "sha256",
+) -> str:
+    """
+    Downloads a file once per host, safe to call from many processes at once.
+
+    The first caller takes a lock on `output`, downloads to a temp file with
+    `download(temp_path)`, verifies the checksum and atomically renames it to `output`.
+    Other callers wait on the lock and reuse the file. A file present at `output`
+    is always complete since it only appears through the rename.
+
+    Args:
+        output (str): local path of the file
+        download (Callable[[str], Optional[str]]): downloads the file to the given path
+        checksum (Optional[str], optional): expected hex digest of the file. Defaults to None.
+        algorithm (str, optional): hashlib algorithm of the checksum. Defaults to "sha256".
+
+    Returns:
+        str: output
+    """
+    if os.path.isfile(output):
+        logger.info(f"Skip download, File {output} already exist")
+        return output
+
+    with file_lock(output):
+        # another process may have finished the download while we waited
+        if os.path.isfile(output):
+            logger.info(f"File {output} downloaded by another process")
+            return output
+
+        temp_path = f"{output}.{os.getpid()}.tmp"
+        try:
+            download(temp_path)
+            if not os.path.isfile(temp_path):
+                raise Exception(f"Download of {output} failed")
+            if checksum is not None:
+                digest = file_checksum(temp_path, algorithm)
+                if digest != checksum.lower():
+                    raise ValueError(
+                        f"Checksum mismatch for {output}: expected {checksum}, got {digest}"
+                    )
+            os.replace(temp_path, output)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return output
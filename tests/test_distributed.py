@@ -0,0 +1,87 @@
+import time
+
+from batchflow.core.distributed import (
+    LocalWorkQueue,
+    connect_work_queue,
+    serve_work_queue,
+    stop_work_queue,
+)
+
+
+def test_ack():
+    queue = LocalWorkQueue()
+    queue.put(["a", "b", "c"])
+    queue.close_input()
+    lease_id, units = queue.lease("worker", 2)
+    assert units == ["a", "b"]
+    assert not queue.done()
+    queue.ack(lease_id)
+    lease_id, units = queue.lease("worker", 2)
+    assert units == ["c"]
+    queue.ack(lease_id)
+    assert queue.lease("worker", 2) is None
+    assert queue.done()
+    assert queue.stats() == {"pending": 0, "leased": 0, "acked": 3, "failed": []}
+
+
+def test_nack_requeues_first():
+    queue = LocalWorkQueue()
+    queue.put(["a", "b", "c"])
+    lease_id, units = queue.lease("worker", 2)
+    queue.nack(lease_id)
+    assert queue.lease("worker", 3)[1] == ["a", "b", "c"]
+
+
+def test_lease_expiry():
+    queue = LocalWorkQueue(lease_timeout=0.05)
+    queue.put(["a"])
+    queue.close_input()
+    lease_id, _ = queue.lease("worker", 1)
+    assert queue.lease("other", 1) is None
+    time.sleep(0.1)
+    assert not queue.done()
+    other_id, units = queue.lease("other", 1)
+    assert units == ["a"]
+    # the late ack of the expired lease is ignored
+    queue.ack(lease_id)
+    assert queue.stats()["acked"] == 0
+    queue.ack(other_id)
+    assert queue.done()
+
+
+def test_extend_keeps_the_lease():
+    queue = LocalWorkQueue(lease_timeout=0.1)
+    queue.put(["a"])
+    lease_id, _ = queue.lease("worker", 1)
+    for _ in range(3):
+        time.sleep(0.05)
+        queue.extend(lease_id)
+    assert queue.lease("other", 1) is None
+
+
+def test_max_attempts():
+    queue = LocalWorkQueue(max_attempts=2)
+    queue.put(["a"])
+    queue.close_input()
+    for _ in range(2):
+        lease_id, units = queue.lease("worker", 1)
+        queue.nack(lease_id)
+    assert queue.lease("worker", 1) is None
+    assert queue.done()
+    assert queue.stats()["failed"] == ["a"]
+
+
+def test_serve_and_connect_in_process():
+    queues = [LocalWorkQueue(), LocalWorkQueue()]
+    servers = [serve_work_queue(q, address=("127.0.0.1", 0)) for q in queues]
+    try:
+        for i, (queue, server) in enumerate(zip(queues, servers)):
+            queue.put([f"unit-{i}"])
+            remote = connect_work_queue(server.address)
+            lease_id, units = remote.lease("worker", 1)
+            assert units == [f"unit-{i}"]
+            remote.ack(lease_id)
+            assert queue.stats()["acked"] == 1
+    finally:
+        for server in servers:
+            stop_work_queue(server)
@@ -0,0 +1,168 @@
+import threading
+import time
+
+import pytest
+
+from batchflow.constants import ORDERED, UNORDERED
+from batchflow.core.flow import FLOW_STATUS, Flow
+from batchflow.core.node import ConsumerNode, ProcessorNode, ProducerNode
+from batchflow.core.queue import SpillQueue
+from batchflow.processors.core import ModelProcessor
+
+
+class BytesProducer(ProducerNode):
+    def __init__(self, batches=10, items=4, item_bytes=1000, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = batches
+        self.items = items
+        self.item_bytes = item_bytes
+
+    def open(self):
+        self._idx = 0
+
+    def next_batch(self):
+        if self._idx >= self.batches:
+            raise StopIteration()
+        self._idx += 1
+        return {
+            "data": [bytes(self.item_bytes)] * self.items,
+            "index": [self._idx] * self.items,
+            "batch_size": self.items,
+        }
+
+
+class Identity(ProcessorNode):
+    def process_batch(self, batch):
+        return batch
+
+
+class Collector(ConsumerNode):
+    def open(self):
+        self.batches = []
+
+    def consume_batch(self, batch):
+        self.batches.append(batch["index"][0])
+
+
+class SlowCollector(Collector):
+    def consume_batch(self, batch):
+        time.sleep(0.005)
+        super().consume_batch(batch)
+
+
+class CountingSpillQueue(SpillQueue):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.spills = 0
+
+    def _spill(self, item):
+        self.spills += 1
+        super()._spill(item)
+
+
+class FailingProcessor(ProcessorNode):
+    def process_batch(self, batch):
+        if batch["index"][0] == 1:
+            raise RuntimeError("processor failed")
+        return batch
+
+
+class FailingModel(ModelProcessor):
+    def preprocess(self, batch):
+        return batch
+
+    def predict(self, batch):
+        if batch["index"][0] == 1:
+            raise RuntimeError("predict failed")
+        return batch
+
+    def postprocess(self, batch):
+        return batch
+
+
+class FailingCollector(Collector):
+    def consume_batch(self, batch):
+        raise RuntimeError("consumer failed")
+
+
+def run_flow(flow, timeout=30, status=FLOW_STATUS.COMPLETE):
+    thread = threading.Thread(target=flow.run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "flow did not end"
+    assert flow.status[0] == status, flow.status[1]
+
+
+@pytest.mark.parametrize("order", [ORDERED, UNORDERED])
+@pytest.mark.parametrize("memory_budget", [4000, 8000, 100000])
+def test_workers_with_memory_budget(order, memory_budget):
+    producer = BytesProducer()
+    consumer = Collector()(Identity()(producer))
+    flow = Flow(
+        [producer],
+        [consumer],
+        batch_size=4,
+        workers=4,
+        memory_budget=memory_budget,
+        order=order,
+    )
+    run_flow(flow)
+    if order == ORDERED:
+        assert consumer.batches == list(range(1, 11))
+    else:
+        assert sorted(consumer.batches) == list(range(1, 11))
+
+
+def test_failing_queued_consumer_with_memory_budget():
+    producer = BytesProducer(batches=20)
+    consumer = FailingCollector()(Identity()(producer))
+    flow = Flow(
+        [producer],
+        [consumer],
+        batch_size=4,
+        memory_budget=8000,
+        consumer_queue=SpillQueue(10**8),
+    )
+    run_flow(flow, status=FLOW_STATUS.FAIL)
+
+
+@pytest.mark.parametrize("order", [ORDERED, UNORDERED])
+@pytest.mark.parametrize("memory_budget", [None, 8000])
+def test_failing_worker(order, memory_budget):
+    producer = BytesProducer(batches=20)
+    consumer = Collector()(FailingProcessor()(producer))
+    flow = Flow(
+        [producer],
+        [consumer],
+        batch_size=4,
+        workers=3,
+        memory_budget=memory_budget,
+        order=order,
+    )
+    run_flow(flow, timeout=10, status=FLOW_STATUS.FAIL)
+
+
+def test_failing_pipelined_processor_with_memory_budget():
+    producer = BytesProducer(batches=20)
+    consumer = Collector()(FailingModel(pipeline_depth=2)(producer))
+    flow = Flow([producer], [consumer], batch_size=4, memory_budget=8000)
+    run_flow(flow, timeout=10, status=FLOW_STATUS.FAIL)
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_lagging_queued_consumer_spills(workers, tmp_path):
+    producer = BytesProducer(batches=30)
+    consumer = SlowCollector()(Identity()(producer))
+    queue = CountingSpillQueue(max_bytes=4000, spill_dir=str(tmp_path))
+    flow = Flow(
+        [producer],
+        [consumer],
+        batch_size=4,
+        workers=workers,
+        memory_budget=8000,
+        consumer_queue=queue,
+    )
+    run_flow(flow)
+    assert queue.spills > 0
+    assert consumer.batches == list(range(1, 31))
+    assert flow.memory_high_water_mark <= 12000
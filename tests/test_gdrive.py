@@ -0,0 +1,102 @@
+import hashlib
+import re
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+from batchflow.storage.gdrive import GDriveStorage
+
+DATA = bytes(range(256)) * 40
+
+
+class MediaRequest:
+    def __init__(self, drive):
+        self.drive = drive
+        self.headers = {}
+
+    def execute(self, num_retries=0):
+        start, end = map(int, re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers["Range"]).groups())
+        self.drive.ranges.append((start, end))
+        if self.drive.fail_after is not None and len(self.drive.ranges) > self.drive.fail_after:
+            self.drive.fail_after = None
+            raise ConnectionError("connection reset")
+        return DATA[start : end + 1]
+
+
+class MetaRequest:
+    def execute(self):
+        return {"size": str(len(DATA)), "md5Checksum": hashlib.md5(DATA).hexdigest()}
+
+
+class Files:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def get(self, fileId, fields):
+        return MetaRequest()
+
+    def get_media(self, fileId):
+        return MediaRequest(self.drive)
+
+
+class Drive:
+    """Mocked drive service serving DATA, fails the request after the first `fail_after`"""
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.ranges = []
+
+    def files(self):
+        return Files(self)
+
+
+def download(drive, output):
+    return GDriveStorage()._download_access_protected_file(
+        "id", str(output), service=drive, chunk_size=1000
+    )
+
+
+def test_download_in_ranges(tmp_path):
+    drive = Drive()
+    assert download(drive, tmp_path / "out") == str(tmp_path / "out")
+    assert (tmp_path / "out").read_bytes() == DATA
+    assert [start for start, _ in drive.ranges] == list(range(0, len(DATA), 1000))
+
+
+def test_resume_after_interruption(tmp_path):
+    drive = Drive(fail_after=3)
+    assert download(drive, tmp_path / "out") == str(tmp_path / "out")
+    assert (tmp_path / "out").read_bytes() == DATA
+    # the failed range is requested again, the bytes before are not
+    starts = [start for start, _ in drive.ranges]
+    assert starts == [0, 1000, 2000, 3000] + list(range(3000, len(DATA), 1000))
+
+
+def test_resume_part_file(tmp_path):
+    part = tmp_path / "out.part"
+    part.write_bytes(DATA[:2500])
+    (tmp_path / "out.part.md5").write_text(hashlib.md5(DATA).hexdigest())
+    drive = Drive()
+    assert download(drive, tmp_path / "out") == str(tmp_path / "out")
+    assert (tmp_path / "out").read_bytes() == DATA
+    assert drive.ranges[0] == (2500, 3499)
+    assert not part.exists()
+
+
+def test_part_file_of_another_version_is_dropped(tmp_path):
+    (tmp_path / "out.part").write_bytes(b"x" * 2500)
+    (tmp_path / "out.part.md5").write_text("another version")
+    drive = Drive()
+    download(drive, tmp_path / "out")
+    assert (tmp_path / "out").read_bytes() == DATA
+    assert drive.ranges[0][0] == 0
+
+
+def test_complete_part_file_is_not_downloaded(tmp_path):
+    (tmp_path / "out.part").write_bytes(DATA)
+    (tmp_path / "out.part.md5").write_text(hashlib.md5(DATA).hexdigest())
+    drive = Drive()
+    download(drive, tmp_path / "out")
+    assert (tmp_path / "out").read_bytes() == DATA
+    assert drive.ranges == []
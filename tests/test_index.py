@@ -0,0 +1,65 @@
+import threading
+
+import numpy as np
+import pytest
+
+from batchflow.benchmarks.scenarios import LocalStorage
+from batchflow.consumers.index import L2, EmbeddingIndex, EmbeddingIndexConsumer
+from batchflow.consumers.index_sync import IndexSync
+
+
+@pytest.mark.parametrize("ids", [[1, 2, 3, 4], ["a", "b", "c", "d"]])
+def test_ids_keep_their_type(ids, tmp_path):
+    vectors = np.eye(4, dtype=np.float32)
+    index = EmbeddingIndex(4, metric=L2)
+    index.add(ids, vectors)
+    index.save(str(tmp_path / "index"))
+    saved = EmbeddingIndex.load(str(tmp_path / "index"))
+
+    sync = IndexSync(
+        LocalStorage(str(tmp_path / "storage")),
+        "index",
+        dim=4,
+        metric=L2,
+        cache_dir=str(tmp_path / "cache"),
+        compact_every=2,
+        background=False,
+    )
+    sync.append(ids[:2], vectors[:2])
+    segmented = sync.reader()
+    sync.append(ids[2:], vectors[2:])
+    compacted = sync.reader()
+    assert len(sync.manifest["deltas"]) == 0
+
+    for searched in (index, saved, segmented, compacted):
+        found, _ = searched.search(vectors[:2], k=1)
+        assert found[:, 0].tolist() == ids[:2]
+        assert type(found[0, 0]) is type(ids[0])
+
+
+def test_search_while_adding():
+    consumer = EmbeddingIndexConsumer(4, metric=L2)
+    consumer.open()
+    rng = np.random.default_rng(0)
+    stop = threading.Event()
+    errors = []
+
+    def search():
+        while not stop.is_set():
+            try:
+                ids, _ = consumer.search(np.ones(4, dtype=np.float32), k=3)
+                assert len(ids[0]) == 3
+            except Exception as e:
+                errors.append(e)
+                return
+
+    thread = threading.Thread(target=search)
+    thread.start()
+    for i in range(200):
+        consumer.consume_batch(
+            {"embedding": rng.random((8, 4), dtype=np.float32), "filename": list(range(i * 8, i * 8 + 8))}
+        )
+    stop.set()
+    thread.join()
+    assert errors == []
+    assert len(consumer.index) == 1600
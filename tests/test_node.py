@@ -0,0 +1,31 @@
+import pytest
+
+from batchflow.core.node import ProducerNode
+
+
+class KeysProducer(ProducerNode):
+    def __init__(self, keys, max=-1, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.keys = keys
+        self.max = max
+
+
+def test_producer_positional_args_go_to_node():
+    producer = KeysProducer(["a"], 1, "reader")
+    assert producer._name == "reader"
+    assert (producer.shard_index, producer.num_shards) == (0, 1)
+
+
+@pytest.mark.parametrize("strategy", ["hash", "range"])
+def test_producer_shards_split_the_keys(strategy):
+    keys = [f"key-{i}" for i in range(100)]
+    shards = [
+        KeysProducer(keys, shard_index=i, num_shards=3, shard_strategy=strategy).shard(keys)
+        for i in range(3)
+    ]
+    assert sorted(k for shard in shards for k in shard) == sorted(keys)
+
+
+def test_producer_shard_index_out_of_range():
+    with pytest.raises(ValueError):
+        KeysProducer([], shard_index=2, num_shards=2)
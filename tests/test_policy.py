@@ -0,0 +1,143 @@
+import pytest
+
+from batchflow.core.flow import FLOW_STATUS, Flow
+from batchflow.core.node import ConsumerNode, ProcessorNode, ProducerNode
+from batchflow.core.policy import DEAD_LETTER, RAISE, SKIP, ErrorPolicy
+
+from test_flow import run_flow
+
+
+class ValuesProducer(ProducerNode):
+    """Produces the values 0..n-1, fails on `bad` (after moving past it)"""
+
+    def __init__(self, n=20, bad=None, **kwargs):
+        super().__init__(**kwargs)
+        self.n = n
+        self.bad = bad
+
+    def open(self):
+        self._idx = 0
+
+    def position(self):
+        return {"index": self._idx}
+
+    def next(self):
+        if self._idx >= self.n:
+            raise StopIteration()
+        self._idx += 1
+        if self._idx - 1 == self.bad:
+            raise ValueError("bad input")
+        return {"value": self._idx - 1}
+
+    def next_batch(self):
+        if self._idx >= self.n:
+            raise StopIteration()
+        values = list(range(self._idx, min(self._idx + self.batch_size, self.n)))
+        self._idx += len(values)
+        return {"value": values, "batch_size": len(values)}
+
+
+class FailOnMultiples(ProcessorNode):
+    """Fails on the batches holding a multiple of 7, the first `flaky` calls fail too"""
+
+    def __init__(self, flaky=0, **kwargs):
+        super().__init__(**kwargs)
+        self.flaky = flaky
+
+    def process(self, item):
+        self.process_batch({"value": [item["value"]], "batch_size": 1})
+        return item
+
+    def process_batch(self, batch):
+        if self.flaky > 0:
+            self.flaky -= 1
+            raise ConnectionError("flaky")
+        if any(v % 7 == 0 for v in batch["value"]):
+            raise ValueError("multiple of 7")
+        return batch
+
+
+class Values(ConsumerNode):
+    def open(self):
+        self.values = []
+
+    def consume(self, item):
+        self.values.append(item["value"])
+
+    def consume_batch(self, batch):
+        self.values.extend(batch["value"])
+
+
+class Records(ConsumerNode):
+    def open(self):
+        self.records = []
+
+    def consume(self, record):
+        self.records.append(record)
+
+
+def multiples_flow(policy, batch_size=4, flaky=0):
+    producer = ValuesProducer()
+    processor = FailOnMultiples(flaky=flaky, on_error=policy)
+    consumer = Values()(processor(producer))
+    return Flow([producer], [consumer], batch_size=batch_size), consumer
+
+
+def test_retry():
+    flow, consumer = multiples_flow(ErrorPolicy(action=SKIP, retries=2, backoff=0), flaky=2)
+    run_flow(flow)
+    # the flaky calls are retried, only the multiples of 7 are dropped
+    assert consumer.values == [v for v in range(20) if v % 7]
+    assert list(flow.failures.values()) == [3]
+
+
+def test_retries_exhausted():
+    flow, _ = multiples_flow(ErrorPolicy(action=RAISE, retries=1, backoff=0), flaky=2)
+    run_flow(flow, status=FLOW_STATUS.FAIL)
+    assert "flaky" in flow.status[1]
+
+
+@pytest.mark.parametrize("batch_size", [1, 4])
+def test_skip_isolates_the_failing_items(batch_size):
+    flow, consumer = multiples_flow(ErrorPolicy(action=SKIP), batch_size=batch_size)
+    run_flow(flow)
+    assert consumer.values == [v for v in range(20) if v % 7]
+    assert list(flow.failures.values()) == [3]
+
+
+def test_skip_whole_batches():
+    flow, consumer = multiples_flow(ErrorPolicy(action=SKIP, isolate_items=False))
+    run_flow(flow)
+    # batches [0-3], [4-7], [12-15] dropped
+    assert consumer.values == [8, 9, 10, 11, 16, 17, 18, 19]
+
+
+def test_dead_letter():
+    dead_letter = Records()
+    dead_letter.open()
+    flow, consumer = multiples_flow(ErrorPolicy(action=DEAD_LETTER, dead_letter=dead_letter))
+    run_flow(flow)
+    assert consumer.values == [v for v in range(20) if v % 7]
+    assert [r["item"]["value"] for r in dead_letter.records] == [[0], [7], [14]]
+    assert all(r["method"] == "process_batch" for r in dead_letter.records)
+
+
+def test_dead_letter_of_producer_records_its_position():
+    dead_letter = Records()
+    dead_letter.open()
+    policy = ErrorPolicy(action=DEAD_LETTER, dead_letter=dead_letter)
+    producer = ValuesProducer(n=6, bad=3, on_error=policy)
+    consumer = Values()(producer)
+    flow = Flow([producer], [consumer])
+    run_flow(flow)
+    assert consumer.values == [0, 1, 2, 4, 5]
+    assert len(dead_letter.records) == 1
+    record = dead_letter.records[0]
+    assert record["method"] == "next"
+    assert record["item"] == {"batch_id": 3, "index": 4}
+
+
+def test_raise():
+    flow, consumer = multiples_flow(ErrorPolicy(action=RAISE))
+    run_flow(flow, status=FLOW_STATUS.FAIL)
+    assert consumer.values == []
@@ -0,0 +1,50 @@
+import threading
+
+from batchflow.core.queue import ReorderBuffer, SpillQueue
+
+
+def test_spill_queue_keeps_the_order(tmp_path):
+    queue = SpillQueue(max_bytes=3000, spill_dir=str(tmp_path), segment_bytes=5000)
+    items = [{"data": bytes(1000), "index": i} for i in range(50)]
+    for item in items[:20]:
+        queue.put(item)
+    assert queue.spilled_batches > 0
+    got = [queue.get()["index"] for _ in range(10)]
+    for item in items[20:]:
+        queue.put(item)
+    got += [queue.get()["index"] for _ in range(40)]
+    assert got == list(range(50))
+    assert len(queue) == 0
+    queue.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spill_queue_lagging_consumer(tmp_path):
+    queue = SpillQueue(max_bytes=2000, spill_dir=str(tmp_path), segment_bytes=4000)
+    got = []
+
+    def consume():
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            got.append(item["index"])
+            threading.Event().wait(0.001)
+
+    thread = threading.Thread(target=consume)
+    thread.start()
+    for i in range(200):
+        queue.put({"data": bytes(500), "index": i})
+    queue.put(None)
+    thread.join(10)
+    assert got == list(range(200))
+    assert queue.spilled_batches > 0
+    queue.close()
+
+
+def test_reorder_buffer():
+    buffer = ReorderBuffer()
+    assert buffer.push(1, "b") == []
+    assert buffer.push(0, "a") == ["a", "b"]
+    assert buffer.push(2, "c") == ["c"]
+    assert len(buffer) == 0
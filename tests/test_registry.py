@@ -0,0 +1,30 @@
+from batchflow.processors.core import ModelProcessor
+from batchflow.processors.registry import clear_models
+
+
+class UpperModel(ModelProcessor):
+    def load_model(self, model_path):
+        return model_path.upper()
+
+
+class LowerModel(ModelProcessor):
+    def load_model(self, model_path):
+        return model_path.lower()
+
+
+class OtherUpperModel(UpperModel):
+    pass
+
+
+def test_models_are_keyed_by_loader():
+    clear_models()
+    try:
+        upper, lower, other = UpperModel("Model"), LowerModel("Model"), OtherUpperModel("Model")
+        for processor in (upper, lower, other):
+            processor.open()
+        assert upper.model == "MODEL"
+        assert lower.model == "model"
+        # same load_model implementation, the model is shared
+        assert other.model is upper.model
+    finally:
+        clear_models()
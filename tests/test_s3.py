@@ -0,0 +1,32 @@
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("boto3")
+
+from batchflow.storage import s3
+from batchflow.storage.s3 import S3
+
+
+def storage():
+    # no client is created, the calls are recorded by a mock
+    storage = S3.__new__(S3)
+    storage.bucket_name = "bucket"
+    storage.s3_client = mock.Mock()
+    return storage
+
+
+def test_small_buffers_are_put():
+    stub = storage()
+    assert stub.upload_bytes("key", memoryview(b"data")) == "s3://bucket/key"
+    stub.s3_client.put_object.assert_called_once_with(Body=b"data", Bucket="bucket", Key="key")
+    stub.s3_client.upload_fileobj.assert_not_called()
+
+
+def test_large_buffers_are_uploaded_in_parts(monkeypatch):
+    monkeypatch.setattr(s3, "MULTIPART_THRESHOLD", 4)
+    stub = storage()
+    assert stub.upload_bytes("key", b"large data") == "s3://bucket/key"
+    stub.s3_client.put_object.assert_not_called()
+    stream, bucket, key = stub.s3_client.upload_fileobj.call_args[0]
+    assert (stream.read(), bucket, key) == (b"large data", "bucket", "key")
@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+from batchflow.core.flow import Flow
+from batchflow.core.node import ProcessorNode
+from batchflow.core.service import FlowService
+
+from test_flow import BytesProducer, Collector
+
+
+class BlockedProcessor(ProcessorNode):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def process_batch(self, batch):
+        self.started.set()
+        assert self.release.wait(10)
+        return batch
+
+
+def test_blocked_submitter_does_not_block_others():
+    producer = BytesProducer()
+    processor = BlockedProcessor()
+    consumer = Collector()(processor(producer))
+    service = FlowService(Flow([producer], [consumer]), max_batch_size=1, max_pending=1)
+    service.start()
+    first = service.submit({"index": 0})
+    assert processor.started.wait(10)
+    # fills the queue, the next submit blocks
+    second = service.submit({"index": 1})
+    blocked = {}
+    submitter = threading.Thread(target=lambda: blocked.update(future=service.submit({"index": 2})))
+    submitter.start()
+    submitter.join(0.1)
+    assert submitter.is_alive()
+
+    stopper = threading.Thread(target=service.stop)
+    stopper.start()
+    stopper.join(0.1)
+    # neither the stop nor the blocked submitter hold the service lock
+    with pytest.raises(RuntimeError):
+        service.submit({"index": 3})
+
+    processor.release.set()
+    stopper.join(10)
+    submitter.join(10)
+    assert not stopper.is_alive() and not submitter.is_alive()
+    assert first.result(10)["index"] == 0
+    assert second.result(10)["index"] == 1
+    third = blocked["future"]
+    # put before or after the stop: served, or failed by the stop
+    if third.exception(10) is not None:
+        assert isinstance(third.exception(), RuntimeError)
+    else:
+        assert third.result()["index"] == 2
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+from loguru import logger
+
+from batchflow.core.flow import FLOW_STATUS, Flow
+from batchflow.core.node import ProcessorNode
+from batchflow.core.timeout import TimeoutPolicy
+from batchflow.errors import NodeTimeout
+
+from test_flow import BytesProducer, Collector, Identity, run_flow
+
+
+class SleepingProcessor(ProcessorNode):
+    """Sleeps `slow` seconds on the first call of batch `slow_index`, `fast` seconds otherwise"""
+
+    def __init__(self, slow=0.5, fast=0.0, slow_index=3, **kwargs):
+        super().__init__(**kwargs)
+        self.slow = slow
+        self.fast = fast
+        self.slow_index = slow_index
+        self.calls = []
+        self.threads = set()
+        self._lock = threading.Lock()
+
+    def process_batch(self, batch):
+        index = batch["index"][0]
+        with self._lock:
+            first = index not in self.calls
+            self.calls.append(index)
+            self.threads.add(threading.get_ident())
+        time.sleep(self.slow if first and index == self.slow_index else self.fast)
+        return batch
+
+
+class SlowProducer(BytesProducer):
+    def next_batch(self):
+        if self._idx == 3:
+            time.sleep(0.3)
+        return super().next_batch()
+
+
+@pytest.fixture
+def warnings():
+    messages = []
+    handler = logger.add(messages.append, level="WARNING", format="{message}")
+    yield messages
+    logger.remove(handler)
+
+
+def test_soft_timeout_warns(warnings):
+    node = SleepingProcessor(slow=0.3)
+    policy = TimeoutPolicy(soft=0.05)
+    assert policy.run(node, "process_batch", node.process_batch, {"index": [3]}) == {"index": [3]}
+    assert any("is running for" in m for m in warnings)
+    policy.close()
+
+
+def test_hard_timeout_raises():
+    node = SleepingProcessor(slow=1)
+    policy = TimeoutPolicy(hard=0.1)
+    start = time.monotonic()
+    with pytest.raises(NodeTimeout):
+        policy.run(node, "process_batch", node.process_batch, {"index": [3]})
+    assert time.monotonic() - start < 0.5
+    policy.close()
+
+
+def test_hard_timeout_fails_the_flow():
+    producer = BytesProducer()
+    processor = SleepingProcessor(slow=2, timeout=TimeoutPolicy(hard=0.1))
+    consumer = Collector()(processor(producer))
+    flow = Flow([producer], [consumer], batch_size=4)
+    run_flow(flow, timeout=10, status=FLOW_STATUS.FAIL)
+    assert "NodeTimeout" in flow.status[1]
+
+
+def test_call_threads_are_reused():
+    node = SleepingProcessor()
+    policy = TimeoutPolicy(hard=1)
+    for i in range(10):
+        policy.run(node, "process_batch", node.process_batch, {"index": [i]})
+    assert len(node.threads) == 1
+    assert threading.get_ident() not in node.threads
+    policy.close()
+
+
+def test_speculated_result_used_once():
+    policy = TimeoutPolicy(speculative=True, percentile=50, min_samples=2)
+    producer = BytesProducer(batches=10)
+    processor = SleepingProcessor(slow=0.5, fast=0.01, slow_index=5, timeout=policy)
+    consumer = Collector()(processor(producer))
+    flow = Flow([producer], [consumer], batch_size=4)
+    run_flow(flow)
+    assert policy.speculated >= 1
+    assert policy.speculation_wins >= 1
+    # the straggler ran twice, its batch is consumed once
+    assert processor.calls.count(5) == 2
+    assert consumer.batches == list(range(1, 11))
+
+
+def test_producers_are_never_speculated():
+    policy = TimeoutPolicy(speculative=True, percentile=50, min_samples=2)
+    producer = SlowProducer(batches=10, timeout=policy)
+    consumer = Collector()(Identity()(producer))
+    flow = Flow([producer], [consumer], batch_size=4)
+    run_flow(flow)
+    assert policy.speculated == 0
+    assert consumer.batches == list(range(1, 11))
+
+
+def test_consumers_are_never_speculated():
+    class SlowCollector(Collector):
+        def consume_batch(self, batch):
+            if batch["index"][0] == 5:
+                time.sleep(0.3)
+            super().consume_batch(batch)
+
+    policy = TimeoutPolicy(speculative=True, percentile=50, min_samples=2)
+    producer = BytesProducer(batches=10)
+    consumer = SlowCollector(timeout=policy)(Identity()(producer))
+    flow = Flow([producer], [consumer], batch_size=4)
+    run_flow(flow)
+    assert policy.speculated == 0
+    assert consumer.batches == list(range(1, 11))
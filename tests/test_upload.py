@@ -0,0 +1,73 @@
+import io
+
+import pytest
+import tenacity
+
+from batchflow.consumers.storage import UploadConsumer
+from batchflow.storage.base import BaseStorage
+
+
+class FlakyStorage(BaseStorage):
+    """Fails the first upload of every key, keeps the uploaded data"""
+
+    def __init__(self, retries_uploads=False, retries_streams=False):
+        self.retries_uploads = retries_uploads
+        self.retries_streams = retries_streams
+        self.attempts = {}
+        self.objects = {}
+
+    def download(self):
+        pass
+
+    def upload(self):
+        pass
+
+    def load(self):
+        pass
+
+    def upload_bytes(self, key, data):
+        if hasattr(data, "read"):
+            return self.upload_stream(key, data)
+        return self._store(key, bytes(data))
+
+    def upload_stream(self, key, stream):
+        return self._store(key, stream.read())
+
+    def _store(self, key, data):
+        self.attempts[key] = self.attempts.get(key, 0) + 1
+        if self.attempts[key] == 1:
+            raise ConnectionError("flaky")
+        self.objects[key] = data
+        return f"mem://{key}"
+
+
+def upload(storage, encoder):
+    consumer = UploadConsumer(storage, data_key="data", encoder=encoder, workers=2)
+    consumer.open()
+    consumer._retrying = consumer._retrying.copy(wait=tenacity.wait_none())
+    consumer.consume_batch({"data": [b"a", b"b"], "filename": ["a", "b"], "batch_size": 2})
+    consumer.close()
+    return consumer
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_upload_retried_by_the_consumer(stream):
+    storage = FlakyStorage()
+    encoder = (lambda data, key: io.BytesIO(data)) if stream else (lambda data, key: data)
+    consumer = upload(storage, encoder)
+    assert consumer.failed_keys == []
+    assert storage.objects == {"a": b"a", "b": b"b"}
+
+
+def test_streams_retried_when_the_storage_only_retries_bytes():
+    storage = FlakyStorage(retries_uploads=True)
+    consumer = upload(storage, lambda data, key: io.BytesIO(data))
+    assert consumer.failed_keys == []
+    assert storage.objects == {"a": b"a", "b": b"b"}
+
+
+def test_upload_not_retried_on_top_of_the_storage():
+    storage = FlakyStorage(retries_uploads=True)
+    consumer = upload(storage, lambda data, key: data)
+    assert sorted(consumer.failed_keys) == ["a", "b"]
+    assert storage.attempts == {"a": 1, "b": 1}